@@ -0,0 +1,100 @@
+"""
+Compares request/response compression in HttpxProvider against a local
+stand-in server.
+
+Each encoding sends a mutation-sized input object and gets a MB-sized
+response back. Reports bytes on the wire and the CPU time per request. The
+stand-in server runs in the same process, so the CPU time covers compressing
+and decompressing on both ends. (The loopback network hides the latency
+benefits; the bytes are what would cross a real network.)
+
+    python benchmarks/compression.py [--rounds N] [--items N]
+"""
+import argparse
+import time
+
+import graphql
+
+from gqlmod.helpers.httpx import ENCODERS, HttpxProvider
+from gqlmod_starwars.server import StandInServer
+
+SCHEMA = graphql.build_schema("""
+input ItemInput {
+  id: ID!
+  name: String!
+  tags: [String!]!
+  description: String
+}
+
+type Item {
+  id: ID!
+  name: String!
+  tags: [String!]!
+  description: String
+}
+
+type Query {
+  echo(items: [ItemInput!]!, repeat: Int!): [Item!]!
+}
+""")
+
+QUERY = 'query($items:[ItemInput!]!,$repeat:Int!){echo(items:$items,repeat:$repeat){id name tags description}}'
+
+
+def resolve_echo(root, info, items, repeat):
+    return items * repeat
+
+
+SCHEMA.query_type.fields['echo'].resolve = resolve_echo
+
+
+class BenchProvider(HttpxProvider):
+    def __init__(self, endpoint, request_encoding, accept_encoding):
+        self.endpoint = endpoint
+        self.request_encoding = request_encoding
+        self.accept_encoding = accept_encoding
+
+
+def make_items(count):
+    return [
+        {
+            'id': str(i),
+            'name': f"Item number {i}",
+            'tags': ['alpha', 'beta', f"tag-{i % 17}"],
+            'description': f"A moderately long description of item {i}, which repeats a lot. " * 3,
+        }
+        for i in range(count)
+    ]
+
+
+def run(server, encoding, items, rounds):
+    prov = BenchProvider(server.url, encoding, encoding or 'identity')
+    variables = {'items': items, 'repeat': 10}
+    prov.query_sync(QUERY, variables)  # Warm up the connection
+    server.reset_stats()
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for _ in range(rounds):
+        prov.query_sync(QUERY, variables)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    return server.bytes_received / rounds, server.bytes_sent / rounds, cpu / rounds, wall / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--items', type=int, default=500)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    print(f"{'encoding':>10} {'request B':>12} {'response B':>12} {'CPU ms':>9} {'wall ms':>9}")
+    with StandInServer(SCHEMA) as server:
+        for encoding in [None, *sorted(ENCODERS)]:
+            req, resp, cpu, wall = run(server, encoding, items, args.rounds)
+            print(f"{encoding or 'identity':>10} {req:12.0f} {resp:12.0f} {cpu * 1000:9.2f} {wall * 1000:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
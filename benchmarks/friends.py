@@ -0,0 +1,49 @@
+"""
+Compares one-at-a-time and batched friend loading in the Star Wars provider,
+on a synthetic data set.
+
+Each query fetches a character, its friends, and their friends. Reports the
+fetches (simulated backend round trips) and the time per query.
+
+    python benchmarks/friends.py [--size N] [--degree N] [--latency SECONDS] [--rounds N]
+"""
+import argparse
+import random
+import time
+
+from gqlmod_starwars import StarWarsProvider
+from gqlmod_starwars.synthetic import generate
+
+QUERY = 'query($id:String!){human(id:$id){name friends{name friends{id name appearsIn}}}}'
+
+
+def run(dataset, batch, ids):
+    prov = StarWarsProvider(dataset=dataset, batch=batch)
+    dataset.fetches = 0
+    wall = time.perf_counter()
+    for id in ids:
+        result = prov.query_sync(QUERY, {'id': id})
+        assert result.errors is None, result.errors
+    wall = time.perf_counter() - wall
+    return dataset.fetches / len(ids), wall / len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--degree', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    dataset = generate(args.size, args.degree, seed=0, latency=args.latency)
+    humans = [c.id for c in dataset.characters.values() if c.type == 'Human']
+    ids = random.Random(0).choices(humans, k=args.rounds)
+    print(f"{'loading':>10} {'fetches':>9} {'ms/query':>9}")
+    for batch in (False, True):
+        fetches, wall = run(dataset, batch, ids)
+        print(f"{'batched' if batch else 'one by one':>10} {fetches:9.1f} {wall * 1000:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
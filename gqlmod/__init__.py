@@ -1,15 +1,28 @@
 import sys
 
-from .importer import GqlLoader
-from .providers import with_provider
+from . import profiling, settings
+from .deadlines import deadline
+from .importer import GqlLoader, find_providers
+from .providers import prefetch_schemas, with_provider
 
-__all__ = 'with_provider', 'enable_gql_import'
+__all__ = 'with_provider', 'enable_gql_import', 'deadline'
 
 
-def enable_gql_import():
+def enable_gql_import(prefetch=(), prefetch_packages=(), **options):
     """
     Enables importing ``.gql`` files.
 
+    The schemas of the providers in prefetch, and of the providers used by the
+    ``.gql`` files in the packages in prefetch_packages, are fetched in the
+    background while the application imports.
+
+    Any other keyword arguments are applied to :py:mod:`gqlmod.settings`.
+
     Importing :py:mod:`gqlmod.enable` calls this.
     """
+    settings.update(**options)
+    profiling.profile_from_env()
     sys.meta_path.append(GqlLoader())
+    prefetch_schemas(prefetch)
+    if prefetch_packages:
+        prefetch_schemas(find_providers(prefetch_packages))
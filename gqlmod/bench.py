@@ -0,0 +1,165 @@
+"""
+Load generation for a single operation, used by ``gqlmod bench``.
+"""
+import asyncio
+import collections
+import contextvars
+import math
+import threading
+import time
+
+__all__ = 'BenchResult', 'run_sync', 'run_async', 'percentile'
+
+
+def percentile(values, pct):
+    """
+    Gets the nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Pacer:
+    """
+    Hands out start times for requests, spaced for a target rate (or
+    immediately, without one), until the deadline or request count is reached.
+    """
+    def __init__(self, duration=None, rate=None, requests=None):
+        self.start = time.perf_counter()
+        self.deadline = None if duration is None else self.start + duration
+        self.interval = None if rate is None else 1 / rate
+        self.requests = requests
+        self.issued = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        """
+        Gets the time the next request should start at, or None when done.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            if self.requests is not None and self.issued >= self.requests:
+                return
+            if self.interval is None:
+                at = now
+            else:
+                at = self.start + self.issued * self.interval
+            if self.deadline is not None and max(at, now) >= self.deadline:
+                return
+            self.issued += 1
+            return at
+
+
+class BenchResult:
+    """
+    The latencies and errors of a run.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[type(error).__name__] += 1
+
+    def summary(self):
+        """
+        Summarizes the run as a JSON-able dict. Latencies are in milliseconds,
+        and only count successful requests.
+        """
+        latencies = sorted(self.latencies)
+        count = len(latencies) + sum(self.errors.values())
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'requests': count,
+            'errors': sum(self.errors.values()),
+            'error_types': dict(self.errors),
+            'elapsed': round(self.elapsed, 3),
+            'throughput': round(count / self.elapsed, 2) if self.elapsed else None,
+            'latency_ms': {
+                'min': ms(latencies[0] if latencies else None),
+                'mean': ms(sum(latencies) / len(latencies) if latencies else None),
+                'p50': ms(percentile(latencies, 50)),
+                'p90': ms(percentile(latencies, 90)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1] if latencies else None),
+            },
+        }
+
+
+def sync_worker(func, variables, pacer, result):
+    while True:
+        at = pacer.next()
+        if at is None:
+            return
+        delay = at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # Timed from when it should have started, so falling behind the target
+        # rate shows up as latency
+        start = at
+        try:
+            func(**variables)
+        except Exception as exc:
+            result.record(None, exc)
+        else:
+            result.record(time.perf_counter() - start)
+
+
+async def async_worker(func, variables, pacer, result):
+    while True:
+        at = pacer.next()
+        if at is None:
+            return
+        delay = at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        start = at
+        try:
+            await func(**variables)
+        except Exception as exc:
+            result.record(None, exc)
+        else:
+            result.record(time.perf_counter() - start)
+
+
+def run_sync(func, variables, *, concurrency=1, duration=None, rate=None, requests=None):
+    """
+    Calls a synchronous operation function from ``concurrency`` threads.
+    """
+    result = BenchResult()
+    pacer = Pacer(duration, rate, requests)
+    # Threads don't inherit the context, which holds the providers
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(sync_worker, func, variables, pacer, result), daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - pacer.start
+    return result
+
+
+async def run_async(func, variables, *, concurrency=1, duration=None, rate=None, requests=None):
+    """
+    Calls an asynchronous operation function from ``concurrency`` tasks.
+    """
+    result = BenchResult()
+    pacer = Pacer(duration, rate, requests)
+    await asyncio.gather(*(async_worker(func, variables, pacer, result) for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - pacer.start
+    return result
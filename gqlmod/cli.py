@@ -1,29 +1,308 @@
+import asyncio
+import collections
+import importlib
+import json
+import os
 import pathlib
+import sys
+import time
 
 import click
+import graphql
 
-from .importer import scan_file
+from . import profiling, pruning
+from .bench import run_async, run_sync
+from .cost import check_cost, estimate_cost
+from .impact import ImpactIndex, check_affected, load_schema, schema_changes
+from .importer import load_and_validate
+from .watch import DocumentSet, watch as run_watch
 
 
 @click.group()
 def cli():
     """
-    gqlmod static analysis utilities.
+    gqlmod static analysis and benchmarking utilities.
     """
     pass
 
 
+def parse_list_sizes(ctx, param, value):
+    rv = {}
+    for item in value:
+        coord, _, size = item.partition('=')
+        try:
+            rv[coord] = int(size)
+        except ValueError:
+            raise click.BadParameter(f"{item!r} is not in the form Type.field=N")
+    return rv
+
+
+def echo_error(fname, err):
+    for loc in err.locations:
+        click.echo(f"{fname}:{loc.line}:{loc.column}:{err.message}")
+
+
 @cli.command()
 @click.argument('files', nargs=-1, type=click.File())
 @click.option('--search/--no-search', help="Search for .gql")
-def check(files, search):
+@click.option('--watch', is_flag=True, help="Keep running, checking files again when they change")
+@click.option('--schema-diff', nargs=2, type=click.Path(exists=True, dir_okay=False), metavar='OLD NEW',
+              help="Only check the operations affected by a schema change (given as SDL files)")
+@click.option('--index', 'index_path', default='.gqlmod-index.json', show_default=True, type=click.Path(dir_okay=False),
+              help="Where to keep the index used by --schema-diff")
+@click.option('--cost', is_flag=True, help="Report the estimated cost of each operation")
+@click.option('--max-depth', type=int, help="Fail operations nested deeper than this")
+@click.option('--max-nodes', type=int, help="Fail operations estimated to return more values than this")
+@click.option('--max-cost', type=int, help="Fail operations estimated to cost more than this")
+@click.option('--list-size', type=int, help="Assumed length of lists with no first/last argument")
+@click.option('--list-size-for', 'list_sizes', multiple=True, callback=parse_list_sizes,
+              metavar='Type.field=N', help="Assumed length of a specific list field")
+def check(files, search, watch, schema_diff, index_path, cost, max_depth, max_nodes, max_cost, list_size, list_sizes):
     """
     Checks the schema of .gql files.
     """
+    limits = {'max_depth': max_depth, 'max_nodes': max_nodes, 'max_cost': max_cost}
+    options = {'list_size': list_size, 'list_sizes': list_sizes}
+    if watch:
+        docs = DocumentSet([fobj.name for fobj in files], root='.' if search else None)
+        watch_files(docs, cost, limits, options)
+        return
     if search:
         files = map(open, pathlib.Path().glob("**/*.gql"))
-    for fobj in files:
-        fname = fobj.name
-        for err in scan_file(fname, fobj):
-            for loc in err.locations:
-                click.echo(f"{fname}:{loc.line}:{loc.column}:{err.message}")
+
+    if schema_diff:
+        failed = check_schema_diff([fobj.name for fobj in files], *schema_diff, index_path)
+    else:
+        failed = False
+        for fobj in files:
+            failed |= check_file(fobj.name, fobj, cost, limits, options)
+
+    if failed:
+        sys.exit(1)
+
+
+def check_file(fname, fobj, cost, limits, options):
+    """
+    Checks a file, reporting any problems. Returns True if there were any.
+    """
+    analyze = cost or any(limit is not None for limit in limits.values())
+    failed = False
+    _, gast, schema, errors = load_and_validate(fname, fobj)
+    for err in errors:
+        failed = True
+        echo_error(fname, err)
+    if analyze and not errors:
+        failed |= check_file_cost(fname, gast, schema, cost, limits, **options)
+    return failed
+
+
+def check_watched(fname, cost, limits, options):
+    """
+    Checks a file, reporting anything that goes wrong instead of raising.
+    """
+    try:
+        return check_file(fname, None, cost, limits, options)
+    except graphql.GraphQLError as err:
+        echo_error(fname, err)
+    except Exception as exc:
+        click.echo(f"{fname}:1:1:{exc}")
+    return True
+
+
+def watch_files(docs, cost, limits, options):
+    """
+    Checks files as they change, until interrupted.
+    """
+    cwd = os.getcwd()
+    failing = set()
+
+    def recheck(paths):
+        start = time.perf_counter()
+        for path in paths:
+            if check_watched(os.path.relpath(path, cwd), cost, limits, options):
+                failing.add(path)
+            else:
+                failing.discard(path)
+        failing.intersection_update(docs.stats)
+        click.echo(
+            f"Checked {len(paths)} file(s) in {(time.perf_counter() - start) * 1000:.0f}ms, "
+            f"{len(failing)} failing",
+            err=True,
+        )
+
+    try:
+        run_watch(docs, recheck)
+    except KeyboardInterrupt:
+        pass
+
+
+def check_schema_diff(fnames, old_path, new_path, index_path):
+    """
+    Checks the operations affected by a schema change, reporting them and any
+    problems. Returns True if there were any problems.
+    """
+    old, new = load_schema(old_path), load_schema(new_path)
+    index = ImpactIndex(index_path)
+    reindexed, failures = index.update(fnames, old)
+    index.save()
+    for err in failures:
+        echo_error(os.path.relpath(err.source.name), err)
+
+    affected = collections.defaultdict(list)
+    changes = schema_changes(old, new)
+    for path, operation, used in index.affected(changes):
+        fname = os.path.relpath(path)
+        click.echo(f"{fname}:{operation['line']}:{operation['column']}:{operation['name']}: uses {', '.join(used)}")
+        affected[path].append(operation)
+
+    failed = bool(failures)
+    for path, operations in affected.items():
+        for _, errors in check_affected(path, operations, new):
+            for err in errors:
+                failed = True
+                echo_error(os.path.relpath(err.source.name if err.source else path), err)
+    click.echo(
+        f"{len(changes)} schema change(s), {sum(map(len, affected.values()))} affected operation(s), "
+        f"{reindexed} file(s) indexed",
+        err=True,
+    )
+    return failed
+
+
+def check_file_cost(fname, gast, schema, report, limits, **options):
+    """
+    Estimates the cost of the operations in a file, reporting them and any
+    exceeded limits. Returns True if any limit was exceeded.
+    """
+    failed = False
+    for defin in gast.definitions:
+        if defin.kind != 'operation_definition':
+            continue
+        opcost = estimate_cost(defin, schema, **options)
+        if report:
+            tok = defin.loc.start_token
+            click.echo(
+                f"{fname}:{tok.line}:{tok.column}:{opcost.name}: "
+                f"depth={opcost.depth} nodes={opcost.nodes} cost={opcost.cost}"
+            )
+        for err in check_cost(defin, opcost, **limits):
+            failed = True
+            echo_error(fname, err)
+    return failed
+
+
+def parse_json(ctx, param, value):
+    try:
+        rv = json.loads(value)
+    except ValueError as exc:
+        raise click.BadParameter(f"Not valid JSON: {exc}")
+    if not isinstance(rv, dict):
+        raise click.BadParameter("Must be a JSON object")
+    return rv
+
+
+def enable_import():
+    import gqlmod
+    gqlmod.enable_gql_import()
+    # Console scripts don't have the current directory on the path
+    if os.getcwd() not in sys.path and '' not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+
+def load_operation(module, operation, is_async):
+    """
+    Imports the sync or async function for an operation.
+    """
+    enable_import()
+    try:
+        mod = importlib.import_module(f"{module}_{'async' if is_async else 'sync'}")
+    except ImportError as exc:
+        raise click.BadParameter(str(exc), param_hint='MODULE')
+    try:
+        return getattr(mod, operation)
+    except AttributeError:
+        raise click.BadParameter(f"{module} has no operation {operation!r}", param_hint='OPERATION')
+
+
+def echo_summary(operation, summary):
+    latency = summary['latency_ms']
+    click.echo(
+        f"{operation}: {summary['requests']} requests in {summary['elapsed']:.2f}s, "
+        f"{summary['throughput'] or 0:.2f} req/s, {summary['errors']} errors"
+    )
+    for name, count in summary['error_types'].items():
+        click.echo(f"  {name}: {count}")
+    if latency['p50'] is not None:
+        click.echo("latency (ms): " + "  ".join(f"{name} {value:.2f}" for name, value in latency.items()))
+
+
+@cli.command()
+@click.argument('module')
+@click.argument('operation')
+@click.option('--variables', default='{}', callback=parse_json, help="The operation's variables, as a JSON object")
+@click.option('--async', 'is_async', is_flag=True, help="Use the async functions (default is sync)")
+@click.option('--concurrency', '-c', default=1, show_default=True, help="Number of concurrent callers")
+@click.option('--rate', type=float, help="Target requests per second (default is as fast as possible)")
+@click.option('--duration', '-d', default=10.0, show_default=True, help="Seconds to run for")
+@click.option('--requests', '-n', type=int, help="Stop after this many requests")
+@click.option('--warmup', default=0.0, show_default=True, help="Seconds to run for before measuring")
+@click.option('--json', 'as_json', is_flag=True, help="Output JSON")
+def bench(module, operation, variables, is_async, concurrency, rate, duration, requests, warmup, as_json):
+    """
+    Drives an operation from an importable .gql module (like my.queries) with
+    load, reporting throughput and latency.
+    """
+    func = load_operation(module, operation, is_async)
+
+    def run(**options):
+        if is_async:
+            return asyncio.run(run_async(func, variables, concurrency=concurrency, rate=rate, **options))
+        else:
+            return run_sync(func, variables, concurrency=concurrency, rate=rate, **options)
+
+    if warmup:
+        run(duration=warmup)
+    summary = run(duration=duration, requests=requests).summary()
+
+    if as_json:
+        click.echo(json.dumps({'operation': operation, 'async': is_async, 'concurrency': concurrency, **summary}))
+    else:
+        echo_summary(operation, summary)
+
+
+@cli.command('profile-imports')
+@click.argument('modules', nargs=-1, required=True)
+@click.option('--format', 'fmt', type=click.Choice(['table', 'json', 'trace']), default='table', show_default=True,
+              help="Output a table, JSON, or a Chrome trace")
+@click.option('--memory', is_flag=True, help="Also report the memory held by schemas (on stderr)")
+def profile_imports(modules, fmt, memory):
+    """
+    Imports modules (like my.queries, or an application that imports them),
+    reporting how long each phase of each .gql import took.
+    """
+    enable_import()
+    with profiling.profile() as prof:
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except ImportError as exc:
+                raise click.BadParameter(str(exc), param_hint='MODULES')
+
+    if fmt == 'table':
+        click.echo(prof.table())
+    elif fmt == 'json':
+        click.echo(json.dumps(prof.summary()))
+    else:
+        click.echo(json.dumps(prof.chrome_trace()))
+    if memory:
+        report_memory()
+
+
+def report_memory():
+    for row in pruning.memory_report():
+        full = 'released' if row['full'] is None else f"{row['full'] / 1024:.0f} KiB"
+        click.echo(
+            f"{row['provider']}: full schema {full}, pruned {row['pruned'] / 1024:.0f} KiB"
+            f" in {row['modules']} modules",
+            err=True,
+        )
@@ -0,0 +1,290 @@
+"""
+Converting custom scalars and enums to and from Python values.
+
+Codecs are registered per provider, before the modules using them are
+imported::
+
+    from gqlmod import codecs
+
+    codecs.register_scalar('github', 'DateTime', codecs.DATETIME)
+    codecs.register_enum('github', 'IssueState', IssueState)
+
+When a module is imported, each operation gets a decoder that only visits the
+parts of the result holding registered scalars or enums, and an encoder for its
+variables. Operations that don't need either are left alone.
+
+Enum values are looked up by member name. With the ``decode_enums`` setting,
+enums without a registered class get one generated from the schema.
+"""
+import collections
+import datetime
+import decimal
+import enum
+import threading
+import typing
+
+import graphql
+
+from . import settings
+from .helpers.types import get_definition, get_type
+from .providers import exec_query_async, exec_query_sync
+
+__all__ = (
+    'ScalarCodec', 'register_scalar', 'register_enum', 'get_enum', 'build_codec', 'CodecOperation',
+    'DATETIME', 'DATE', 'DECIMAL',
+)
+
+
+class ScalarCodec(typing.NamedTuple):
+    #: Converts a value from the response
+    decode: typing.Callable
+    #: Converts a variable value for sending
+    encode: typing.Callable
+
+
+def _parse_datetime(value):
+    # fromisoformat() only takes "Z" from Python 3.11
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value)
+
+
+#: ISO 8601 date-times, as :py:class:`datetime.datetime`
+DATETIME = ScalarCodec(_parse_datetime, datetime.datetime.isoformat)
+
+#: ISO 8601 dates, as :py:class:`datetime.date`
+DATE = ScalarCodec(datetime.date.fromisoformat, datetime.date.isoformat)
+
+#: Decimal numbers sent as strings, as :py:class:`decimal.Decimal`
+DECIMAL = ScalarCodec(decimal.Decimal, str)
+
+
+# provider -> scalar name -> ScalarCodec
+_scalars = collections.defaultdict(dict)
+# provider -> enum name -> Enum class
+_enums = collections.defaultdict(dict)
+# (provider, enum name) -> generated Enum class
+_generated = {}
+_generated_lock = threading.Lock()
+
+
+def register_scalar(provider, name, codec):
+    """
+    Sets the codec of a custom scalar, for the modules of a provider imported
+    afterwards.
+    """
+    _scalars[provider][name] = codec
+
+
+def register_enum(provider, name, cls):
+    """
+    Sets the Python :py:class:`enum.Enum` of a GraphQL enum, for the modules
+    of a provider imported afterwards. The members must be named like the
+    GraphQL values.
+    """
+    _enums[provider][name] = cls
+
+
+def get_enum(provider, gtype):
+    """
+    Gets the Python enum of a GraphQL enum type: the registered one, or a
+    generated one with the ``decode_enums`` setting, or None.
+    """
+    try:
+        return _enums[provider][gtype.name]
+    except KeyError:
+        pass
+    if not settings.decode_enums:
+        return
+    with _generated_lock:
+        key = provider, gtype.name
+        if key not in _generated:
+            _generated[key] = enum.Enum(gtype.name, [(name, name) for name in gtype.values])
+        return _generated[key]
+
+
+class CodecBuilder:
+    """
+    Builds the conversion functions of an operation. Each build method returns
+    None if the values of that type need no conversion.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+        self.scalars = _scalars.get(provider, {})
+        # input object name -> encoder
+        self.inputs = {}
+
+    # Leaves
+    def leaf_decoder(self, gtype):
+        if graphql.is_enum_type(gtype):
+            cls = get_enum(self.provider, gtype)
+            return None if cls is None else cls.__getitem__
+        codec = self.scalars.get(gtype.name)
+        return None if codec is None else codec.decode
+
+    def leaf_encoder(self, gtype):
+        if graphql.is_enum_type(gtype):
+            # The variable validator also takes enum members, when it's on
+            return None if get_enum(self.provider, gtype) is None else _encode_enum
+        codec = self.scalars.get(gtype.name)
+        return None if codec is None else codec.encode
+
+    # Results
+    def collect_fields(self, nodes, fields=None):
+        """
+        Groups the fields selected by some nodes by response key.
+        """
+        if fields is None:
+            fields = collections.OrderedDict()
+        for node in nodes:
+            for sel in node.selection_set.selections:
+                if isinstance(sel, graphql.FieldNode):
+                    fields.setdefault((sel.alias or sel.name).value, []).append(sel)
+                else:
+                    frag = get_definition(sel) if isinstance(sel, graphql.FragmentSpreadNode) else sel
+                    if frag is not None:
+                        self.collect_fields([frag], fields)
+        return fields
+
+    def object_decoder(self, nodes):
+        decoders = []
+        for rkey, fnodes in self.collect_fields(nodes).items():
+            decoder = self.type_decoder(get_type(fnodes[0]), fnodes)
+            if decoder is not None:
+                decoders.append((rkey, decoder))
+        if decoders:
+            return _keys_of(decoders)
+
+    def type_decoder(self, gtype, nodes):
+        gtype = graphql.get_nullable_type(gtype)
+        if graphql.is_list_type(gtype):
+            inner = self.type_decoder(gtype.of_type, nodes)
+            return None if inner is None else _list_of(inner)
+        elif graphql.is_leaf_type(gtype):
+            leaf = self.leaf_decoder(gtype)
+            return None if leaf is None else _nullable(leaf)
+        else:
+            return self.object_decoder(nodes)
+
+    # Variables
+    def type_encoder(self, gtype):
+        gtype = graphql.get_nullable_type(gtype)
+        if graphql.is_list_type(gtype):
+            inner = self.type_encoder(gtype.of_type)
+            return None if inner is None else _list_of(inner)
+        elif graphql.is_input_object_type(gtype):
+            return self.input_object_encoder(gtype)
+        else:
+            leaf = self.leaf_encoder(gtype)
+            return None if leaf is None else _nullable(leaf)
+
+    def input_object_encoder(self, gtype):
+        if gtype.name in self.inputs:
+            return self.inputs[gtype.name]
+        # Input objects can refer to themselves, so stand in until it's built
+        built = []
+        self.inputs[gtype.name] = lambda value: built[0](value) if built else value
+
+        encoders = []
+        for name, field in gtype.fields.items():
+            encoder = self.type_encoder(field.type)
+            if encoder is not None:
+                encoders.append((name, encoder))
+        if not encoders:
+            self.inputs[gtype.name] = None
+            return
+        encoder = _keys_of(encoders)
+        built.append(encoder)
+        self.inputs[gtype.name] = encoder
+        return encoder
+
+
+def _keys_of(converters):
+    """
+    Builds a function converting some keys of a dict (into a copy, since
+    results may be shared with caches).
+    """
+    def convert_keys(value):
+        if not isinstance(value, dict):
+            return value
+        value = dict(value)
+        for key, func in converters:
+            if key in value:
+                value[key] = func(value[key])
+        return value
+    return convert_keys
+
+
+def _encode_enum(value):
+    return value.name if isinstance(value, enum.Enum) else value
+
+
+def _nullable(func):
+    def convert_nullable(value):
+        return None if value is None else func(value)
+    return convert_nullable
+
+
+def _list_of(func):
+    def convert_list(value):
+        if not isinstance(value, list):
+            # Single values are coerced into lists by the server
+            return func(value)
+        return [func(item) for item in value]
+    return convert_list
+
+
+class CodecOperation:
+    """
+    Encodes the variables of an operation and decodes its results. Generated
+    functions call this in place of the plain query functions.
+
+    Queries go to the provider, or through runner (an object with
+    ``query_sync()``/``query_async()``) if given.
+    """
+    def __init__(self, decoder, encoders, runner=None):
+        self.decoder = decoder
+        self.encoders = encoders
+        self.runner = runner
+
+    def encode(self, variables):
+        for name, encoder in self.encoders:
+            if name in variables:
+                variables[name] = encoder(variables[name])
+        return variables
+
+    def decode(self, data):
+        return data if self.decoder is None else self.decoder(data)
+
+    def query_sync(self, provider, query, **variables):
+        variables = self.encode(variables)
+        if self.runner is None:
+            data = exec_query_sync(provider, query, **variables)
+        else:
+            data = self.runner.query_sync(provider, query, **variables)
+        return self.decode(data)
+
+    async def query_async(self, provider, query, **variables):
+        variables = self.encode(variables)
+        if self.runner is None:
+            data = await exec_query_async(provider, query, **variables)
+        else:
+            data = await self.runner.query_async(provider, query, **variables)
+        return self.decode(data)
+
+
+def build_codec(provider, definition, schema, runner=None):
+    """
+    Builds the :py:class:`CodecOperation` of an (annotated) operation, or
+    returns None if it has nothing to convert.
+    """
+    builder = CodecBuilder(provider)
+    decoder = builder.object_decoder([definition])
+    encoders = []
+    for var in definition.variable_definitions:
+        encoder = builder.type_encoder(graphql.type_from_ast(schema, var.type))
+        if encoder is not None:
+            encoders.append((var.variable.name.value, encoder))
+    if decoder is None and not encoders:
+        return
+    return CodecOperation(decoder, encoders, runner)
@@ -0,0 +1,404 @@
+"""
+Compiles operations into execution plans for in-process providers.
+
+graphql-core's executor re-walks the selection set, collects fields, and
+checks types on every request. Since gqlmod knows each operation when it is
+imported, it can do that work once: an :py:class:`ExecutionPlan` is a tree of
+closures, one per field and path, with the field lists, resolvers, argument
+values, and serializers already looked up.
+
+Plans produce the same results as :py:func:`graphql.graphql_sync`, errors
+included. They only support synchronous resolvers, and operations that
+introspect the schema (``__schema``/``__type``) or use variables in
+``@skip``/``@include`` are not compiled.
+
+Providers opt in by having a ``get_executable_schema()`` method, returning the
+schema (with resolvers) they execute queries against, and optionally a
+``get_context_value()`` method giving the context for a request.
+"""
+from collections.abc import Iterable
+
+import graphql
+from graphql.execution.execute import default_field_resolver, default_type_resolver, invalid_return_type_error
+from graphql.execution.values import get_argument_values, get_directive_values, get_variable_values
+from graphql.pyutils import Path, Undefined, inspect, is_awaitable
+
+from .helpers.types import get_definition
+from .providers import _run_async, _run_sync, exec_query_async, exec_query_sync, get_provider
+
+__all__ = 'ExecutionPlan', 'CompiledOperation', 'Unsupported', 'compile_operation', 'verify'
+
+
+class Unsupported(Exception):
+    """
+    The operation can't be compiled, and needs the generic executor.
+    """
+
+
+class _State:
+    """
+    The per-request state of executing a plan.
+    """
+    __slots__ = ('variables', 'context', 'root', 'errors')
+
+    def __init__(self, variables, context, root):
+        self.variables = variables
+        self.context = context
+        self.root = root
+        self.errors = []
+
+
+def _fail(field_nodes, path, non_null, state, raw_error):
+    """
+    Handles an error in a field or list item, like the executor does.
+    """
+    error = graphql.located_error(raw_error, field_nodes, path.as_list())
+    if non_null:
+        raise error
+    state.errors.append(error)
+
+
+class ExecutionPlan:
+    """
+    An operation compiled against an executable schema.
+    """
+    def __init__(self, definition, schema):
+        self.definition = definition
+        self.schema = schema
+        self.fragments = {}
+        if definition.operation == graphql.OperationType.QUERY:
+            self.root_type = schema.query_type
+        elif definition.operation == graphql.OperationType.MUTATION:
+            self.root_type = schema.mutation_type
+        else:
+            raise Unsupported("Subscriptions can't be compiled")
+        self._execute_root = self._compile_object(self.root_type, [definition])
+
+    def execute(self, variables=None, *, context=None, root=None):
+        """
+        Runs the operation, returning a :py:class:`graphql.ExecutionResult`.
+        """
+        coerced = get_variable_values(self.schema, self.definition.variable_definitions, variables or {})
+        if isinstance(coerced, list):
+            return graphql.ExecutionResult(None, coerced)
+        state = _State(coerced, context, root)
+        try:
+            data = self._execute_root(root, None, None, state)
+        except graphql.GraphQLError as error:
+            state.errors.append(error)
+            data = None
+        if not state.errors:
+            return graphql.ExecutionResult(data, None)
+        state.errors.sort(key=lambda error: (error.locations or [], error.path or [], error.message))
+        return graphql.ExecutionResult(data, state.errors)
+
+    # Field collection, at compile time
+    def _included(self, node):
+        for directive in node.directives or ():
+            if any(_has_variables(arg.value) for arg in directive.arguments):
+                raise Unsupported("Variables in @skip/@include")
+        skip = get_directive_values(graphql.GraphQLSkipDirective, node)
+        if skip and skip['if']:
+            return False
+        include = get_directive_values(graphql.GraphQLIncludeDirective, node)
+        return not (include and not include['if'])
+
+    def _applies(self, fragment, otype):
+        if fragment.type_condition is None:
+            return True
+        ctype = self.schema.get_type(fragment.type_condition.name.value)
+        if ctype is otype:
+            return True
+        return graphql.is_abstract_type(ctype) and self.schema.is_sub_type(ctype, otype)
+
+    def _collect_fields(self, otype, nodes, fields):
+        for node in nodes:
+            for sel in node.selection_set.selections:
+                if not self._included(sel):
+                    continue
+                if isinstance(sel, graphql.FieldNode):
+                    fields.setdefault((sel.alias or sel.name).value, []).append(sel)
+                    continue
+                if isinstance(sel, graphql.FragmentSpreadNode):
+                    frag = get_definition(sel)
+                    self.fragments[sel.name.value] = frag
+                else:
+                    frag = sel
+                if self._applies(frag, otype):
+                    self._collect_fields(otype, [frag], fields)
+        return fields
+
+    # Compiling
+    def _compile_object(self, otype, nodes):
+        plans = [
+            (key, self._compile_selection(otype, key, field_nodes))
+            for key, field_nodes in self._collect_fields(otype, nodes, {}).items()
+        ]
+
+        def execute_object(source, info, path, state):
+            return {key: run(source, path, state) for key, run in plans}
+
+        return execute_object
+
+    def _compile_args(self, field_def, node):
+        """
+        Returns the arguments if they are known now, or None.
+        """
+        if not node.arguments:
+            return {}
+        if any(_has_variables(arg.value) for arg in node.arguments):
+            return
+        return get_argument_values(field_def, node)
+
+    def _compile_selection(self, otype, key, field_nodes):
+        name = field_nodes[0].name.value
+        if name == '__typename':
+            typename = otype.name
+            return lambda source, path, state: typename
+        if name not in otype.fields:
+            raise Unsupported(f"Field {otype.name}.{name} (introspection is not compiled)")
+        return self._compile_field(otype, key, name, field_nodes)
+
+    def _compile_field(self, otype, key, name, field_nodes):
+        field_def = otype.fields[name]
+        return_type = field_def.type
+        resolve = field_def.resolve or default_field_resolver
+        static_args = self._compile_args(field_def, field_nodes[0])
+        complete = self._compile_value(return_type, field_nodes, otype, name)
+        non_null = graphql.is_non_null_type(return_type)
+        schema, fragments, operation = self.schema, self.fragments, self.definition
+
+        def run_field(source, path, state):
+            fpath = Path(path, key, otype.name)
+            info = graphql.GraphQLResolveInfo(
+                name, field_nodes, return_type, otype, fpath, schema, fragments, state.root, operation,
+                state.variables, state.context, is_awaitable,
+            )
+            try:
+                args = static_args
+                if args is None:
+                    args = get_argument_values(field_def, field_nodes[0], state.variables)
+                result = resolve(source, info, **args)
+                if is_awaitable(result):
+                    getattr(result, 'close', lambda: None)()
+                    raise TypeError("Compiled plans only support synchronous resolvers")
+                return complete(result, info, fpath, state)
+            except Exception as raw_error:
+                _fail(field_nodes, fpath, non_null, state, raw_error)
+
+        return run_field
+
+    def _compile_value(self, rtype, field_nodes, parent_type, field_name):
+        if graphql.is_non_null_type(rtype):
+            return self._compile_non_null(rtype, field_nodes, parent_type, field_name)
+        elif graphql.is_list_type(rtype):
+            inner = self._compile_list(rtype, field_nodes, parent_type, field_name)
+        else:
+            inner = self._compile_named(rtype, field_nodes)
+
+        def complete_nullable(result, info, path, state):
+            if isinstance(result, Exception):
+                raise result
+            if result is None or result is Undefined:
+                return None
+            return inner(result, info, path, state)
+
+        return complete_nullable
+
+    def _compile_named(self, rtype, field_nodes):
+        if graphql.is_leaf_type(rtype):
+            return self._compile_leaf(rtype)
+        elif graphql.is_abstract_type(rtype):
+            return self._compile_abstract(rtype, field_nodes)
+        else:
+            return self._compile_object_value(rtype, field_nodes)
+
+    def _compile_non_null(self, rtype, field_nodes, parent_type, field_name):
+        inner = self._compile_value(rtype.of_type, field_nodes, parent_type, field_name)
+        message = f"Cannot return null for non-nullable field {parent_type.name}.{field_name}."
+
+        def complete_non_null(result, info, path, state):
+            completed = inner(result, info, path, state)
+            if completed is None:
+                raise TypeError(message)
+            return completed
+
+        return complete_non_null
+
+    def _compile_list(self, rtype, field_nodes, parent_type, field_name):
+        item_type = rtype.of_type
+        complete_item = self._compile_value(item_type, field_nodes, parent_type, field_name)
+        item_non_null = graphql.is_non_null_type(item_type)
+        message = f"Expected Iterable, but did not find one for field '{parent_type.name}.{field_name}'."
+
+        def complete_list(result, info, path, state):
+            if not isinstance(result, Iterable) or isinstance(result, str):
+                raise graphql.GraphQLError(message)
+            completed = []
+            for index, item in enumerate(result):
+                item_path = path.add_key(index, None)
+                try:
+                    completed.append(complete_item(item, info, item_path, state))
+                except Exception as raw_error:
+                    _fail(field_nodes, item_path, item_non_null, state, raw_error)
+                    completed.append(None)
+            return completed
+
+        return complete_list
+
+    def _compile_leaf(self, rtype):
+        serialize = rtype.serialize
+
+        def complete_leaf(result, info, path, state):
+            serialized = serialize(result)
+            if serialized is Undefined:
+                raise TypeError(f"Expected a value of type '{inspect(rtype)}' but received: {inspect(result)}")
+            return serialized
+
+        return complete_leaf
+
+    def _compile_object_value(self, otype, field_nodes):
+        execute_object = self._compile_object(otype, field_nodes)
+        is_type_of = otype.is_type_of
+
+        def complete_object(result, info, path, state):
+            if is_type_of is not None and not is_type_of(result, info):
+                raise invalid_return_type_error(otype, result, field_nodes)
+            return execute_object(result, info, path, state)
+
+        return complete_object
+
+    def _compile_abstract(self, atype, field_nodes):
+        completers = {
+            ptype.name: self._compile_object_value(ptype, field_nodes)
+            for ptype in self.schema.get_possible_types(atype)
+        }
+        resolve_type = atype.resolve_type or default_type_resolver
+
+        def complete_abstract(result, info, path, state):
+            runtime = resolve_type(result, info, atype)
+            typename = runtime.name if graphql.is_named_type(runtime) else runtime
+            complete = completers.get(typename) if isinstance(typename, str) else None
+            if complete is None:
+                raise _runtime_type_error(self.schema, atype, typename, field_nodes, info, result)
+            return complete(result, info, path, state)
+
+        return complete_abstract
+
+
+def _has_variables(value):
+    if value.kind == 'variable':
+        return True
+    elif value.kind == 'list_value':
+        return any(_has_variables(item) for item in value.values)
+    elif value.kind == 'object_value':
+        return any(_has_variables(field.value) for field in value.fields)
+    return False
+
+
+def _runtime_type_error(schema, atype, typename, field_nodes, info, result):
+    """
+    Builds the error the executor gives for a bad runtime type.
+    """
+    field = f"{info.parent_type.name}.{info.field_name}"
+    if typename is None:
+        return graphql.GraphQLError(
+            f"Abstract type '{atype.name}' must resolve to an Object type at runtime for field '{field}'."
+            f" Either the '{atype.name}' type should provide a 'resolve_type' function"
+            " or each possible type should provide an 'is_type_of' function.",
+            field_nodes,
+        )
+    if not isinstance(typename, str):
+        return graphql.GraphQLError(
+            f"Abstract type '{atype.name}' must resolve to an Object type at runtime for field '{field}'"
+            f" with value {inspect(result)}, received '{inspect(typename)}'.",
+            field_nodes,
+        )
+    runtime_type = schema.get_type(typename)
+    if runtime_type is None:
+        return graphql.GraphQLError(
+            f"Abstract type '{atype.name}' was resolved to a type '{typename}'"
+            " that does not exist inside the schema.",
+            field_nodes,
+        )
+    if not graphql.is_object_type(runtime_type):
+        return graphql.GraphQLError(
+            f"Abstract type '{atype.name}' was resolved to a non-object type '{typename}'.",
+            field_nodes,
+        )
+    return graphql.GraphQLError(
+        f"Runtime Object type '{typename}' is not a possible type for '{atype.name}'.",
+        field_nodes,
+    )
+
+
+def compile_operation(definition, schema):
+    """
+    Compiles an (annotated) operation definition against an executable schema.
+    Returns None if the operation can't be compiled.
+    """
+    try:
+        return ExecutionPlan(definition, schema)
+    except Unsupported:
+        return
+
+
+def verify(plan, variables=None, *, context=None, root=None):
+    """
+    Checks that a plan gives the same result as graphql-core's executor,
+    raising AssertionError if not.
+    """
+    document = graphql.DocumentNode(definitions=[plan.definition, *plan.fragments.values()])
+    expected = graphql.execute(
+        plan.schema, document, root_value=root, context_value=context, variable_values=variables,
+    )
+    actual = plan.execute(variables, context=context, root=root)
+    assert actual.data == expected.data, f"Data differs: {actual.data!r} != {expected.data!r}"
+    assert [err.formatted for err in actual.errors or ()] == [err.formatted for err in expected.errors or ()], \
+        f"Errors differ: {actual.errors!r} != {expected.errors!r}"
+    return actual
+
+
+def supports_plans(prov):
+    """
+    Checks if a provider executes queries in-process against a schema. (Looks
+    at the class, so that wrappers passing attributes through don't count.)
+    """
+    return callable(getattr(type(prov), 'get_executable_schema', None))
+
+
+class CompiledOperation:
+    """
+    Executes an operation with its compiled plan, when the current provider is
+    the kind it was compiled for, or else sends the query as usual.
+    """
+    def __init__(self, plan):
+        self.plan = plan
+
+    def _runner(self, provider):
+        prov = get_provider(provider)
+        if not supports_plans(prov) or prov.get_executable_schema() is not self.plan.schema:
+            return
+        get_context = getattr(prov, 'get_context_value', None)
+
+        def run_plan(query, variables):
+            context = get_context() if get_context is not None else None
+            return self.plan.execute(variables, context=context)
+
+        return run_plan
+
+    def query_sync(self, provider, query, **variables):
+        run_plan = self._runner(provider)
+        if run_plan is None:
+            return exec_query_sync(provider, query, **variables)
+        return _run_sync(provider, run_plan, query, variables)
+
+    async def query_async(self, provider, query, **variables):
+        run_plan = self._runner(provider)
+        if run_plan is None:
+            return await exec_query_async(provider, query, **variables)
+
+        async def run_plan_async(query, variables):
+            return run_plan(query, variables)
+
+        return await _run_async(provider, run_plan_async, query, variables)
@@ -0,0 +1,192 @@
+"""
+Static cost analysis of operations.
+
+Estimates are computed from the annotated query AST, without running anything.
+Lists are assumed to hold as many items as their ``first``/``last`` argument
+asks for, or else a configured default size.
+
+Schemas written in SDL may refine the estimate with directives on field
+definitions::
+
+    directive @cost(weight: Int!) on FIELD_DEFINITION
+    directive @listSize(assumedSize: Int, slicingArguments: [String!]) on FIELD_DEFINITION
+"""
+import typing
+import warnings
+
+import graphql
+
+from . import settings
+from .errors import QueryCostError, QueryCostWarning, from_graphql_validate
+from .helpers.types import get_definition
+from .helpers.utils import walk_query
+
+__all__ = 'OperationCost', 'estimate_cost', 'check_cost', 'enforce_cost_limits'
+
+#: The arguments that limit how many items a list field returns
+SLICING_ARGUMENTS = ('first', 'last')
+
+
+class OperationCost(typing.NamedTuple):
+    #: The name of the operation (None if it is anonymous)
+    name: typing.Optional[str]
+    #: How deeply nested the selections are
+    depth: int
+    #: The estimated number of values returned
+    nodes: int
+    #: The estimated cost, from the ``@cost`` weights of the fields
+    cost: int
+
+
+def get_directive_args(sfield, name):
+    """
+    Gets the arguments of a directive applied to a schema field definition, or
+    None if it is not present.
+
+    Only schemas built from SDL keep directives.
+    """
+    node = getattr(sfield, 'ast_node', None)
+    if node is None:
+        return
+    for directive in node.directives or ():
+        if directive.name.value == name:
+            return {
+                arg.name.value: graphql.value_from_ast_untyped(arg.value)
+                for arg in directive.arguments
+            }
+
+
+def get_argument_value(arg):
+    """
+    Gets the static value of an argument, looking through to the default of a
+    variable. Returns None if it isn't statically known.
+    """
+    if isinstance(arg.value, graphql.VariableNode):
+        vardef = get_definition(arg.value)
+        if vardef is None or vardef.default_value is None:
+            return
+        return graphql.value_from_ast_untyped(vardef.default_value)
+    else:
+        return graphql.value_from_ast_untyped(arg.value)
+
+
+def get_list_size(qfield, sfield, parent, list_size, list_sizes):
+    """
+    Estimates how many items a list field returns.
+    """
+    sizing = get_directive_args(sfield, 'listSize') or {}
+    slicing = sizing.get('slicingArguments') or SLICING_ARGUMENTS
+    for arg in qfield.arguments:
+        if arg.name.value in slicing:
+            value = get_argument_value(arg)
+            if isinstance(value, int):
+                return value
+
+    coord = f"{parent}.{qfield.name.value}"
+    if coord in list_sizes:
+        return list_sizes[coord]
+    return sizing.get('assumedSize', list_size)
+
+
+def get_weight(sfield):
+    """
+    Gets the cost of resolving a field once.
+
+    Defaults to 1 for objects and 0 for leaf values.
+    """
+    weight = (get_directive_args(sfield, 'cost') or {}).get('weight')
+    if weight is not None:
+        return int(weight)
+    elif graphql.is_leaf_type(graphql.get_named_type(sfield.type)):
+        return 0
+    else:
+        return 1
+
+
+def count_lists(sfield):
+    """
+    Counts the list wrappers of a field's type.
+    """
+    rv = 0
+    gtype = sfield.type
+    while isinstance(gtype, graphql.GraphQLWrappingType):
+        rv += isinstance(gtype, graphql.GraphQLList)
+        gtype = gtype.of_type
+    return rv
+
+
+def estimate_cost(definition, schema, *, list_size=None, list_sizes=None):
+    """
+    Estimates the cost of an annotated operation definition.
+
+    list_size is the assumed length of lists with no other information, and
+    list_sizes can override it per schema coordinate (eg ``Query.users``).
+    """
+    if list_size is None:
+        list_size = settings.list_size
+    list_sizes = list_sizes or {}
+
+    # walk_query produces fields depth-first, so the parent of a field is the
+    # last one seen one level up. instances[d] is how many values the last
+    # field at depth d produced (the root produces exactly one).
+    instances = [1]
+    parents = [None]
+    depth = nodes = cost = 0
+    for path, qfield, sfield in walk_query(definition, schema):
+        level = len(path)
+        del instances[level:], parents[level:]
+        count = instances[-1]
+        cost += count * get_weight(sfield)
+        lists = count_lists(sfield)
+        if lists:
+            count *= get_list_size(qfield, sfield, parents[-1], list_size, list_sizes) ** lists
+        instances.append(count)
+        parents.append(graphql.get_named_type(sfield.type).name)
+        nodes += count
+        depth = max(depth, level)
+
+    name = definition.name.value if definition.name is not None else None
+    return OperationCost(name, depth, nodes, cost)
+
+
+def check_cost(definition, cost, *, max_depth=None, max_nodes=None, max_cost=None):
+    """
+    Compares an :py:class:`OperationCost` with the given limits, producing
+    :py:class:`gqlmod.errors.QueryCostError` for each limit exceeded.
+    """
+    for label, value, limit in [
+        ('depth', cost.depth, max_depth),
+        ('node count', cost.nodes, max_nodes),
+        ('cost', cost.cost, max_cost),
+    ]:
+        if limit is not None and value > limit:
+            yield QueryCostError(
+                f"Operation {cost.name} exceeds the maximum {label} ({value} > {limit})",
+                definition.name,
+            )
+
+
+def enforce_cost_limits(gast, schema):
+    """
+    Applies the cost limits in :py:mod:`gqlmod.settings` to every operation of
+    an annotated document, either warning or raising as configured.
+    """
+    limits = {
+        'max_depth': settings.max_depth,
+        'max_nodes': settings.max_nodes,
+        'max_cost': settings.max_cost,
+    }
+    if all(limit is None for limit in limits.values()):
+        return
+
+    errors = [
+        err
+        for defin in gast.definitions
+        if defin.kind == 'operation_definition'
+        for err in check_cost(defin, estimate_cost(defin, schema), **limits)
+    ]
+    if errors and settings.cost_limit_action == 'error':
+        raise from_graphql_validate(errors)
+    for err in errors:
+        loc, = err.locations
+        warnings.warn_explicit(QueryCostWarning(err.message), QueryCostWarning, err.source.name, loc.line)
@@ -0,0 +1,89 @@
+"""
+Deadlines for queries.
+
+A deadline bounds how long the queries made inside it may take, all together::
+
+    with gqlmod.deadline(0.25):
+        data = queries.HeroForEpisode(ep='EMPIRE')
+
+Nested deadlines can only shorten the current one. Asynchronous queries are
+cancelled when the deadline passes; synchronous ones can't be interrupted, so
+providers are given the remaining time (from :py:func:`remaining`) to use as
+their own timeout. Either way, :py:class:`gqlmod.errors.DeadlineExceeded` is
+raised.
+
+Deadlines are kept in a context variable, so they follow tasks, but not new
+threads.
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+
+from .errors import DeadlineExceeded
+
+__all__ = 'deadline', 'remaining', 'check', 'bound', 'wait_for'
+
+# The monotonic time of the current deadline
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Gives the queries made in the context this many seconds to finish, or
+    less if an outer deadline is sooner.
+    """
+    when = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        when = min(when, current)
+    token = _deadline.set(when)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Gets the seconds left until the current deadline (possibly negative), or
+    None if there isn't one.
+    """
+    when = _deadline.get()
+    if when is None:
+        return
+    return when - time.monotonic()
+
+
+def check():
+    """
+    Raises :py:class:`DeadlineExceeded` if the current deadline has passed.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("The deadline passed before the query finished")
+
+
+def bound(timeout):
+    """
+    Shortens a timeout (in seconds, or None for none) to the current deadline.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, 0)
+    return left if timeout is None else min(timeout, left)
+
+
+async def wait_for(awaitable):
+    """
+    Awaits something, cancelling it if the current deadline passes.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("The deadline passed before the query finished")
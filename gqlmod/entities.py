@@ -0,0 +1,393 @@
+"""
+A normalized client-side cache of entities.
+
+Objects in responses are stored once, by ``__typename`` and identity, no
+matter which operation or path fetched them. Queries are answered from the
+cache when every field they select is already known; otherwise they are sent
+to the provider, and the response is merged into the cache. Mutation
+responses update the entities they return, but are never answered from the
+cache.
+
+An object type's identity is given by a ``@key(fields: "...")`` directive (for
+schemas in SDL), or else by a scalar field named ``id``. Objects without an
+identity are stored inside whichever entity (or root field) holds them.
+
+The cache is enabled with the ``entity_cache`` setting, and holds up to
+``entity_cache_size`` entries (entities and root fields) per provider,
+evicting the least recently used.
+"""
+import collections
+import json
+import threading
+import weakref
+
+import graphql
+from graphql.execution.values import get_directive_values
+
+from . import settings
+from .cost import get_directive_args
+from .helpers.types import SCHEMA_ATTR, get_definition, get_type
+from .providers import exec_query_async, exec_query_sync, get_provider
+
+__all__ = 'EntityStore', 'CachedOperation', 'get_store', 'clear', 'add_identity_fields', 'get_identity_fields'
+
+
+class Ref(collections.namedtuple('Ref', ['typename', 'ident'])):
+    """
+    A reference from a stored value to an entity.
+    """
+
+
+# The key of root query fields
+ROOT = None
+
+
+def get_identity_fields(stype):
+    """
+    Gets the names of the fields identifying objects of a type, or None if it
+    has none.
+    """
+    args = get_directive_args(stype, 'key')
+    if args and args.get('fields'):
+        return tuple(args['fields'].split())
+    fields = getattr(stype, 'fields', {})
+    if 'id' in fields and graphql.is_leaf_type(graphql.get_named_type(fields['id'].type)):
+        return ('id',)
+
+
+def _field_node(name, sfield):
+    node = graphql.FieldNode(name=graphql.NameNode(value=name), arguments=[], directives=[])
+    setattr(node, SCHEMA_ATTR, sfield)
+    return node
+
+
+def _selects(selection_set, name):
+    return any(
+        isinstance(sel, graphql.FieldNode) and sel.alias is None and sel.name.value == name
+        for sel in selection_set.selections
+    )
+
+
+def _selects_on(selection_set, tname, names):
+    """
+    Checks if an inline fragment on a type already selects the given fields.
+    """
+    for sel in selection_set.selections:
+        if not isinstance(sel, graphql.InlineFragmentNode) or sel.type_condition is None:
+            continue
+        if sel.type_condition.name.value == tname and all(_selects(sel.selection_set, name) for name in names):
+            return True
+    return False
+
+
+def _identity_selections(selection_set, stype, schema):
+    """
+    Builds the selections needed to identify objects of the given type.
+    """
+    extra = []
+    if not _selects(selection_set, '__typename'):
+        extra.append(_field_node('__typename', graphql.TypeNameMetaFieldDef))
+    ident = get_identity_fields(stype)
+    if ident and all(name in stype.fields for name in ident):
+        extra += [
+            _field_node(name, stype.fields[name])
+            for name in ident
+            if not _selects(selection_set, name)
+        ]
+    elif graphql.is_abstract_type(stype):
+        # Ask each possible type for its own identity
+        for ptype in schema.get_possible_types(stype):
+            pident = get_identity_fields(ptype)
+            if not pident or _selects_on(selection_set, ptype.name, pident):
+                continue
+            inner = graphql.SelectionSetNode(selections=[_field_node(name, ptype.fields[name]) for name in pident])
+            setattr(inner, SCHEMA_ATTR, ptype)
+            frag = graphql.InlineFragmentNode(
+                type_condition=graphql.NamedTypeNode(name=graphql.NameNode(value=ptype.name)),
+                directives=[], selection_set=inner,
+            )
+            setattr(frag, SCHEMA_ATTR, ptype)
+            extra.append(frag)
+    return extra
+
+
+def add_identity_fields(node, schema):
+    """
+    Adds ``__typename`` and the identity fields to every object selection in
+    an (annotated) operation or fragment definition, in place.
+
+    Imported fragments are shared between modules, so they are left alone.
+    """
+    for sel in node.selection_set.selections:
+        if isinstance(sel, graphql.FragmentSpreadNode) or sel.selection_set is None:
+            continue
+        stype = get_type(sel, unwrap=True)
+        if isinstance(sel, graphql.FieldNode):
+            sel.selection_set.selections = [
+                *sel.selection_set.selections, *_identity_selections(sel.selection_set, stype, schema),
+            ]
+        add_identity_fields(sel, schema)
+
+
+def field_key(node, variables):
+    """
+    Gets the storage key of a field: its name and arguments.
+    """
+    if not node.arguments:
+        return node.name.value
+    args = {
+        arg.name.value: graphql.value_from_ast_untyped(arg.value, variables)
+        for arg in node.arguments
+    }
+    return f"{node.name.value}({json.dumps(args, sort_keys=True, default=str)})"
+
+
+def _applies(schema, cond, typename, stype):
+    if cond is None:
+        return True
+    if cond.name.value in (typename, stype.name):
+        return True
+    ctype = schema.get_type(cond.name.value)
+    concrete = schema.get_type(typename) if typename else None
+    return graphql.is_abstract_type(ctype) and concrete is not None and schema.is_sub_type(ctype, concrete)
+
+
+def _included(node, variables):
+    skip = get_directive_values(graphql.GraphQLSkipDirective, node, variables)
+    if skip and skip['if']:
+        return False
+    include = get_directive_values(graphql.GraphQLIncludeDirective, node, variables)
+    return not (include and not include['if'])
+
+
+def collect_fields(schema, nodes, stype, typename, variables, fields=None):
+    """
+    Collects the fields selected on an object by the given nodes, grouped by
+    response key, like execution does.
+    """
+    if fields is None:
+        fields = collections.OrderedDict()
+    for node in nodes:
+        for sel in node.selection_set.selections:
+            if not _included(sel, variables):
+                continue
+            if isinstance(sel, graphql.FieldNode):
+                fields.setdefault((sel.alias or sel.name).value, []).append(sel)
+            else:
+                frag = get_definition(sel) if isinstance(sel, graphql.FragmentSpreadNode) else sel
+                if frag is not None and _applies(schema, frag.type_condition, typename, stype):
+                    collect_fields(schema, [frag], stype, typename, variables, fields)
+    return fields
+
+
+def _field_type(stype, name):
+    if name == '__typename':
+        return graphql.GraphQLNonNull(graphql.GraphQLString)
+    return stype.fields[name].type
+
+
+class EntityStore:
+    """
+    Holds the entities and root query fields from responses, evicting the
+    least recently used beyond ``maxsize`` entries.
+    """
+    def __init__(self, schema, maxsize=10000):
+        self.schema = schema
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _put(self, key, update):
+        record = self._entries.get(key)
+        if record is None:
+            self._entries[key] = record = {}
+        record.update(update)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _get(self, key):
+        record = self._entries[key]
+        self._entries.move_to_end(key)
+        return record
+
+    # Writing
+    def write(self, definition, variables, data, schema=None):
+        """
+        Merges the response to an operation into the store. Types are looked
+        up in schema (the one the operation was annotated with), if given.
+        """
+        root = get_type(definition, unwrap=True)
+        schema = schema or self.schema
+        with self._lock:
+            record = self._write_object(schema, [definition], root, root.name, data, variables)
+            if definition.operation == graphql.OperationType.QUERY:
+                for fkey, value in record.items():
+                    if fkey != '__typename':
+                        self._put((ROOT, fkey), {'': value})
+
+    def _write_object(self, schema, nodes, stype, typename, data, variables):
+        record = {}
+        for rkey, fnodes in collect_fields(schema, nodes, stype, typename, variables).items():
+            if rkey not in data:
+                continue
+            fnode = fnodes[0]
+            if fnode.name.value == '__typename':
+                record['__typename'] = data[rkey]
+                continue
+            value = self._write_value(schema, fnodes, _field_type(stype, fnode.name.value), data[rkey], variables)
+            record[field_key(fnode, variables)] = value
+        return record
+
+    def _write_value(self, schema, nodes, gtype, value, variables):
+        gtype = graphql.get_nullable_type(gtype)
+        if value is None or graphql.is_leaf_type(gtype):
+            return value
+        if graphql.is_list_type(gtype):
+            return [self._write_value(schema, nodes, gtype.of_type, item, variables) for item in value]
+
+        typename = value.get('__typename')
+        stype = schema.get_type(typename) if typename else gtype
+        record = self._write_object(schema, nodes, stype, typename, value, variables)
+        ident = get_identity_fields(stype)
+        if typename and ident and all(name in value for name in ident):
+            ref = Ref(typename, tuple(json.dumps(value[name]) for name in ident))
+            self._put(ref, record)
+            return ref
+        return record
+
+    # Reading
+    def read(self, definition, variables, schema=None):
+        """
+        Answers an operation from the store, or returns None if any selected
+        field is missing.
+        """
+        root = get_type(definition, unwrap=True)
+        schema = schema or self.schema
+        with self._lock:
+            try:
+                data = self._read_object(schema, [definition], root, root.name, self._read_root, variables)
+            except KeyError:
+                self.misses += 1
+                return
+            self.hits += 1
+            return data
+
+    def _read_root(self, fkey):
+        return self._get((ROOT, fkey))['']
+
+    def _read_object(self, schema, nodes, stype, typename, lookup, variables):
+        data = {}
+        for rkey, fnodes in collect_fields(schema, nodes, stype, typename, variables).items():
+            fnode = fnodes[0]
+            name = fnode.name.value
+            if name == '__typename':
+                data[rkey] = typename or lookup('__typename')
+                continue
+            stored = lookup(field_key(fnode, variables))
+            data[rkey] = self._read_value(schema, fnodes, _field_type(stype, name), stored, variables)
+        return data
+
+    def _read_value(self, schema, nodes, gtype, stored, variables):
+        gtype = graphql.get_nullable_type(gtype)
+        if stored is None or graphql.is_leaf_type(gtype):
+            return stored
+        if graphql.is_list_type(gtype):
+            return [self._read_value(schema, nodes, gtype.of_type, item, variables) for item in stored]
+        if isinstance(stored, Ref):
+            record = self._get(stored)
+            typename = stored.typename
+        else:
+            record = stored
+            typename = record.get('__typename')
+        stype = schema.get_type(typename) if typename else gtype
+        return self._read_object(schema, nodes, stype, typename, record.__getitem__, variables)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# provider instance -> EntityStore
+_stores = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_store(provider, schema):
+    """
+    Gets the entity store for the current instance of a provider (by name).
+    """
+    prov = get_provider(provider)
+    with _stores_lock:
+        store = _stores.get(prov)
+        if store is None:
+            _stores[prov] = store = EntityStore(schema, settings.entity_cache_size)
+        return store
+
+
+def clear():
+    """
+    Empties all the entity stores.
+    """
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.clear()
+
+
+class CachedOperation:
+    """
+    Executes an operation through the entity store of its provider. Generated
+    functions call this in place of the plain query functions.
+
+    Misses go to the provider, or through runner (an object with
+    ``query_sync()``/``query_async()``, like
+    :py:class:`gqlmod.compiler.CompiledOperation`) if given.
+    """
+    def __init__(self, definition, schema, runner=None):
+        self.definition = definition
+        self.schema = schema
+        self.runner = runner
+        self.is_query = definition.operation == graphql.OperationType.QUERY
+
+    def _variables(self, variables):
+        # Providers may get extra, non-GraphQL arguments
+        return {
+            vardef.variable.name.value: variables.get(vardef.variable.name.value)
+            for vardef in self.definition.variable_definitions
+        }
+
+    def query_sync(self, provider, query, **variables):
+        store = get_store(provider, self.schema)
+        opvars = self._variables(variables)
+        if self.is_query:
+            data = store.read(self.definition, opvars, self.schema)
+            if data is not None:
+                return data
+        if self.runner is None:
+            data = exec_query_sync(provider, query, **variables)
+        else:
+            data = self.runner.query_sync(provider, query, **variables)
+        store.write(self.definition, opvars, data, self.schema)
+        return data
+
+    async def query_async(self, provider, query, **variables):
+        store = get_store(provider, self.schema)
+        opvars = self._variables(variables)
+        if self.is_query:
+            data = store.read(self.definition, opvars, self.schema)
+            if data is not None:
+                return data
+        if self.runner is None:
+            data = await exec_query_async(provider, query, **variables)
+        else:
+            data = await self.runner.query_async(provider, query, **variables)
+        store.write(self.definition, opvars, data, self.schema)
+        return data
@@ -1,5 +1,7 @@
 import collections.abc
 
+import graphql
+
 
 class MissingProviderError(SyntaxError):
     """
@@ -27,6 +29,48 @@ class MultiErrors(collections.abc.Sequence, Exception):
         return self._errors[index]
 
 
+class QueryCostError(graphql.GraphQLError):
+    """
+    An operation exceeds the configured cost limits.
+    """
+
+
+class QueryCostWarning(UserWarning):
+    """
+    An operation exceeds the configured cost limits.
+    """
+
+
+class ProviderUnavailableError(Exception):
+    """
+    A query was not sent, to protect the provider.
+    """
+
+
+class ConcurrencyLimitError(ProviderUnavailableError):
+    """
+    Too many queries are in flight or waiting for the provider.
+    """
+
+
+class RateLimitError(ProviderUnavailableError):
+    """
+    A query waited too long for the provider's rate limit.
+    """
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """
+    The provider has been failing, so queries fail fast for a while.
+    """
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    A query didn't finish before its deadline.
+    """
+
+
 def from_graphql_validate(error_list):
     """
     Generate a Python exception from a list of graphql.error.GraphQLError.
@@ -0,0 +1,155 @@
+"""
+Spreading requests over several endpoints.
+"""
+import itertools
+import threading
+import time
+
+__all__ = 'LoadBalancer', 'Endpoint', 'POLICIES'
+
+#: The ways of picking an endpoint
+POLICIES = ('round_robin', 'least_outstanding', 'ewma')
+
+_SERVER_ERRORS = range(500, 600)
+
+
+class Endpoint:
+    """
+    One of the URLs a provider sends requests to, and what is known about
+    its health.
+    """
+    def __init__(self, url):
+        self.url = url
+        #: Requests in flight
+        self.outstanding = 0
+        #: Moving average of successful response times, in seconds (None
+        #: until one is measured)
+        self.latency = None
+        #: Failures in a row
+        self.failures = 0
+        #: Ejections in a row
+        self.ejections = 0
+        #: When it is readmitted (by :py:func:`time.monotonic`), if it has
+        #: been ejected
+        self.ejected_until = None
+
+    def available(self, now):
+        return self.ejected_until is None or self.ejected_until <= now
+
+
+class LoadBalancer:
+    """
+    Picks the endpoint for each request, and stops using endpoints that keep
+    failing.
+
+    The policy is one of:
+
+    * ``'round_robin'``: each endpoint in turn
+    * ``'least_outstanding'``: the endpoint with the fewest requests in flight
+    * ``'ewma'``: the endpoint with the lowest moving average of response
+      times, scaled by the requests in flight (endpoints without a measurement
+      are tried first)
+
+    Health is checked passively, from the requests themselves. After
+    ``failure_threshold`` failures in a row (broken connections and
+    ``failure_statuses`` responses), an endpoint is ejected for ``eject_time``
+    seconds, doubling each time it is ejected again up to ``max_eject_time``.
+    Then it gets requests again: the first success readmits it for good, and
+    a failure ejects it again. If every endpoint is ejected, the one due back
+    first is used anyway.
+    """
+    def __init__(self, urls, policy='round_robin', *, failure_threshold=3, eject_time=10.0, max_eject_time=300.0,
+                 smoothing=0.3, failure_statuses=_SERVER_ERRORS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown balancing policy {policy!r}")
+        if not urls:
+            raise ValueError("No endpoints to balance")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        #: Weight of each new response time in the moving average
+        self.smoothing = smoothing
+        self.failure_statuses = frozenset(failure_statuses)
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def pick(self):
+        """
+        Picks the endpoint for a request, counting it as in flight until
+        :py:meth:`finish` is called.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [ep for ep in self.endpoints if ep.available(now)]
+            if not candidates:
+                candidates = [min(self.endpoints, key=lambda ep: ep.ejected_until)]
+            # Rotate, so ties don't always go to the first endpoint
+            turn = next(self._turn) % len(candidates)
+            candidates = candidates[turn:] + candidates[:turn]
+            if self.policy == 'least_outstanding':
+                endpoint = min(candidates, key=lambda ep: ep.outstanding)
+            elif self.policy == 'ewma':
+                endpoint = min(candidates, key=lambda ep: (ep.latency or 0.0) * (ep.outstanding + 1))
+            else:
+                endpoint = candidates[0]
+            endpoint.outstanding += 1
+            return endpoint
+
+    def is_failure(self, status):
+        """
+        Checks if a response status counts against the health of an endpoint.
+        """
+        return status in self.failure_statuses
+
+    def finish(self, endpoint, healthy, elapsed):
+        """
+        Records the outcome of a request: healthy is True if it succeeded,
+        False if it failed, or None if it was abandoned (so it says nothing
+        about the endpoint).
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint.outstanding -= 1
+            if healthy is None or not endpoint.available(now):
+                # Requests sent before an ejection don't count either way
+                return
+            elif healthy:
+                self._succeeded(endpoint, elapsed)
+            else:
+                endpoint.failures += 1
+                if endpoint.ejected_until is not None or endpoint.failures >= self.failure_threshold:
+                    self._eject(endpoint, now)
+
+    def _succeeded(self, endpoint, elapsed):
+        if endpoint.latency is None:
+            endpoint.latency = elapsed
+        else:
+            endpoint.latency += self.smoothing * (elapsed - endpoint.latency)
+        endpoint.failures = 0
+        endpoint.ejections = 0
+        endpoint.ejected_until = None
+
+    def _eject(self, endpoint, now):
+        endpoint.ejections += 1
+        endpoint.failures = 0
+        duration = min(self.max_eject_time, self.eject_time * 2 ** (endpoint.ejections - 1))
+        endpoint.ejected_until = now + duration
+
+    def stats(self):
+        """
+        Reports the state of each endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'url': ep.url,
+                    'outstanding': ep.outstanding,
+                    'latency': ep.latency,
+                    'failures': ep.failures,
+                    'ejected': not ep.available(now),
+                }
+                for ep in self.endpoints
+            ]
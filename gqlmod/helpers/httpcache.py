@@ -0,0 +1,167 @@
+"""
+A small, bounded, private HTTP cache for GraphQL GET requests.
+
+It stores the decoded results, so that hits and ``304 Not Modified``
+revalidations skip JSON decoding entirely. Each hit gets its own copy of the
+result, so callers may change it freely.
+"""
+import collections
+import email.utils
+import threading
+import time
+
+import graphql
+
+__all__ = 'HttpCache', 'CacheEntry', 'parse_cache_control', 'copy_json'
+
+
+def copy_json(value):
+    """
+    Copies decoded JSON, much faster than :py:func:`copy.deepcopy`.
+    """
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+
+def parse_cache_control(value):
+    """
+    Parses a ``Cache-Control`` header into a dict of directives. Directives
+    without a value map to True.
+    """
+    rv = {}
+    for item in value.split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            rv[name.lower()] = arg.strip('"') if arg else True
+    return rv
+
+
+def get_expires_lifetime(headers):
+    """
+    Gets the freshness lifetime from the ``Expires`` and ``Date`` headers.
+    """
+    try:
+        expires = email.utils.parsedate_to_datetime(headers['Expires'])
+        date = email.utils.parsedate_to_datetime(headers['Date'])
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return (expires - date).total_seconds()
+
+
+def get_lifetime(headers, directives):
+    """
+    Gets the freshness lifetime of a response, in seconds.
+    """
+    if 'no-cache' in directives:
+        return 0
+    try:
+        lifetime = int(directives['max-age'])
+    except (KeyError, ValueError):
+        lifetime = get_expires_lifetime(headers)
+    try:
+        lifetime -= int(headers.get('Age', 0))
+    except ValueError:
+        pass
+    return max(lifetime, 0)
+
+
+class CacheEntry:
+    def __init__(self, result, headers, vary):
+        #: The decoded result, which is never handed out (see
+        #: :py:meth:`get_result`)
+        self.result = graphql.ExecutionResult(
+            data=copy_json(result.data), errors=result.errors, extensions=copy_json(result.extensions),
+        )
+        #: The request headers the response varies on, name -> value
+        self.vary = vary
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.update(headers)
+
+    def update(self, headers):
+        """
+        Refreshes the expiration from the headers of a new response.
+        """
+        directives = parse_cache_control(headers.get('Cache-Control', ''))
+        self.expires = time.monotonic() + get_lifetime(headers, directives)
+
+    def get_result(self):
+        """
+        Gets a copy of the result, for one caller.
+        """
+        return graphql.ExecutionResult(
+            data=copy_json(self.result.data), errors=self.result.errors,
+            extensions=copy_json(self.result.extensions),
+        )
+
+    @property
+    def fresh(self):
+        return time.monotonic() < self.expires
+
+    @property
+    def validators(self):
+        """
+        The headers to send to revalidate the entry.
+        """
+        rv = {}
+        if self.etag is not None:
+            rv['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            rv['If-Modified-Since'] = self.last_modified
+        return rv
+
+
+class HttpCache:
+    """
+    A least-recently-used cache of GET responses, keyed by URL and the request
+    headers named by ``Vary``.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, request):
+        """
+        Finds the entry for a request, if there is one.
+        """
+        key = str(request.url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._entries.move_to_end(key)
+        if all(request.headers.get(name) == value for name, value in entry.vary.items()):
+            return entry
+
+    def store(self, request, response, result):
+        """
+        Stores the decoded result of a response, if its headers allow it.
+        """
+        directives = parse_cache_control(response.headers.get('Cache-Control', ''))
+        if 'no-store' in directives:
+            return
+        vary = [name.strip() for name in response.headers.get('Vary', '').split(',') if name.strip()]
+        if '*' in vary:
+            return
+        entry = CacheEntry(result, response.headers, {name: request.headers.get(name) for name in vary})
+        if not entry.fresh and entry.etag is None and entry.last_modified is None:
+            # Never usable
+            return
+
+        key = str(request.url)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,13 +1,163 @@
 """
 Helpers for using :py:mod:`httpx` to build a provider.
 
-Requires the ``http`` extra.
+Requires the ``http`` extra. Brotli and zstd compression are available if
+:py:mod:`brotli` and :py:mod:`zstandard` are installed (the ``compression``
+extra).
 """
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import email.utils
+import functools
+import gzip
 import json
+import re
+import time
 
 import httpx
 import graphql
 
+from .. import deadlines, limits
+from ..errors import DeadlineExceeded
+from .balancing import LoadBalancer
+from .httpcache import HttpCache
+from .retry import RetryPolicy
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _version(text):
+    return tuple(int(part) for part in re.findall(r'\d+', text)[:3])
+
+
+# httpx only decodes zstd from 0.27.1 on
+_httpx_zstd = _version(httpx.__version__) >= (0, 27, 1)
+
+#: Functions to compress request bodies, by content encoding
+ENCODERS = {
+    'gzip': functools.partial(gzip.compress, compresslevel=6),
+}
+if brotli is not None:
+    ENCODERS['br'] = functools.partial(brotli.compress, quality=5)
+if zstandard is not None:
+    # Compressor objects aren't thread-safe
+    ENCODERS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _accept_encoding():
+    # The response encodings httpx can decode here, best first
+    rv = []
+    if zstandard is not None and _httpx_zstd:
+        rv.append('zstd')
+    if brotli is not None:
+        rv.append('br')
+    rv += ['gzip', 'deflate']
+    return ', '.join(rv)
+
+
+def shorten_timeout(timeout, limit):
+    """
+    Caps every part of an :py:class:`httpx.Timeout` at limit seconds.
+    """
+    return httpx.Timeout(**{
+        name: limit if value is None else min(value, limit)
+        for name, value in timeout.as_dict().items()
+    })
+
+
+@contextlib.contextmanager
+def deadline_errors():
+    """
+    Turns timeouts caused by the deadline into
+    :py:class:`gqlmod.errors.DeadlineExceeded`.
+    """
+    try:
+        yield
+    except httpx.TimeoutException as exc:
+        if _deadline_passed():
+            raise DeadlineExceeded("The deadline passed before the query finished") from exc
+        raise
+
+
+def retarget(req, url):
+    """
+    Copies a request, sending it to another endpoint (keeping any query
+    parameters).
+    """
+    base = httpx.URL(url)
+    headers = httpx.Headers(req.headers)
+    del headers['Host']
+    return httpx.Request(
+        req.method, req.url.copy_with(scheme=base.scheme, host=base.host, port=base.port, path=base.path),
+        headers=headers, content=req.content, extensions=dict(req.extensions),
+    )
+
+
+def _header_number(headers, *names):
+    for name in names:
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            pass
+
+
+def _retry_after(value):
+    # Either seconds or an HTTP date
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return
+    return max(when.timestamp() - time.time(), 0)
+
+
+def rate_limit_feedback(headers):
+    """
+    Reads the rate limit headers of a response (``X-RateLimit-*`` or
+    ``RateLimit-*``, and ``Retry-After``) as keyword arguments for
+    :py:func:`gqlmod.limits.report_rate_limit`.
+    """
+    feedback = {
+        'remaining': _header_number(headers, 'X-RateLimit-Remaining', 'RateLimit-Remaining'),
+        'limit': _header_number(headers, 'X-RateLimit-Limit', 'RateLimit-Limit'),
+        'reset': _header_number(headers, 'X-RateLimit-Reset', 'RateLimit-Reset'),
+    }
+    if feedback['reset'] is not None and feedback['reset'] > 1e9:
+        # A timestamp, rather than seconds from now
+        feedback['reset'] = max(feedback['reset'] - time.time(), 0)
+    if 'Retry-After' in headers:
+        feedback['retry_after'] = _retry_after(headers['Retry-After'])
+    return {key: value for key, value in feedback.items() if value is not None}
+
+
+def _deadline_passed():
+    left = deadlines.remaining()
+    return left is not None and left <= 0
+
+
+def is_query(query):
+    """
+    Checks if a GraphQL document's first operation is a query, by looking at
+    how it starts. (gqlmod always puts the operation first.)
+    """
+    return query.lstrip().startswith(('query', '{'))
+
 
 class HttpxProvider:
     """
@@ -16,12 +166,64 @@ class HttpxProvider:
     You should fill in :py:attr:`endpoint` and possibly override
     :py:meth:`modify_request_args()`.
     """
-    #: The URL to send requests to.
+    #: The URL to send requests to, or a list of URLs of replicas to spread
+    #: requests over (see :py:attr:`balancing`). Requests are built for the
+    #: first one, and sent to the one picked.
     endpoint: str
 
-    #: Timeout policy to use, if any.
+    #: How to pick among several endpoints: ``'round_robin'``,
+    #: ``'least_outstanding'``, or ``'ewma'`` (see
+    #: :py:class:`~gqlmod.helpers.balancing.LoadBalancer`).
+    balancing: str = 'round_robin'
+
+    #: Failures in a row (broken connections and 5xx responses) after which
+    #: an endpoint stops getting requests for a while.
+    eject_after: int = 3
+
+    #: Seconds an endpoint is left out after failing, doubling each time it
+    #: fails again right after being readmitted.
+    eject_time: float = 10.0
+
+    #: Timeout policy to use, if any. (Otherwise, httpx's default is used.)
+    #: Each request's timeout is shortened to the time left before the
+    #: deadline, if there is one.
     timeout: httpx.Timeout = None
 
+    #: Content encoding to compress request bodies with (``'gzip'``, ``'br'``,
+    #: or ``'zstd'``), or None to send them uncompressed. Check with the
+    #: service first; not every server accepts compressed requests.
+    request_encoding: str = None
+
+    #: Only compress request bodies at least this many bytes long.
+    compression_threshold: int = 1024
+
+    #: The ``Accept-Encoding`` header to send. Defaults to every encoding that
+    #: can be decoded here.
+    accept_encoding: str = _accept_encoding()
+
+    #: Send queries (but never mutations) as GET requests, so that they can be
+    #: cached by the service, CDNs, and :py:attr:`http_cache`.
+    use_get: bool = False
+
+    #: Longest URL to send as a GET request; longer ones are POSTed instead.
+    max_get_url_length: int = 2048
+
+    #: Number of GET responses to keep in the local HTTP cache, or 0 to
+    #: disable it.
+    http_cache_size: int = 256
+
+    #: How to retry failed requests (a :py:class:`RetryPolicy`), or None to
+    #: not retry. Only queries are retried after server errors (5xx) and
+    #: broken connections; any request is retried if it couldn't connect.
+    retry_policy: RetryPolicy = None
+
+    #: Send a duplicate of a query if it hasn't been answered after this many
+    #: seconds, using whichever response comes first. None disables hedging.
+    hedge_after: float = None
+
+    #: Most duplicates to send for a single query when hedging.
+    max_hedges: int = 1
+
     _session_sync = None
 
     @property
@@ -40,12 +242,64 @@ class HttpxProvider:
             # Only needs to be a context manager for cleanup reasons.
         return self._session_async
 
+    # endpoint URL -> client, so each endpoint has its own connection pool
+    _endpoint_sessions_sync = None
+    _endpoint_sessions_async = None
+
+    def endpoint_session_sync(self, url):
+        if self._endpoint_sessions_sync is None:
+            self._endpoint_sessions_sync = {}
+        if url not in self._endpoint_sessions_sync:
+            self._endpoint_sessions_sync[url] = httpx.Client()
+        return self._endpoint_sessions_sync[url]
+
+    def endpoint_session_async(self, url):
+        if self._endpoint_sessions_async is None:
+            self._endpoint_sessions_async = {}
+        if url not in self._endpoint_sessions_async:
+            self._endpoint_sessions_async[url] = httpx.AsyncClient()
+        return self._endpoint_sessions_async[url]
+
+    _balancer = None
+
+    @property
+    def balancer(self):
+        """
+        The :py:class:`~gqlmod.helpers.balancing.LoadBalancer` picking
+        endpoints, or None if there is only one.
+        """
+        if self._balancer is None and not isinstance(self.endpoint, str):
+            self._balancer = LoadBalancer(
+                self.endpoint, self.balancing, failure_threshold=self.eject_after, eject_time=self.eject_time,
+            )
+        return self._balancer
+
+    @property
+    def base_endpoint(self):
+        """
+        The URL requests are built for: the endpoint, or the first one.
+        """
+        return self.endpoint if isinstance(self.endpoint, str) else self.endpoint[0]
+
+    _http_cache = None
+
+    @property
+    def http_cache(self):
+        if self._http_cache is None:
+            self._http_cache = HttpCache(self.http_cache_size)
+        return self._http_cache
+
     def build_request(self, query, variables):
         """
         Build the Request object.
 
         Override to add authentication and such.
         """
+        if self.use_get and is_query(query):
+            req = self.build_get_request(query, variables)
+            if req is not None:
+                return req
+
         data = json.dumps({
             'query': query,
             'variables': variables,
@@ -53,30 +307,324 @@ class HttpxProvider:
         headers = {
             'Content-Type': 'application/json',
             'Accept': 'application/json',
+            'Accept-Encoding': self.accept_encoding,
         }
+        data = self.compress_body(data, headers)
 
-        return httpx.Request("POST", self.endpoint, content=data, headers=headers)
+        return httpx.Request("POST", self.base_endpoint, content=data, headers=headers)
 
-    def query_sync(self, query, variables):
-        req = self.build_request(query, variables)
+    def build_get_request(self, query, variables):
+        """
+        Builds a GET request for a query, or returns None if the URL would be
+        too long.
+        """
+        params = {'query': query}
+        if variables:
+            params['variables'] = json.dumps(variables, separators=(',', ':'))
+        url = httpx.URL(self.base_endpoint, params=params)
+        if len(str(url)) > self.max_get_url_length:
+            return
+        headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': self.accept_encoding,
+        }
+        return httpx.Request("GET", url, headers=headers)
+
+    def compress_body(self, data, headers):
+        """
+        Compresses a request body according to :py:attr:`request_encoding`,
+        updating the headers to match.
+        """
+        if self.request_encoding is None or len(data) < self.compression_threshold:
+            return data
+        try:
+            encoder = ENCODERS[self.request_encoding]
+        except KeyError:
+            raise ValueError(f"Can't compress with {self.request_encoding!r}; is its library installed?")
+        headers['Content-Encoding'] = self.request_encoding
+        return encoder(data)
+
+    def apply_timeout(self, req, session):
+        """
+        Sets the timeout of a request: :py:attr:`timeout` (or the session's),
+        shortened to the deadline.
+        """
+        timeout = self.timeout if self.timeout is not None else session.timeout
+        left = deadlines.remaining()
+        if left is not None:
+            timeout = shorten_timeout(timeout, max(left, 0))
+        req.extensions['timeout'] = timeout.as_dict()
+
+    def check_cache(self, req):
+        """
+        Looks up a request in the HTTP cache. Returns the cache entry to use
+        as-is (if it is fresh) and the entry being revalidated (if any). The
+        request is updated with the revalidation headers.
+        """
+        if req.method != 'GET' or not self.http_cache_size:
+            return None, None
+        entry = self.http_cache.lookup(req)
+        if entry is None:
+            return None, None
+        elif entry.fresh:
+            return entry, None
+        else:
+            req.headers.update(entry.validators)
+            return None, entry
+
+    def handle_response(self, req, resp, stale):
+        """
+        Turns a response into an :py:class:`graphql.ExecutionResult`, using and
+        updating the HTTP cache.
+        """
+        if resp.status_code == 304 and stale is not None:
+            stale.update(resp.headers)
+            return stale.get_result()
 
-        resp = self.session_sync.send(req)
         result = resp.json()
 
         assert 'errors' in result or 'data' in result, f'Received non-compatible response "{result}"'
-        return graphql.ExecutionResult(
+        result = graphql.ExecutionResult(
             errors=result.get('errors'),
-            data=result.get('data')
+            data=result.get('data'),
+            extensions=result.get('extensions'),
         )
+        if req.method == 'GET' and self.http_cache_size and resp.status_code == 200 and not result.errors:
+            self.http_cache.store(req, resp, result)
+        return result
 
-    async def query_async(self, query, variables):
+    def should_retry(self, attempt, idempotent, outcome):
+        """
+        Decides if a request should be tried again, given the response or
+        exception of the latest (zero-based) attempt.
+        """
+        policy = self.retry_policy
+        left = deadlines.remaining()
+        if policy is None or not policy.can_retry(attempt) or (left is not None and left <= 0):
+            return False
+        elif isinstance(outcome, (httpx.ConnectError, httpx.ConnectTimeout)):
+            # The request never reached the server
+            return True
+        elif isinstance(outcome, httpx.TransportError):
+            return idempotent
+        elif isinstance(outcome, httpx.Response):
+            return idempotent and outcome.status_code in policy.statuses
+        else:
+            return False
+
+    def transmit_sync(self, req):
+        """
+        Sends a request once, to the endpoint (or the one the balancer picks).
+        """
+        balancer = self.balancer
+        if balancer is None:
+            return self.session_sync.send(req)
+        endpoint = balancer.pick()
+        start = time.monotonic()
+        healthy = None
+        try:
+            resp = self.endpoint_session_sync(endpoint.url).send(retarget(req, endpoint.url))
+            healthy = not balancer.is_failure(resp.status_code)
+            return resp
+        except httpx.TransportError:
+            healthy = None if _deadline_passed() else False
+            raise
+        finally:
+            balancer.finish(endpoint, healthy, time.monotonic() - start)
+
+    async def transmit_async(self, req):
+        """
+        Sends a request once, to the endpoint (or the one the balancer picks).
+        """
+        balancer = self.balancer
+        if balancer is None:
+            return await self.session_async.send(req)
+        endpoint = balancer.pick()
+        start = time.monotonic()
+        # Cancelled requests (like hedges that lost) say nothing about health
+        healthy = None
+        try:
+            resp = await self.endpoint_session_async(endpoint.url).send(retarget(req, endpoint.url))
+            healthy = not balancer.is_failure(resp.status_code)
+            return resp
+        except httpx.TransportError:
+            healthy = None if _deadline_passed() else False
+            raise
+        finally:
+            balancer.finish(endpoint, healthy, time.monotonic() - start)
+
+    def retry_delay(self, attempt, outcome):
+        """
+        How long to wait before retrying: the retry policy's delay, or longer
+        if the response asked for it with ``Retry-After``.
+        """
+        delay = self.retry_policy.delay(attempt)
+        if isinstance(outcome, httpx.Response):
+            delay = max(delay, rate_limit_feedback(outcome.headers).get('retry_after', 0))
+        return delay
+
+    def report_rate_limit(self, resp):
+        """
+        Passes the rate limit headers of a response on to the provider's rate
+        limiter, if it has one (see :py:class:`gqlmod.limits.RateLimiter`).
+        """
+        feedback = rate_limit_feedback(resp.headers)
+        if feedback:
+            limits.report_rate_limit(**feedback)
+
+    _hedge_pool = None
+
+    @property
+    def hedge_pool(self):
+        if self._hedge_pool is None:
+            self._hedge_pool = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='gqlmod-hedge')
+        return self._hedge_pool
+
+    def _submit_hedge(self, req):
+        # In the caller's context, so the deadline is seen
+        return self.hedge_pool.submit(contextvars.copy_context().run, self.transmit_sync, req)
+
+    def _losing(self, resp):
+        # Responses the retry policy would retry lose to any other attempt
+        policy = self.retry_policy
+        return policy is not None and resp.status_code in policy.statuses
+
+    def _pick_hedge(self, done, outcome):
+        """
+        Looks through finished attempts for a winning response. Returns it (or
+        None), and the outcome to give if every attempt fails: a losing
+        response if there is one, or else an exception.
+        """
+        for fut in done:
+            error = fut.exception()
+            if error is not None:
+                if not isinstance(outcome, httpx.Response):
+                    outcome = error
+            elif self._losing(fut.result()):
+                outcome = fut.result()
+            else:
+                return fut.result(), outcome
+        return None, outcome
+
+    @staticmethod
+    def _hedges_failed(outcome):
+        if isinstance(outcome, httpx.Response):
+            return outcome
+        raise outcome
+
+    def send_hedged_sync(self, req):
+        """
+        Sends a request, sending duplicates if it takes too long or fails.
+        Returns the first successful response, or the last failure if every
+        attempt failed.
+
+        Threads can't be interrupted, so losing requests are left to finish in
+        the background.
+        """
+        pending = {self._submit_hedge(req)}
+        hedges = 0
+        outcome = None
+        while pending:
+            timeout = self.hedge_after if hedges < self.max_hedges else None
+            done, pending = concurrent.futures.wait(
+                pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            winner, outcome = self._pick_hedge(done, outcome)
+            if winner is not None:
+                for loser in pending:
+                    loser.cancel()
+                return winner
+            if hedges < self.max_hedges and (not done or not pending):
+                # Too slow, or every attempt so far failed
+                pending.add(self._submit_hedge(req))
+                hedges += 1
+        return self._hedges_failed(outcome)
+
+    async def send_hedged_async(self, req):
+        """
+        Sends a request, sending duplicates if it takes too long or fails.
+        Returns the first successful response (cancelling the rest), or the
+        last failure if every attempt failed.
+        """
+        pending = {asyncio.ensure_future(self.transmit_async(req))}
+        hedges = 0
+        outcome = None
+        try:
+            while pending:
+                timeout = self.hedge_after if hedges < self.max_hedges else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                winner, outcome = self._pick_hedge(done, outcome)
+                if winner is not None:
+                    return winner
+                if hedges < self.max_hedges and (not done or not pending):
+                    # Too slow, or every attempt so far failed
+                    pending.add(asyncio.ensure_future(self.transmit_async(req)))
+                    hedges += 1
+            return self._hedges_failed(outcome)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def send_sync(self, req, idempotent):
+        """
+        Sends a request, applying the retry and hedging policies.
+        """
+        hedge = idempotent and self.hedge_after is not None
+        attempt = 0
+        while True:
+            deadlines.check()
+            self.apply_timeout(req, self.session_sync)
+            try:
+                outcome = self.send_hedged_sync(req) if hedge else self.transmit_sync(req)
+            except httpx.TransportError as exc:
+                if not self.should_retry(attempt, idempotent, exc):
+                    raise
+                outcome = exc
+            else:
+                self.report_rate_limit(outcome)
+                if not self.should_retry(attempt, idempotent, outcome):
+                    return outcome
+            time.sleep(deadlines.bound(self.retry_delay(attempt, outcome)))
+            attempt += 1
+
+    async def send_async(self, req, idempotent):
+        """
+        Sends a request, applying the retry and hedging policies.
+        """
+        hedge = idempotent and self.hedge_after is not None
+        attempt = 0
+        while True:
+            deadlines.check()
+            self.apply_timeout(req, self.session_async)
+            try:
+                outcome = await (self.send_hedged_async(req) if hedge else self.transmit_async(req))
+            except httpx.TransportError as exc:
+                if not self.should_retry(attempt, idempotent, exc):
+                    raise
+                outcome = exc
+            else:
+                self.report_rate_limit(outcome)
+                if not self.should_retry(attempt, idempotent, outcome):
+                    return outcome
+            await asyncio.sleep(deadlines.bound(self.retry_delay(attempt, outcome)))
+            attempt += 1
+
+    def query_sync(self, query, variables):
         req = self.build_request(query, variables)
+        cached, stale = self.check_cache(req)
+        if cached is not None:
+            return cached.get_result()
 
-        resp = await self.session_sync.send(req)
-        result = resp.json()
+        with deadline_errors():
+            resp = self.send_sync(req, is_query(query))
+        return self.handle_response(req, resp, stale)
 
-        assert 'errors' in result or 'data' in result, f'Received non-compatible response "{result}"'
-        return graphql.ExecutionResult(
-            errors=result.get('errors'),
-            data=result.get('data')
-        )
+    async def query_async(self, query, variables):
+        req = self.build_request(query, variables)
+        cached, stale = self.check_cache(req)
+        if cached is not None:
+            return cached.get_result()
+
+        with deadline_errors():
+            resp = await self.send_async(req, is_query(query))
+        return self.handle_response(req, resp, stale)
@@ -0,0 +1,205 @@
+"""
+Running the queries of in-process providers in worker processes.
+
+Providers that execute queries themselves (like ``gqlmod_starwars``) spend
+their time in graphql-core, holding the GIL, so threads don't help them use
+more than one core. :py:class:`ProcessPoolProvider` runs such a provider in a
+pool of processes instead::
+
+    with _mock_provider('starwars', ProcessPoolProvider(StarWarsProvider, {'size': 100_000})):
+        ...
+
+Each worker builds its own instance of the provider (and its schema) once, when
+it starts. Results come back as compact :py:mod:`marshal` blobs, rather than
+pickled :py:class:`graphql.ExecutionResult` objects with their error
+tracebacks and AST nodes.
+
+Sending a query to another process costs more than running a small one, so
+operations estimated (by :py:func:`gqlmod.cost.estimate_cost`) to return fewer
+than ``threshold`` values run in the calling thread, on a local instance of the
+provider. So do operations the estimate doesn't cover, like introspection.
+Operations are estimated against the provider's executable schema, or else the
+one from its ``get_schema_str()``; providers with neither send every operation
+to the pool.
+"""
+import asyncio
+import concurrent.futures
+import marshal
+import pickle
+import threading
+
+import graphql
+
+from .. import deadlines
+from ..cost import estimate_cost
+from .recording import result_from_json, result_to_json
+from .types import annotate
+
+__all__ = 'ProcessPoolProvider', 'pack_result', 'unpack_result'
+
+# The provider of this worker process
+_worker = None
+
+
+def _start_worker(factory, kwargs):
+    global _worker
+    _worker = factory(**kwargs)
+    # Build the schema now, not during the first query
+    get_schema = getattr(_worker, 'get_executable_schema', None)
+    if get_schema is not None:
+        get_schema()
+
+
+def _run_in_worker(query, variables):
+    return pack_result(_worker.query_sync(query, variables))
+
+
+def pack_result(result):
+    """
+    Serializes a result (an :py:class:`graphql.ExecutionResult` or dict) to
+    send it between processes.
+    """
+    payload = result_to_json(result)
+    try:
+        return b'M' + marshal.dumps(payload)
+    except ValueError:
+        # Custom scalars can serialize to values marshal doesn't handle
+        return b'P' + pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_result(blob):
+    """
+    Undoes :py:func:`pack_result`, giving an :py:class:`graphql.ExecutionResult`.
+    """
+    if blob[:1] == b'M':
+        payload = marshal.loads(blob[1:])
+    else:
+        payload = pickle.loads(blob[1:])
+    return result_from_json(payload)
+
+
+class ProcessPoolProvider:
+    """
+    Wraps an in-process provider, running its queries in a pool of worker
+    processes.
+
+    factory (a picklable callable, usually the provider class) is called with
+    kwargs to build the provider, once in each worker and once locally.
+    Operations estimated to return fewer than threshold values, or that the
+    estimate doesn't cover, run locally; without a schema to estimate with,
+    every operation goes to the pool. workers and mp_context are passed on to
+    :py:class:`concurrent.futures.ProcessPoolExecutor`.
+
+    Other attributes (like ``get_schema_str()``) are passed through to the
+    local provider.
+    """
+    def __init__(self, factory, kwargs=None, *, workers=None, threshold=1000, mp_context=None):
+        self.factory = factory
+        self.kwargs = kwargs or {}
+        self.workers = workers
+        self.threshold = threshold
+        self.mp_context = mp_context
+        #: Queries run locally and in the pool
+        self.local_calls = self.pooled_calls = 0
+        self._local = self._pool = self._schema = None
+        # query -> whether it runs locally
+        self._cheap = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.local, name)
+
+    @property
+    def local(self):
+        """
+        The instance of the provider in this process.
+        """
+        with self._lock:
+            if self._local is None:
+                self._local = self.factory(**self.kwargs)
+            return self._local
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=self.mp_context,
+                    initializer=_start_worker, initargs=(self.factory, self.kwargs),
+                )
+            return self._pool
+
+    @property
+    def schema(self):
+        """
+        The schema operations are estimated against, if the provider has one.
+        """
+        if self._schema is None:
+            local = self.local
+            if hasattr(local, 'get_executable_schema'):
+                self._schema = local.get_executable_schema()
+            elif hasattr(local, 'get_schema_str'):
+                self._schema = graphql.build_schema(local.get_schema_str())
+        return self._schema
+
+    def _estimate(self, query):
+        schema = self.schema
+        if schema is None:
+            return
+        document = graphql.parse(query, no_location=True)
+        try:
+            annotate(document, schema)
+            [definition] = [
+                defin for defin in document.definitions if isinstance(defin, graphql.OperationDefinitionNode)
+            ]
+            return estimate_cost(definition, schema).nodes
+        except (ValueError, LookupError, TypeError):
+            # Introspection, or something else the estimate doesn't cover
+            return 0
+
+    def is_cheap(self, query):
+        """
+        Checks if a query should run locally.
+        """
+        if query not in self._cheap:
+            nodes = self._estimate(query)
+            self._cheap[query] = nodes is not None and nodes < self.threshold
+        return self._cheap[query]
+
+    def query_sync(self, query, variables):
+        if self.is_cheap(query):
+            self.local_calls += 1
+            return self.local.query_sync(query, variables)
+        self.pooled_calls += 1
+        deadlines.check()
+        future = self.pool.submit(_run_in_worker, query, variables)
+        try:
+            blob = future.result(deadlines.bound(None))
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            deadlines.check()
+            raise
+        return unpack_result(blob)
+
+    async def query_async(self, query, variables):
+        if self.is_cheap(query):
+            self.local_calls += 1
+            return await self.local.query_async(query, variables)
+        self.pooled_calls += 1
+        loop = asyncio.get_running_loop()
+        blob = await loop.run_in_executor(self.pool, _run_in_worker, query, variables)
+        return unpack_result(blob)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,205 @@
+"""
+Providers to record real traffic and replay it, for offline load testing.
+
+:py:class:`RecordingProvider` wraps any provider and writes each (query,
+variables) → response pair, with its latency, to a cassette file.
+:py:class:`ReplayProvider` serves the responses back from the cassette, with
+modelled latency. Schema introspection is recorded like any other query, so a
+cassette recorded from process start can replay imports too.
+
+Install them with :py:func:`gqlmod.providers._mock_provider`::
+
+    with _mock_provider('github', RecordingProvider(GithubProvider(), 'github.cassette')):
+        ...
+
+    with _mock_provider('github', ReplayProvider('github.cassette', latency='percentile')):
+        ...
+"""
+import asyncio
+import hashlib
+import json
+import mmap
+import random
+import struct
+import threading
+import time
+
+import graphql
+
+__all__ = 'RecordingProvider', 'ReplayProvider', 'CassetteMiss'
+
+MAGIC = b'GQLCAS01'
+
+#: Each record is a header (key digest, latency in seconds, payload length)
+#: followed by the JSON payload
+RECORD = struct.Struct('<16sdI')
+
+
+class CassetteMiss(LookupError):
+    """
+    The cassette has no response for the query and variables.
+    """
+
+
+def cassette_key(query, variables):
+    """
+    Computes the lookup key of a query and its variables.
+    """
+    blob = json.dumps([query, variables], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(blob.encode('utf-8'), digest_size=16).digest()
+
+
+def result_to_json(result):
+    if isinstance(result, dict):
+        return result
+    rv = {'data': result.data}
+    if result.errors:
+        rv['errors'] = [err.formatted for err in result.errors]
+    if result.extensions:
+        rv['extensions'] = result.extensions
+    return rv
+
+
+def result_from_json(payload):
+    errors = payload.get('errors')
+    if errors:
+        errors = [
+            graphql.GraphQLError(err.get('message'), path=err.get('path'), extensions=err.get('extensions'))
+            for err in errors
+        ]
+    return graphql.ExecutionResult(data=payload.get('data'), errors=errors or None, extensions=payload.get('extensions'))
+
+
+class RecordingProvider:
+    """
+    Wraps a provider, recording every query to a cassette file (appending if
+    it already exists).
+
+    Other attributes (like ``get_schema_str()``) are passed through to the
+    wrapped provider.
+    """
+    def __init__(self, provider, path):
+        self.provider = provider
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    def record(self, query, variables, result, latency):
+        payload = json.dumps(result_to_json(result), separators=(',', ':')).encode('utf-8')
+        header = RECORD.pack(cassette_key(query, variables), latency, len(payload))
+        with self._lock:
+            self._file.write(header + payload)
+            self._file.flush()
+
+    def query_sync(self, query, variables):
+        start = time.perf_counter()
+        result = self.provider.query_sync(query, variables)
+        self.record(query, variables, result, time.perf_counter() - start)
+        return result
+
+    async def query_async(self, query, variables):
+        start = time.perf_counter()
+        result = await self.provider.query_async(query, variables)
+        self.record(query, variables, result, time.perf_counter() - start)
+        return result
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayProvider:
+    """
+    Serves responses from a cassette file.
+
+    The file is memory-mapped and indexed when opened; lookups are a single
+    dict access. If a query was recorded several times, the last response is
+    used.
+
+    latency models how long each query takes:
+
+    * ``'recorded'``: a latency recorded for that query
+    * ``'percentile'``: a latency sampled from all the recorded latencies
+    * a number: that many seconds
+    * None: no delay
+    """
+    def __init__(self, path, latency='recorded', *, seed=None):
+        self.path = path
+        self.latency = latency
+        self._random = random.Random(seed)
+        with open(path, 'rb') as fobj:
+            self._map = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a gqlmod cassette")
+        self._index = {}
+        self._latencies = {}
+        self._build_index()
+        self._all_latencies = sorted(lat for lats in self._latencies.values() for lat in lats)
+
+    def _build_index(self):
+        offset = len(MAGIC)
+        size = len(self._map)
+        while offset + RECORD.size <= size:
+            key, latency, length = RECORD.unpack_from(self._map, offset)
+            offset += RECORD.size
+            if offset + length > size:
+                # Truncated by an interrupted recording
+                break
+            self._index[key] = offset, length
+            self._latencies.setdefault(key, []).append(latency)
+            offset += length
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, query, variables):
+        """
+        Gets the recorded result, and the key it is stored under.
+        """
+        key = cassette_key(query, variables)
+        try:
+            offset, length = self._index[key]
+        except KeyError:
+            raise CassetteMiss(f"No recorded response for this query (key {key.hex()})")
+        return key, result_from_json(json.loads(self._map[offset:offset + length]))
+
+    def latency_for(self, key):
+        """
+        Picks how long a query should take, in seconds.
+        """
+        if self.latency is None:
+            return 0
+        elif self.latency == 'recorded':
+            return self._random.choice(self._latencies[key])
+        elif self.latency == 'percentile':
+            # Inverse transform sampling of the empirical distribution
+            return self._all_latencies[int(self._random.random() * len(self._all_latencies))]
+        else:
+            return float(self.latency)
+
+    def query_sync(self, query, variables):
+        key, result = self.lookup(query, variables)
+        delay = self.latency_for(key)
+        if delay:
+            time.sleep(delay)
+        return result
+
+    async def query_async(self, query, variables):
+        key, result = self.lookup(query, variables)
+        delay = self.latency_for(key)
+        if delay:
+            await asyncio.sleep(delay)
+        return result
+
+    def close(self):
+        self._map.close()
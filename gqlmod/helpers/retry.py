@@ -0,0 +1,41 @@
+"""
+Retry policies for providers.
+"""
+import random
+
+__all__ = 'RetryPolicy',
+
+
+class RetryPolicy:
+    """
+    How many times to try a request, and how long to wait in between.
+
+    Waits grow exponentially from ``backoff`` by ``multiplier`` up to
+    ``max_backoff``. With ``jitter``, each wait is a random amount up to that
+    ("full jitter"), which keeps many clients from retrying in lockstep.
+    """
+    def __init__(self, attempts=3, *, backoff=0.1, multiplier=2.0, max_backoff=5.0, jitter=True,
+                 statuses=(500, 502, 503, 504)):
+        #: Total number of tries, including the first one
+        self.attempts = attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        #: HTTP status codes worth retrying
+        self.statuses = frozenset(statuses)
+
+    def delay(self, attempt):
+        """
+        How long to wait after the given (zero-based) failed attempt.
+        """
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def can_retry(self, attempt):
+        """
+        Checks if there are tries left after the given (zero-based) attempt.
+        """
+        return attempt + 1 < self.attempts
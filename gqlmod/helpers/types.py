@@ -69,9 +69,9 @@ class TypeAnnotationVisitor(graphql.Visitor):
             schema = self.schema.subscription_type
         setattr(node, SCHEMA_ATTR, schema)
 
-    def leave_fragment_definition(self, node, key, parent, path, ancestors):
-        # Copy type from the type
-        t = get_type(node.type_condition)
+    def enter_fragment_definition(self, node, key, parent, path, ancestors):
+        # Needed before the selections are visited, so look it up directly
+        t = self.schema.get_type(node.type_condition.name.value)
         assert t is not None
         setattr(node, SCHEMA_ATTR, t)
 
@@ -218,9 +218,11 @@ class TypeAnnotationVisitor(graphql.Visitor):
 
 
 class RefAnnotationVisitor(graphql.Visitor):
-    def __init__(self):
+    def __init__(self, fragments=None):
         # A believe only a single scope can be active
         self.scope = None
+        # Fragments defined outside the document (name -> definition)
+        self.fragments = fragments or {}
 
     def enter_operation_definition(self, node, key, parent, path, ancestors):
         assert self.scope is None
@@ -234,13 +236,15 @@ class RefAnnotationVisitor(graphql.Visitor):
         self.scope = None
 
     def enter_variable(self, node, key, parent, path, ancestors):
-        assert self.scope is not None
+        if self.scope is None:
+            # In a fragment definition, which may be used by several operations
+            return
         setattr(node, DEF_ATTR, self.scope[node.name.value])
 
     def enter_fragment_spread(self, node, key, parent, path, ancestors):
         # Find the document
         for doc in reversed(ancestors):
-            if getattr(doc, 'kind') == 'document':
+            if getattr(doc, 'kind', None) == 'document':
                 break
         else:
             return
@@ -250,14 +254,19 @@ class RefAnnotationVisitor(graphql.Visitor):
             if defi.kind == 'fragment_definition' and defi.name.value == node.name.value:
                 break
         else:
-            return
+            defi = self.fragments.get(node.name.value)
+            if defi is None:
+                return
 
         setattr(node, DEF_ATTR, defi)
 
 
-def annotate(ast, schema):
+def annotate(ast, schema, fragments=None):
     """
     Scans the AST and builds type information from the schema
+
+    fragments maps names to the (already annotated) definitions of fragments
+    imported from elsewhere.
     """
-    graphql.visit(ast, RefAnnotationVisitor())
+    graphql.visit(ast, RefAnnotationVisitor(fragments))
     graphql.visit(ast, TypeAnnotationVisitor(schema))
@@ -1,5 +1,7 @@
 import graphql
 
+from .types import get_definition
+
 __all__ = 'unwrap_type', 'walk_query', 'walk_variables'
 
 
@@ -57,17 +59,35 @@ def get_schema_fields(snode):
         raise TypeError(f"Dunno how to get the fields for {snode!r}")
 
 
-def walk_query_node(path, qnode, snode, schema):
+def get_fragment_type(qfield, snode, schema):
+    """
+    Gets the schema type a fragment (inline or spread) applies to.
+    """
+    if qfield.type_condition is None:
+        return snode
+    return schema.get_type(qfield.type_condition.name.value)
+
+
+def walk_query_node(path, qnode, snode, schema):  # noqa: C901
     for qfield in qnode.selection_set.selections:
         if isinstance(qfield, graphql.InlineFragmentNode):
             # Nothing to do on this field, just populate stuff for the recursion
-            type_name = qfield.type_condition.name.value
-            sfield = schema.get_type(type_name)
+            sfield = get_fragment_type(qfield, snode, schema)
             fpath = path
+        elif isinstance(qfield, graphql.FragmentSpreadNode):
+            # Requires the reference annotations from annotate()
+            fragment = get_definition(qfield)
+            if fragment is None:
+                raise TypeError(f"Fragment {qfield.name.value} has not been resolved")
+            yield from walk_query_node(path, fragment, get_fragment_type(fragment, snode, schema), schema)
+            continue
         elif isinstance(qfield, graphql.FieldNode):
             name = qfield.name.value
             fpath = path + (name,)
-            sfield = get_schema_fields(snode)[name]
+            if name == '__typename':
+                sfield = graphql.TypeNameMetaFieldDef
+            else:
+                sfield = get_schema_fields(snode)[name]
             yield fpath, qfield, sfield
         else:
             raise TypeError(f"Can't handle a {type(qfield)} ({qfield!r})")
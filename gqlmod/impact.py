@@ -0,0 +1,351 @@
+"""
+Finding the operations affected by a schema change.
+
+Every operation is indexed by the schema coordinates it uses: types
+(``Character``), fields (``Query.hero``), arguments (``Query.hero(episode:)``),
+input fields (``ReviewInput.stars``), enum values (``Episode.EMPIRE``), and
+directives (``@include``). Comparing two versions of a schema gives the
+coordinates that changed, and only the operations using them need to be checked
+again.
+
+The index is kept in a JSON file, mapping each coordinate to the operations
+using it, so finding the affected operations only looks up the changed
+coordinates. A file's entries are only rebuilt when it (or a fragment library
+it imports) changes.
+"""
+import json
+import os
+
+import graphql
+
+from .importer import read_code, used_fragments, validate
+from .providers import insert_builtins
+
+__all__ = 'ImpactIndex', 'operation_coordinates', 'schema_changes', 'check_affected'
+
+INDEX_VERSION = 2
+
+
+# Reading
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_document(path, _loading=()):
+    """
+    Parses a .gql file, along with the fragment libraries it imports (without
+    checking anything).
+
+    Returns the document, the imported fragments (name -> definition), and
+    the imported paths.
+    """
+    with open(path, 'rt', encoding='utf-8') as fobj:
+        _, imports, code, has_code = read_code(fobj)
+    gast = graphql.parse(graphql.Source(code, path)) if has_code else graphql.DocumentNode(definitions=[])
+    fragments = {}
+    imported = []
+    for name in imports:
+        libpath = os.path.abspath(os.path.join(os.path.dirname(path), name))
+        if libpath in _loading or not os.path.exists(libpath):
+            # Validation reports the missing fragments
+            continue
+        libast, libfrags, libimported = read_document(libpath, (*_loading, path))
+        fragments.update(libfrags)
+        fragments.update(
+            (defin.name.value, defin)
+            for defin in libast.definitions
+            if defin.kind == 'fragment_definition'
+        )
+        imported += [libpath, *libimported]
+    return gast, fragments, imported
+
+
+def document_fragments(gast, imported):
+    """
+    Combines the imported fragments with those defined in the document.
+    """
+    fragments = dict(imported)
+    fragments.update(
+        (defin.name.value, defin)
+        for defin in gast.definitions
+        if defin.kind == 'fragment_definition'
+    )
+    return fragments
+
+
+def load_schema(path):
+    """
+    Loads a schema from an SDL file.
+    """
+    with open(path, 'rt', encoding='utf-8') as fobj:
+        return insert_builtins(graphql.build_schema(fobj.read()))
+
+
+# Coordinates
+class CoordinateVisitor(graphql.Visitor):
+    """
+    Collects the schema coordinates used by a document, with a TypeInfo
+    visitor tracking the types.
+    """
+    def __init__(self, type_info):
+        self.type_info = type_info
+        self.coordinates = set()
+
+    def enter_named_type(self, node, *_):
+        self.coordinates.add(node.name.value)
+
+    def enter_field(self, node, *_):
+        parent = self.type_info.get_parent_type()
+        if parent is not None and not node.name.value.startswith('__'):
+            self.coordinates.add(f"{parent.name}.{node.name.value}")
+            ftype = self.type_info.get_type()
+            if ftype is not None:
+                self.coordinates.add(graphql.get_named_type(ftype).name)
+
+    def enter_directive(self, node, *_):
+        self.coordinates.add(f"@{node.name.value}")
+
+    def enter_argument(self, node, key, parent, path, ancestors):
+        directive = self.type_info.get_directive()
+        ptype = self.type_info.get_parent_type()
+        if directive is not None:
+            self.coordinates.add(f"@{directive.name}({node.name.value}:)")
+        elif ptype is not None and self.type_info.get_field_def() is not None:
+            # The field node owns the argument list
+            self.coordinates.add(f"{ptype.name}.{ancestors[-1].name.value}({node.name.value}:)")
+
+    def enter_object_field(self, node, *_):
+        parent = self.type_info.get_parent_input_type()
+        if parent is not None:
+            self.coordinates.add(f"{graphql.get_named_type(parent).name}.{node.name.value}")
+
+    def enter_enum_value(self, node, *_):
+        itype = self.type_info.get_input_type()
+        if itype is not None:
+            self.coordinates.add(f"{graphql.get_named_type(itype).name}.{node.value}")
+
+
+def operation_coordinates(schema, definition, fragments=None):
+    """
+    Gets the schema coordinates used by an operation, including through the
+    fragments (name -> definition) it spreads.
+    """
+    used = used_fragments([definition], fragments or {})
+    document = graphql.DocumentNode(definitions=[definition, *used.values()])
+    type_info = graphql.TypeInfo(schema)
+    visitor = CoordinateVisitor(type_info)
+    graphql.visit(document, graphql.TypeInfoVisitor(type_info, visitor))
+    return visitor.coordinates
+
+
+# Schema changes
+def _members(stype):
+    """
+    Produces the coordinates of a type and everything in it.
+    """
+    yield stype.name
+    for name, field in getattr(stype, 'fields', {}).items():
+        yield f"{stype.name}.{name}"
+        for arg in getattr(field, 'args', {}):
+            yield f"{stype.name}.{name}({arg}:)"
+    for name in getattr(stype, 'values', {}):
+        yield f"{stype.name}.{name}"
+
+
+def _is_required(arg):
+    return graphql.is_required_argument(arg) if isinstance(arg, graphql.GraphQLArgument) \
+        else graphql.is_required_input_field(arg)
+
+
+def _args_changes(coord, old, new):
+    """
+    Compares the arguments of a field or directive.
+    """
+    changed = set()
+    for name in old.keys() | new.keys():
+        oarg, narg = old.get(name), new.get(name)
+        if oarg is None or narg is None or str(oarg.type) != str(narg.type) \
+                or oarg.default_value != narg.default_value:
+            changed.add(f"{coord}({name}:)")
+            if oarg is None and _is_required(narg):
+                # A new required argument breaks every use of the field
+                changed.add(coord)
+    return changed
+
+
+def _fields_changes(old, new):
+    changed = set()
+    for name in old.fields.keys() | new.fields.keys():
+        ofield, nfield = old.fields.get(name), new.fields.get(name)
+        coord = f"{new.name}.{name}"
+        if ofield is None or nfield is None:
+            changed.add(coord)
+            if ofield is None and graphql.is_input_object_type(new) and _is_required(nfield):
+                changed.add(new.name)
+        elif str(ofield.type) != str(nfield.type):
+            changed.add(coord)
+        elif hasattr(ofield, 'args'):
+            changed |= _args_changes(coord, ofield.args, nfield.args)
+    return changed
+
+
+def _type_changes(old, new):
+    if old is None or new is None or type(old) is not type(new):
+        return {coord for stype in (old, new) if stype is not None for coord in _members(stype)}
+    changed = set()
+    if hasattr(new, 'fields'):
+        changed |= _fields_changes(old, new)
+    if hasattr(new, 'values'):
+        changed |= {f"{new.name}.{name}" for name in old.values.keys() ^ new.values.keys()}
+    if graphql.is_union_type(new) or hasattr(new, 'interfaces'):
+        members = new.types if graphql.is_union_type(new) else new.interfaces
+        omembers = old.types if graphql.is_union_type(old) else old.interfaces
+        if {t.name for t in members} != {t.name for t in omembers}:
+            changed.add(new.name)
+    return changed
+
+
+def schema_changes(old, new):
+    """
+    Gets the coordinates that differ between two versions of a schema.
+    """
+    changed = set()
+    for name in old.type_map.keys() | new.type_map.keys():
+        if not name.startswith('__'):
+            changed |= _type_changes(old.type_map.get(name), new.type_map.get(name))
+    odirs = {d.name: d for d in old.directives}
+    ndirs = {d.name: d for d in new.directives}
+    for name in odirs.keys() | ndirs.keys():
+        odir, ndir = odirs.get(name), ndirs.get(name)
+        if odir is None or ndir is None or set(odir.locations) != set(ndir.locations):
+            changed.add(f"@{name}")
+        else:
+            changed |= _args_changes(f"@{name}", odir.args, ndir.args)
+    return changed
+
+
+# The index
+class ImpactIndex:
+    """
+    Maps schema coordinates to the operations using them, persisted as JSON.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        #: path -> stats and operations of the file
+        self.files = {}
+        #: coordinate -> path -> positions of the operations using it in the
+        #: file's list
+        self.coordinates = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'rt', encoding='utf-8') as fobj:
+                data = json.load(fobj)
+            if data.get('version') == INDEX_VERSION:
+                self.files = data['files']
+                self.coordinates = data['coordinates']
+
+    def save(self):
+        with open(self.path, 'wt', encoding='utf-8') as fobj:
+            json.dump({'version': INDEX_VERSION, 'files': self.files, 'coordinates': self.coordinates}, fobj)
+
+    def _is_current(self, path, entry):
+        try:
+            return entry['stat'] == _stat(path) and all(
+                _stat(lib) == stat for lib, stat in entry['imports'].items()
+            )
+        except (KeyError, OSError):
+            return False
+
+    def index_file(self, path, schema):
+        """
+        (Re)builds the entry of a file, using the schema it was written for.
+        """
+        gast, imported, libs = read_document(path)
+        fragments = document_fragments(gast, imported)
+        operations = []
+        for defin in gast.definitions:
+            if defin.kind == 'operation_definition':
+                tok = defin.loc.start_token
+                operations.append({
+                    'name': defin.name.value if defin.name else None,
+                    'line': tok.line,
+                    'column': tok.column,
+                    'coordinates': sorted(operation_coordinates(schema, defin, fragments)),
+                })
+        self.forget_file(path)
+        self.files[path] = {
+            'stat': _stat(path),
+            'imports': {lib: _stat(lib) for lib in libs},
+            'operations': operations,
+        }
+        for position, operation in enumerate(operations):
+            for coord in operation['coordinates']:
+                self.coordinates.setdefault(coord, {}).setdefault(path, []).append(position)
+
+    def forget_file(self, path):
+        """
+        Removes the entries of a file.
+        """
+        entry = self.files.pop(path, None)
+        if entry is None:
+            return
+        for operation in entry['operations']:
+            for coord in operation['coordinates']:
+                users = self.coordinates.get(coord, {})
+                users.pop(path, None)
+                if not users:
+                    self.coordinates.pop(coord, None)
+
+    def update(self, paths, schema):
+        """
+        Brings the index up to date for the given files, forgetting any others.
+
+        Returns the number of files that were (re)indexed, and the syntax
+        errors of files that couldn't be.
+        """
+        paths = {os.path.abspath(path) for path in paths}
+        for path in self.files.keys() - paths:
+            self.forget_file(path)
+        stale = [path for path in sorted(paths) if not self._is_current(path, self.files.get(path, {}))]
+        errors = []
+        for path in stale:
+            try:
+                self.index_file(path, schema)
+            except graphql.GraphQLError as err:
+                self.forget_file(path)
+                errors.append(err)
+        return len(stale), errors
+
+    def affected(self, coordinates):
+        """
+        Finds the operations using any of the given coordinates.
+
+        Produces (path, entry, used coordinates) for each operation.
+        """
+        used = {}
+        for coord in set(coordinates):
+            for path, positions in self.coordinates.get(coord, {}).items():
+                for position in positions:
+                    used.setdefault((path, position), []).append(coord)
+        for (path, position), coords in sorted(used.items()):
+            yield path, self.files[path]['operations'][position], sorted(coords)
+
+
+def check_affected(path, operations, schema):
+    """
+    Validates some operations (index entries) of a file against a schema.
+
+    Produces (operation, errors) for each.
+    """
+    gast, imported, _ = read_document(path)
+    fragments = document_fragments(gast, imported)
+    by_position = {
+        (defin.loc.start_token.line, defin.loc.start_token.column): defin
+        for defin in gast.definitions
+        if defin.kind == 'operation_definition'
+    }
+    for operation in operations:
+        defin = by_position.get((operation['line'], operation['column']))
+        if defin is None:
+            continue
+        yield operation, validate(schema, graphql.DocumentNode(definitions=[defin]), fragments)
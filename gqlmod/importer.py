@@ -3,26 +3,84 @@ Allows importing .gql files as Python modules, tied into the rest of the
 library.
 """
 import ast
+import contextlib
+import contextvars
+import importlib.util
+import os
+import pathlib
 import sys
+import threading
+import typing
 
 import graphql
+from graphql.utilities import strip_ignored_characters
 from import_x import ExtensionLoader
 
-from . import _mod_impl
+from . import _mod_impl, profiling, settings
+from .codecs import CodecOperation, build_codec
+from .compiler import CompiledOperation, compile_operation, supports_plans
+from .cost import enforce_cost_limits
+from .entities import CachedOperation, add_identity_fields
 from .errors import MissingProviderError, from_graphql_validate
-from .providers import query_for_schema, get_additional_kwargs
-from .helpers.types import annotate
+from .providers import get_additional_kwargs, get_provider, query_for_schema
+from .pruning import prune_document
+from .helpers.types import annotate, get_definition
+from .variables import build_validator
 
 
-def build_func(provider, definition, schema, is_async):
+class Operation(typing.NamedTuple):
+    """
+    What a generated function runs, kept as its ``__graphql__`` attribute.
+    """
+    provider: str
+    definition: graphql.OperationDefinitionNode
+    schema: graphql.GraphQLSchema
+    #: Checks and coerces the variables, if enabled
+    validator: typing.Callable = None
+    #: Encodes the variables and decodes the results, if there is anything to
+    #: convert
+    codec: CodecOperation = None
+
+
+def build_func(provider, definition, schema, is_async, validator=None, runner=None):
     """
     Builds a python function from a GraphQL AST definition
+
+    If given, validator is the global name of a variable validator to pass the
+    variables through, and runner is the global name of an object whose
+    ``query_sync()``/``query_async()`` to call instead of the usual query
+    functions (like a :py:class:`gqlmod.entities.CachedOperation`).
     """
     name = definition.name.value
-    source = graphql.print_ast(definition)
+    pretty, wire = build_source(definition)
+    source = wire if settings.minify_queries else pretty
     assert definition.operation != graphql.OperationType.SUBSCRIPTION
     params = [build_param(var) for var in definition.variable_definitions]
-    query_func = '__aquery__' if is_async else '__query__'
+    if runner is None:
+        query_func = ast.Name(id='__aquery__' if is_async else '__query__', ctx=ast.Load())
+    else:
+        query_func = ast.Attribute(
+            value=ast.Name(id=runner, ctx=ast.Load()),
+            attr='query_async' if is_async else 'query_sync',
+            ctx=ast.Load(),
+        )
+
+    if validator is None:
+        variables = [
+            ast.keyword(arg=name, value=ast.Name(id=name, ctx=ast.Load()))
+            for name, _ in params
+        ]
+    else:
+        variables = [
+            ast.keyword(arg=None, value=ast.Call(
+                func=ast.Name(id=validator, ctx=ast.Load()),
+                args=[ast.Dict(
+                    keys=[value2pyliteral(name) for name, _ in params],
+                    values=[ast.Name(id=name, ctx=ast.Load()) for name, _ in params],
+                )],
+                keywords=[],
+            )),
+        ]
 
     # TODO: Line numbers
 
@@ -33,6 +91,8 @@ def build_func(provider, definition, schema, is_async):
     else:
         py38 = {}
 
+    docstring = ast.Expr(value=value2pyliteral(pretty))
+
     return ast.FunctionDef(
         name=name,
         args=ast.arguments(
@@ -45,18 +105,16 @@ def build_func(provider, definition, schema, is_async):
             **py38
         ),
         body=[
+            docstring,
             ast.Return(
                 value=ast.Call(
-                    func=ast.Name(id=query_func, ctx=ast.Load()),
+                    func=query_func,
                     args=[
                         value2pyliteral(provider),
                         value2pyliteral(source),
 
                     ],
-                    keywords=[
-                        ast.keyword(arg=name, value=ast.Name(id=name, ctx=ast.Load()))
-                        for name, _ in params
-                    ] + [
+                    keywords=variables + [
                         ast.keyword(arg=name, value=(
                             val if isinstance(val, ast.AST) else value2pyliteral(val)
                         ))
@@ -69,6 +127,38 @@ def build_func(provider, definition, schema, is_async):
     )
 
 
+def collect_fragments(node, found=None):
+    """
+    Finds the fragment definitions used by a node, transitively, in order of
+    first use.
+
+    Requires the reference annotations from :py:func:`annotate`.
+    """
+    if found is None:
+        found = {}
+    for sel in node.selection_set.selections:
+        if isinstance(sel, graphql.FragmentSpreadNode):
+            name = sel.name.value
+            if name not in found:
+                found[name] = fragment = get_definition(sel)
+                collect_fragments(fragment, found)
+        elif sel.selection_set is not None:
+            collect_fragments(sel, found)
+    return found
+
+
+def build_source(definition):
+    """
+    Builds the query text for an operation, including the fragments it uses.
+
+    Returns both the pretty form (for people) and the compact form (for the
+    wire).
+    """
+    doc = graphql.DocumentNode(definitions=[definition, *collect_fragments(definition).values()])
+    pretty = graphql.print_ast(doc)
+    return pretty, strip_ignored_characters(pretty)
+
+
 def build_param(var):
     name = var.variable.name.value
 
@@ -127,32 +217,227 @@ def gqlliteral2value(node):
 
 
 def load_and_validate(path, fobj=None):
-    if fobj is None:
-        with open(path, 'rt', encoding='utf-8') as fobj:
-            provider, code, has_code = read_code(fobj)
-    else:
-        provider, code, has_code = read_code(fobj)
+    with profiling.span('read', path):
+        if fobj is None:
+            with open(path, 'rt', encoding='utf-8') as fobj:
+                code = fobj.read()
+        else:
+            code = fobj.read()
+    with profiling.span('read_code', path):
+        provider, imports, has_code = scan_headers(code)
 
     # graphql can't handle empty files
-    if has_code:
-        gast = graphql.parse(graphql.Source(code, path))
-    else:
-        gast = graphql.language.DocumentNode(definitions=[])
+    with profiling.span('parse', path):
+        if has_code:
+            gast = graphql.parse(graphql.Source(code, path))
+        else:
+            gast = graphql.language.DocumentNode(definitions=[])
+    profiling.record_sizes(path, chars=len(code), definitions=len(gast.definitions))
 
     if provider is None:
         # FIXME: Lump this with above
         raise MissingProviderError(path)
 
-    schema = query_for_schema(provider)
-    errors = graphql.validate(schema, gast)
+    with profiling.span('schema', path):
+        schema = query_for_schema(provider)
+    with profiling.span('validate', path):
+        fragments, errors = import_fragments(path, imports, provider, schema)
+        if not errors:
+            errors = validate(schema, gast, fragments)
+
+    if not errors and settings.prune_schemas:
+        with profiling.span('prune', path):
+            schema, fragments = prune_document(provider, schema, gast, fragments)
 
     if not errors:
         # Just automatically compute type and ref annotations. We'll probably need it.
-        annotate(gast, schema)
+        with profiling.span('annotate', path):
+            annotate(gast, schema, fragments)
 
     return provider, gast, schema, errors
 
 
+def spread_names(node):
+    """
+    Produces the names of the fragments spread directly or indirectly (through
+    inline fragments and fields) by the node.
+    """
+    for sel in node.selection_set.selections:
+        if isinstance(sel, graphql.FragmentSpreadNode):
+            yield sel.name.value
+        elif sel.selection_set is not None:
+            yield from spread_names(sel)
+
+
+def used_fragments(definitions, fragments):
+    """
+    Finds the fragments (from a name->definition mapping) used by the given
+    definitions, transitively.
+    """
+    found = {}
+    pending = list(definitions)
+    while pending:
+        node = pending.pop()
+        for name in spread_names(node):
+            if name in fragments and name not in found:
+                found[name] = fragments[name]
+                pending.append(fragments[name])
+    return found
+
+
+def validate(schema, gast, fragments=None):
+    """
+    Validates a document, along with any imported fragments it uses.
+
+    Documents without operations are fragment libraries, so their fragments
+    are allowed to be unused.
+    """
+    definitions = gast.definitions
+    if fragments:
+        definitions = [*definitions, *used_fragments(definitions, fragments).values()]
+
+    rules = graphql.specified_rules
+    if not any(defin.kind == 'operation_definition' for defin in definitions):
+        rules = [rule for rule in rules if rule is not graphql.NoUnusedFragmentsRule]
+
+    return graphql.validate(schema, graphql.DocumentNode(definitions=definitions), rules)
+
+
+# The files read by the load in progress: path -> (mtime, size)
+_reading = contextvars.ContextVar('reading', default=None)
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _is_fresh(stamps):
+    """
+    Checks if none of the files read by a cached load have changed.
+    """
+    try:
+        return all(_stamp(path) == stamp for path, stamp in stamps.items())
+    except OSError:
+        return False
+
+
+def _note_reads(stamps):
+    reading = _reading.get()
+    if reading is not None:
+        reading.update(stamps)
+
+
+@contextlib.contextmanager
+def _tracking_reads():
+    """
+    Collects the files read in the context, including those of cached
+    fragment libraries, and passes them on to any enclosing load.
+    """
+    stamps = {}
+    token = _reading.set(stamps)
+    try:
+        yield stamps
+    finally:
+        _reading.reset(token)
+        _note_reads(stamps)
+
+
+# (path, provider) -> (stamps of the files read, fragments)
+_fragment_cache = {}
+_fragment_lock = threading.RLock()
+
+
+def load_fragment_library(path, provider, schema, _loading=()):
+    """
+    Loads the fragments defined (or imported) by a fragment library, checked
+    against the given provider's schema.
+
+    Libraries are only read, parsed, validated, and annotated once per process
+    (per provider), unless the file or the libraries it imports change.
+
+    Returns the name->definition mapping and a list of errors.
+    """
+    if path in _loading:
+        return {}, [graphql.GraphQLError(f"Fragment import cycle: {' -> '.join([*_loading, path])}")]
+    with _fragment_lock:
+        cached = _fragment_cache.get((path, provider))
+        if cached is not None and _is_fresh(cached[0]):
+            _note_reads(cached[0])
+            return cached[1], []
+
+        with _tracking_reads() as stamps:
+            stamps[path] = _stamp(path)
+            with open(path, 'rt', encoding='utf-8') as fobj:
+                _, imports, code, has_code = read_code(fobj)
+            gast = graphql.parse(graphql.Source(code, path)) if has_code else graphql.DocumentNode(definitions=[])
+
+            imported, errors = import_fragments(path, imports, provider, schema, (*_loading, path))
+        if not errors:
+            errors = validate(schema, gast, imported)
+        if errors:
+            return {}, errors
+        annotate(gast, schema, imported)
+
+        fragments = dict(imported)
+        fragments.update(
+            (defin.name.value, defin)
+            for defin in gast.definitions
+            if defin.kind == 'fragment_definition'
+        )
+        _fragment_cache[path, provider] = stamps, fragments
+        return fragments, []
+
+
+def import_fragments(path, imports, provider, schema, _loading=()):
+    """
+    Loads the fragment libraries imported by a file. Import paths are relative
+    to the importing file.
+
+    Returns the combined name->definition mapping and a list of errors.
+    """
+    fragments = {}
+    errors = []
+    for name in imports:
+        libpath = os.path.abspath(os.path.join(os.path.dirname(path), name))
+        libfrags, liberrors = load_fragment_library(libpath, provider, schema, _loading)
+        fragments.update(libfrags)
+        errors += liberrors
+    return fragments, errors
+
+
+# path -> (settings, stamps of the files read, (provider, gast, schema, errors))
+_document_cache = {}
+_document_lock = threading.RLock()
+
+
+def _document_settings():
+    # The settings that change what load_and_validate() gives
+    return settings.prune_schemas, settings.lean_schemas, settings.entity_cache
+
+
+def load_document(path):
+    """
+    Loads and validates a .gql file for importing.
+
+    The result is shared by the variants of the module (plain, ``_sync``, and
+    ``_async``), which only differ in the generated code, and by later imports,
+    until the file, the fragment libraries it imports, or the settings affecting
+    it change.
+    """
+    key = os.path.abspath(path)
+    with _document_lock:
+        cached = _document_cache.get(key)
+        if cached is not None and cached[0] == _document_settings() and _is_fresh(cached[1]):
+            return cached[2]
+
+        with _tracking_reads() as stamps:
+            stamps[key] = _stamp(path)
+            loaded = load_and_validate(path)
+        _document_cache[key] = _document_settings(), stamps, loaded
+        return loaded
+
+
 class GqlLoader(ExtensionLoader):
     extension = '.gql'
     auto_enable = True
@@ -177,57 +462,182 @@ class GqlLoader(ExtensionLoader):
 
     @staticmethod
     def handle_module(module, path):
-        is_async = False
-        if module.__name__.endswith('_async'):
-            is_async = True
-        elif module.__name__.endswith('_sync'):
-            is_async = False
+        with profiling.module(module.__name__):
+            build_module(module, path)
 
-        provider, gast, schema, errors = load_and_validate(path)
-        if errors:
-            raise from_graphql_validate(errors)
 
-        if sys.version_info >= (3, 8):
-            py38 = {
-                'type_ignores': [],
-            }
-        else:
-            py38 = {}
+def build_module(module, path):
+    """
+    Fills in a module from a .gql file.
+    """
+    is_async = module.__name__.endswith('_async')
 
-        mod = ast.Module(body=[
-            build_func(provider, defin, schema, is_async)
-            for defin in gast.definitions
-            if defin.kind == 'operation_definition'
-        ], **py38)
-        ast.fix_missing_locations(mod)
+    provider, gast, schema, errors = load_document(path)
+    if errors:
+        raise from_graphql_validate(errors)
+    with profiling.span('validate'):
+        enforce_cost_limits(gast, schema)
 
-        module.__builtins__ = _mod_impl
+    namespace = vars(module)
+    with profiling.span('codegen'):
+        mod = build_module_ast(provider, gast, schema, is_async, namespace)
+
+    module.__builtins__ = _mod_impl
+    with profiling.span('compile'):
         code = compile(mod, path, 'exec')
-        exec(code, vars(module))
+    with profiling.span('exec'):
+        exec(code, namespace)
+    attach_operations(provider, gast, schema, namespace)
+
+
+def build_module_ast(provider, gast, schema, is_async, namespace):
+    """
+    Generates the code of a module, placing the objects it needs in its
+    namespace.
+    """
+    if settings.entity_cache:
+        # The document is shared by the variants; this is idempotent
+        for defin in gast.definitions:
+            add_identity_fields(defin, schema)
+
+    if sys.version_info >= (3, 8):
+        py38 = {
+            'type_ignores': [],
+        }
+    else:
+        py38 = {}
+
+    mod = ast.Module(body=[
+        build_func(provider, defin, schema, is_async, **build_support(provider, defin, schema, namespace))
+        for defin in gast.definitions
+        if defin.kind == 'operation_definition'
+    ], **py38)
+    ast.fix_missing_locations(mod)
+    return mod
+
+
+def attach_operations(provider, gast, schema, namespace):
+    """
+    Gives each generated function an :py:class:`Operation` describing it, as
+    ``__graphql__``.
+    """
+    for defin in gast.definitions:
+        if defin.kind == 'operation_definition':
+            name = defin.name.value
+            runner = namespace.get(f"__run_{name}__")
+            namespace[name].__graphql__ = Operation(
+                provider, defin, schema, namespace.get(f"__validate_{name}__"),
+                runner if isinstance(runner, CodecOperation) else None,
+            )
+
+
+def build_support(provider, definition, schema, namespace):
+    """
+    Builds the runtime objects a generated function needs and places them in
+    the module namespace.
+
+    Returns the global names to pass to :py:func:`build_func`.
+    """
+    names = {}
+    if settings.validate_variables and definition.variable_definitions:
+        names['validator'] = f"__validate_{definition.name.value}__"
+        namespace[names['validator']] = build_validator(definition, schema)
+    runner = None
+    if settings.compile_plans:
+        runner = build_plan(provider, definition)
+    if settings.entity_cache:
+        runner = CachedOperation(definition, schema, runner)
+    # Outermost, so that cached results are stored as they were received
+    runner = build_codec(provider, definition, schema, runner) or runner
+    if runner is not None:
+        names['runner'] = f"__run_{definition.name.value}__"
+        namespace[names['runner']] = runner
+    return names
+
+
+def build_plan(provider, definition):
+    """
+    Compiles an execution plan for an operation, if the provider executes
+    queries in-process.
+    """
+    prov = get_provider(provider)
+    if supports_plans(prov):
+        plan = compile_operation(definition, prov.get_executable_schema())
+        if plan is not None:
+            return CompiledOperation(plan)
+
+
+def parse_header(line):
+    """
+    Parses a "#~...~" header line, returning the header name and its argument.
+
+    The provider header is "#~provider~" (ignoring whitespace), and fragment
+    imports are "#~import path~". Returns (None, None) for other lines.
+    """
+    line = line.strip()
+    if not (line.startswith('#') and line.endswith('~')):
+        return None, None
+    content = line[1:].lstrip()
+    if not content.startswith('~') or len(content) < 2:
+        return None, None
+    content = content[1:-1].strip()
+    directive, _, arg = content.partition(' ')
+    if directive == 'import' and arg.strip():
+        return 'import', arg.strip()
+    else:
+        return 'provider', ''.join(content.split())
 
 
 def read_code(fobj):
+    """
+    Reads a .gql file, returning the provider, the fragment imports, the code,
+    and whether there is any code.
+    """
+    code = fobj.read()
+    provider, imports, has_code = scan_headers(code)
+    return provider, imports, code, has_code
+
+
+def scan_headers(code):
+    """
+    Scans the code of a .gql file, returning the provider, the fragment
+    imports, and whether there is any code.
+    """
     provider = None
-    # Provider is "#~provider~", ignoring whitespace, and must be in an initial
-    # block of #'s
-    loc = 0
-    for line in fobj:
-        line = line.strip().replace(' ', '').replace('\t', '')
-        if line.startswith('#~') and line.endswith('~'):
-            provider = line[2:-1]
-            break
-        elif not line.startswith('#'):
-            loc += bool(line)
+    imports = []
+    has_code = False
+    lines = iter(code.splitlines())
+    # Headers must be in an initial block of #'s
+    for line in lines:
+        header, arg = parse_header(line)
+        if header == 'provider' and provider is None:
+            provider = arg
+        elif header == 'import':
+            imports.append(arg)
+        elif not line.lstrip().startswith('#'):
+            has_code = bool(line.strip())
             break
 
-    # Count the remaining LOCs
-    for line in fobj:
-        line = line.strip().replace(' ', '').replace('\t', '')
-        if line:
-            loc += 1
+    has_code = has_code or any(line.strip() for line in lines)
+    return provider, imports, has_code
 
-    fobj.seek(0)
-    return provider, fobj.read(), bool(loc)
+
+def find_providers(packages):
+    """
+    Finds the providers named by the .gql files in some packages (and their
+    subpackages), without importing them.
+    """
+    providers = set()
+    for package in packages:
+        spec = importlib.util.find_spec(package)
+        if spec is None:
+            raise ModuleNotFoundError(f"No package named {package!r}", name=package)
+        for location in spec.submodule_search_locations or ():
+            for path in pathlib.Path(location).rglob('*.gql'):
+                provider, _, _ = scan_headers(path.read_text(encoding='utf-8'))
+                if provider is not None:
+                    providers.add(provider)
+    return providers
 
 
 def scan_file(path, fobj=None):
@@ -0,0 +1,692 @@
+"""
+Per-provider rate limiting, concurrency limiting, and circuit breaking.
+
+These protect a degraded upstream (and the callers) from piling up requests.
+They are configured by provider name, and apply to every query sent to that
+provider, synchronous or asynchronous::
+
+    gqlmod.limits.limit_provider(
+        'github',
+        rate_limiter=RateLimiter(rate=50, burst=1000),
+        limiter=AdaptiveLimiter(initial=20, max_limit=200, queue_timeout=1.0),
+        breaker=CircuitBreaker(failure_rate=0.5, reset_timeout=10),
+    )
+"""
+import asyncio
+import collections
+import contextvars
+import threading
+import time
+
+from . import deadlines
+from .errors import CircuitOpenError, ConcurrencyLimitError, RateLimitError
+
+__all__ = (
+    'RateLimiter', 'AdaptiveLimiter', 'CircuitBreaker', 'limit_provider', 'get_guard', 'stats',
+    'report_rate_limit',
+)
+
+
+class _SyncWaiter:
+    def __init__(self):
+        self.granted = False
+        self._event = threading.Event()
+
+    def wake(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.granted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def wake(self):
+        # May be called from another thread
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def reset(self):
+        if self._future.done():
+            self._future = self._loop.create_future()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class RateTicket:
+    """
+    A query let through by a :py:class:`RateLimiter`, and what it was charged.
+    """
+    def __init__(self, query, cost):
+        self.query = query
+        self.cost = cost
+
+
+class RateLimiter:
+    """
+    Limits how fast queries are sent, with a token bucket: each query takes
+    ``cost`` tokens (a number, or a function of the query and variables), and
+    tokens come back at ``rate`` per second, up to ``burst``.
+
+    Queries without enough tokens wait their turn in a first-come,
+    first-served queue shared by threads and tasks, for up to
+    ``queue_timeout`` seconds (None waits as long as the deadline allows).
+    Queries that time out raise :py:class:`gqlmod.errors.RateLimitError`.
+
+    With ``adaptive``, the bucket follows what the service reports:
+
+    * ``extensions.cost`` in responses: ``actualQueryCost`` is charged instead
+      of the estimate, ``requestedQueryCost`` is charged the next time the
+      same query is sent, and ``throttleStatus`` (``maximumAvailable``,
+      ``currentlyAvailable``, and ``restoreRate``) replaces the burst, the
+      tokens, and the rate.
+    * Rate limit headers and ``Retry-After``, which providers pass on with
+      :py:func:`report_rate_limit` (as
+      :py:class:`~gqlmod.helpers.httpx.HttpxProvider` does).
+    """
+    def __init__(self, rate, burst=None, *, cost=1, queue_timeout=None, adaptive=True, max_learned=1024):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.cost = cost
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.max_learned = max_learned
+
+        self.tokens = self.burst
+        #: No queries are sent until then (by :py:func:`time.monotonic`)
+        self.paused_until = None
+        self.waited = 0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        # query -> cost reported by the service
+        self._learned = collections.OrderedDict()
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def cost_of(self, query, variables):
+        """
+        Estimates how many tokens a query takes.
+        """
+        cost = self._learned.get(query)
+        if cost is None:
+            cost = self.cost(query, variables) if callable(self.cost) else self.cost
+        # More than the bucket holds would never be let through
+        return min(float(cost), self.burst)
+
+    def _refill(self, now):
+        if now > self._updated:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def _delay(self, now, cost):
+        """
+        Seconds until there are cost tokens, or None if they won't come back
+        on their own.
+        """
+        if self.paused_until is not None and self.paused_until > now:
+            return self.paused_until - now
+        elif self.tokens >= cost:
+            return 0
+        elif self.rate <= 0:
+            return
+        return (cost - self.tokens) / self.rate
+
+    def _grant(self, now):
+        """
+        Lets through the waiters at the front of the queue that have enough
+        tokens, and wakes the next one so it knows how long to wait.
+        """
+        self._refill(now)
+        granted = False
+        while self._waiters and self._delay(now, self._waiters[0].cost) == 0:
+            waiter = self._waiters.popleft()
+            self.tokens -= waiter.cost
+            waiter.granted = granted = True
+            waiter.wake()
+        if granted and self._waiters:
+            self._waiters[0].wake()
+
+    def _enter(self, query, variables, waiter_factory):
+        """
+        Takes the tokens for a query if it can go now, or queues a waiter.
+        Returns the ticket and the waiter (None if the query can go).
+        """
+        ticket = RateTicket(query, self.cost_of(query, variables))
+        now = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            if not self._waiters and self._delay(now, ticket.cost) == 0:
+                self.tokens -= ticket.cost
+                return ticket, None
+            waiter = waiter_factory()
+            waiter.cost = ticket.cost
+            self._waiters.append(waiter)
+            self.waited += 1
+            return ticket, waiter
+
+    def _next_wait(self, waiter, give_up):
+        """
+        Grants whatever can go, and works out how long a waiter should wait
+        next. Zero means it is time to give up.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._grant(now)
+            if waiter.granted:
+                return
+            timeout = self._delay(now, waiter.cost) if self._waiters[0] is waiter else None
+        if give_up is not None:
+            timeout = give_up - now if timeout is None else min(timeout, give_up - now)
+        timeout = deadlines.bound(timeout)
+        return timeout if timeout is None else max(timeout, 0)
+
+    def _abandon(self, waiter):
+        """
+        Gives up waiting. Returns True if the tokens were granted in the
+        meantime.
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            head = self._waiters[0] is waiter
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            if head and self._waiters:
+                self._waiters[0].wake()
+            return False
+
+    def _time_out(self, waiter):
+        """
+        Stops waiting, raising unless the tokens were granted in the meantime.
+        """
+        if self._abandon(waiter):
+            return
+        deadlines.check()
+        raise RateLimitError("Timed out waiting for the provider's rate limit")
+
+    def _give_up_at(self):
+        return None if self.queue_timeout is None else time.monotonic() + self.queue_timeout
+
+    def acquire_sync(self, query, variables):
+        """
+        Waits until a query may be sent, returning its :py:class:`RateTicket`.
+        """
+        ticket, waiter = self._enter(query, variables, _SyncWaiter)
+        give_up = self._give_up_at()
+        while waiter is not None:
+            waiter.reset()
+            timeout = self._next_wait(waiter, give_up)
+            if waiter.granted:
+                break
+            elif timeout == 0:
+                self._time_out(waiter)
+                break
+            waiter.wait(timeout)
+        return ticket
+
+    async def acquire_async(self, query, variables):
+        """
+        Waits until a query may be sent, returning its :py:class:`RateTicket`.
+        """
+        ticket, waiter = self._enter(query, variables, _AsyncWaiter)
+        give_up = self._give_up_at()
+        while waiter is not None:
+            waiter.reset()
+            timeout = self._next_wait(waiter, give_up)
+            if waiter.granted:
+                break
+            elif timeout == 0:
+                self._time_out(waiter)
+                break
+            try:
+                await waiter.wait(timeout)
+            except BaseException:
+                # Cancelled; give back the tokens if they were granted
+                if self._abandon(waiter):
+                    self.cancel(ticket)
+                raise
+        return ticket
+
+    def cancel(self, ticket):
+        """
+        Gives back the tokens of a query that wasn't sent after all.
+        """
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + ticket.cost)
+            self._grant(time.monotonic())
+
+    def _pause(self, now, seconds):
+        until = now + max(float(seconds), 0)
+        if self.paused_until is None or until > self.paused_until:
+            self.paused_until = until
+
+    def _wake_head(self, now):
+        # The rate or tokens changed, so the next waiter needs to recompute
+        self._grant(now)
+        if self._waiters:
+            self._waiters[0].wake()
+
+    def finish(self, ticket, result):
+        """
+        Adapts to the cost data in a query's result (an
+        :py:class:`graphql.ExecutionResult` or dict), if any.
+        """
+        extensions = result.get('extensions') if isinstance(result, dict) else getattr(result, 'extensions', None)
+        cost = (extensions or {}).get('cost')
+        if not self.adaptive or not isinstance(cost, dict):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            self._learn(ticket.query, cost.get('requestedQueryCost'))
+            throttle = cost.get('throttleStatus')
+            if isinstance(throttle, dict):
+                self.burst = float(throttle.get('maximumAvailable', self.burst))
+                self.rate = float(throttle.get('restoreRate', self.rate))
+                self.tokens = min(self.burst, float(throttle.get('currentlyAvailable', self.tokens)))
+            elif cost.get('actualQueryCost') is not None:
+                self.tokens = min(self.burst, self.tokens + ticket.cost - cost['actualQueryCost'])
+            self._wake_head(now)
+
+    def _learn(self, query, cost):
+        if cost is None or not self.max_learned:
+            return
+        self._learned[query] = cost
+        self._learned.move_to_end(query)
+        while len(self._learned) > self.max_learned:
+            self._learned.popitem(last=False)
+
+    def report(self, *, remaining=None, limit=None, reset=None, retry_after=None):
+        """
+        Adapts to what the service said about its rate limit: the tokens
+        remaining, the size of the bucket, the seconds until it refills (used
+        when nothing remains), or to wait before trying again.
+        """
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            if limit is not None:
+                self.burst = float(limit)
+            if remaining is not None:
+                self.tokens = min(self.burst, float(remaining))
+                if remaining <= 0 and reset is not None:
+                    self._pause(now, reset)
+            if retry_after is not None:
+                self.tokens = min(self.tokens, 0)
+                self._pause(now, retry_after)
+            self._wake_head(now)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': self.tokens,
+                'rate_queued': len(self._waiters),
+                'rate_waited': self.waited,
+                'rate_limited': self.rejected,
+            }
+
+
+class AdaptiveLimiter:
+    """
+    Limits how many queries may be in flight at once, adapting the limit to
+    the observed latency (additive increase, multiplicative decrease).
+
+    While latency stays within ``tolerance`` times the best recent latency,
+    the limit grows by about one per limit's worth of successful calls. When
+    latency rises above that, or calls fail, the limit is multiplied by
+    ``backoff``.
+
+    Calls over the limit wait in a first-come, first-served queue for up to
+    ``queue_timeout`` seconds (None waits forever), and the queue holds at most
+    ``max_queue`` calls. Calls that can't be queued or time out raise
+    :py:class:`gqlmod.errors.ConcurrencyLimitError`.
+    """
+    def __init__(self, initial=10, *, min_limit=1, max_limit=1000, backoff=0.9, tolerance=2.0,
+                 queue_timeout=None, max_queue=None):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+
+        #: The best recent latency, which drifts slowly upwards so that a
+        #: permanently slower upstream becomes the new normal
+        self.baseline = None
+        self.inflight = 0
+        self.rejected = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter_factory):
+        """
+        Takes a slot if one is free, or queues a waiter. Returns None if a slot
+        was taken, or the waiter.
+        """
+        with self._lock:
+            if self.inflight < int(self.limit) and not self._waiters:
+                self.inflight += 1
+                return
+            if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ConcurrencyLimitError("Too many queries are waiting for this provider")
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        """
+        Gives up waiting. Returns True if the slot was granted in the meantime.
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            return False
+
+    def acquire_sync(self):
+        waiter = self._try_acquire(_SyncWaiter)
+        if waiter is None:
+            return
+        waiter.wait(deadlines.bound(self.queue_timeout))
+        if not self._abandon(waiter):
+            deadlines.check()
+            raise ConcurrencyLimitError("Timed out waiting for the provider's concurrency limit")
+
+    async def acquire_async(self):
+        waiter = self._try_acquire(_AsyncWaiter)
+        if waiter is None:
+            return
+        try:
+            await waiter.wait(self.queue_timeout)
+        except BaseException:
+            # Cancelled; don't leak the slot
+            if self._abandon(waiter):
+                self.release(None, True)
+            raise
+        if not self._abandon(waiter):
+            raise ConcurrencyLimitError("Timed out waiting for the provider's concurrency limit")
+
+    def _adapt(self, latency, ok):
+        if latency is None:
+            return
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline *= 1.01
+        if not ok or latency > self.baseline * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self.inflight >= self.limit / 2:
+            # Only grow if the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def release(self, latency, ok):
+        """
+        Frees a slot, adjusting the limit from the call's latency (in seconds)
+        and outcome.
+        """
+        with self._lock:
+            self._adapt(latency, ok)
+            self.inflight -= 1
+            while self._waiters and self.inflight < int(self.limit):
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.inflight += 1
+                waiter.wake()
+
+    def stats(self):
+        return {
+            'limit': int(self.limit),
+            'inflight': self.inflight,
+            'queued': len(self._waiters),
+            'rejected': self.rejected,
+            'baseline_latency': self.baseline,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fails fast while an upstream is failing.
+
+    The breaker trips (opens) when at least ``failure_rate`` of the last
+    ``window`` calls failed (and at least ``min_calls`` were made). While
+    open, calls raise :py:class:`gqlmod.errors.CircuitOpenError` immediately.
+    After ``reset_timeout`` seconds, up to ``probes`` calls are let through
+    (half-open); if they all succeed the breaker closes, and if any fails it
+    opens again.
+
+    Only exceptions from the provider count as failures; GraphQL errors in
+    a response mean the upstream is working.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, *, failure_rate=0.5, window=20, min_calls=10, reset_timeout=30.0, probes=1):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+
+        self.state = self.CLOSED
+        self._outcomes = collections.deque(maxlen=window)
+        self._opened_at = None
+        self._probing = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Checks if a call may proceed, raising if not.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("The provider is failing; not sending queries for now")
+                self.state = self.HALF_OPEN
+                self._probing = self._probe_successes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probing >= self.probes:
+                    raise CircuitOpenError("The provider is failing; waiting for probe queries")
+                self._probing += 1
+
+    def cancel(self):
+        """
+        Records that a call allowed by :py:meth:`before_call` didn't happen.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probing:
+                self._probing -= 1
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def record(self, ok):
+        """
+        Records the outcome of a call.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if not ok:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(ok)
+            if len(self._outcomes) >= self.min_calls and self.current_failure_rate >= self.failure_rate:
+                self._open()
+
+    @property
+    def current_failure_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failure_rate': self.current_failure_rate,
+        }
+
+
+# The rate limiter and ticket of the query being sent, for report_rate_limit()
+_rate_call = contextvars.ContextVar('rate_call', default=None)
+
+
+def report_rate_limit(**feedback):
+    """
+    Passes what a service said about its rate limit (see
+    :py:meth:`RateLimiter.report`) to the rate limiter of the provider the
+    current query is being sent to, if it has one. Providers call this.
+    """
+    call = _rate_call.get()
+    if call is not None:
+        call[0].report(**feedback)
+
+
+class ProviderGuard:
+    """
+    Applies a provider's rate limiter, concurrency limiter, and breaker around
+    calls to it.
+    """
+    def __init__(self, limiter=None, breaker=None, rate_limiter=None):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter
+
+    def _refused(self, ticket):
+        # Admitted by some, but not sent after all
+        if ticket is not None:
+            self.rate_limiter.cancel(ticket)
+        if self.breaker is not None:
+            self.breaker.cancel()
+
+    def _admit_sync(self, args):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        ticket = None
+        try:
+            if self.rate_limiter is not None:
+                ticket = self.rate_limiter.acquire_sync(*args)
+            if self.limiter is not None:
+                self.limiter.acquire_sync()
+        except BaseException:
+            self._refused(ticket)
+            raise
+        return ticket
+
+    async def _admit_async(self, args):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        ticket = None
+        try:
+            if self.rate_limiter is not None:
+                ticket = await self.rate_limiter.acquire_async(*args)
+            if self.limiter is not None:
+                await self.limiter.acquire_async()
+        except BaseException:
+            self._refused(ticket)
+            raise
+        return ticket
+
+    def call_sync(self, func, *args):
+        ticket = self._admit_sync(args)
+        start = time.monotonic()
+        token = _rate_call.set((self.rate_limiter, ticket) if ticket is not None else None)
+        rv = None
+        ok = False
+        try:
+            rv = func(*args)
+            ok = True
+            return rv
+        finally:
+            _rate_call.reset(token)
+            self._finish(time.monotonic() - start, ok, ticket, rv)
+
+    async def call_async(self, func, *args):
+        ticket = await self._admit_async(args)
+        start = time.monotonic()
+        token = _rate_call.set((self.rate_limiter, ticket) if ticket is not None else None)
+        rv = None
+        ok = False
+        try:
+            rv = await func(*args)
+            ok = True
+            return rv
+        finally:
+            _rate_call.reset(token)
+            self._finish(time.monotonic() - start, ok, ticket, rv)
+
+    def _finish(self, latency, ok, ticket, result):
+        if self.limiter is not None:
+            self.limiter.release(latency, ok)
+        if self.breaker is not None:
+            self.breaker.record(ok)
+        if ticket is not None:
+            self.rate_limiter.finish(ticket, result)
+
+    def stats(self):
+        rv = {}
+        if self.rate_limiter is not None:
+            rv.update(self.rate_limiter.stats())
+        if self.limiter is not None:
+            rv.update(self.limiter.stats())
+        if self.breaker is not None:
+            rv.update(self.breaker.stats())
+        return rv
+
+
+# provider name -> ProviderGuard
+_guards = {}
+
+
+def limit_provider(name, *, limiter=None, breaker=None, rate_limiter=None):
+    """
+    Sets the rate limiter, concurrency limiter, and circuit breaker for a
+    provider. Pass none of them to remove them.
+    """
+    if limiter is None and breaker is None and rate_limiter is None:
+        _guards.pop(name, None)
+    else:
+        _guards[name] = ProviderGuard(limiter, breaker, rate_limiter)
+
+
+def get_guard(name):
+    """
+    Gets the :py:class:`ProviderGuard` for a provider, if it has one.
+    """
+    return _guards.get(name)
+
+
+def stats():
+    """
+    Gets the live rate limiter, limiter, and breaker statistics, by provider
+    name.
+    """
+    return {name: guard.stats() for name, guard in list(_guards.items())}
@@ -0,0 +1,288 @@
+"""
+Sending several operations as one request.
+
+Calls to generated functions (of the same provider) are merged into a single
+operation. Each call gets a prefix (``op0_``, ``op1_``, ...) on its root
+fields' aliases, variables, and fragments, so they can't collide, and the
+response is split back into one result per call::
+
+    from gqlmod.merging import call, run_sync
+
+    hero, luke = run_sync(
+        call(queries.HeroForEpisode, ep='EMPIRE'),
+        call(queries.HumanName, id='1000'),
+    )
+
+The merged document is validated against the provider's schema and cached for
+each combination of operations. Variables are checked and encoded, and results
+decoded, as the generated functions would, but merged calls go straight to the
+provider, skipping compiled plans and the entity cache.
+"""
+import collections
+import copy
+import threading
+import typing
+
+import graphql
+from graphql.utilities import strip_ignored_characters
+
+from . import settings
+from .errors import MultiErrors, from_graphql_validate
+from .helpers.types import get_definition
+from .importer import Operation, collect_fragments, used_fragments
+from .providers import _call_async, _call_sync, _process_result, get_provider, query_for_schema
+
+__all__ = 'MergedOperation', 'call', 'merge', 'run_sync', 'run_async'
+
+#: Number of merged documents to keep
+CACHE_SIZE = 256
+
+
+class Call(typing.NamedTuple):
+    operation: Operation
+    variables: dict
+
+
+def call(func, **variables):
+    """
+    Describes a call to a generated function, to merge with others.
+    """
+    try:
+        operation = func.__graphql__
+    except AttributeError:
+        raise TypeError(f"{func!r} is not a generated query function")
+    _check_required(operation.definition, variables)
+    if operation.validator is not None:
+        variables = operation.validator(variables)
+    if operation.codec is not None:
+        variables = operation.codec.encode(dict(variables))
+    return Call(operation, variables)
+
+
+def _check_required(definition, variables):
+    """
+    Raises TypeError for missing required variables, like the generated
+    function would, rather than leaving the service to complain about the
+    renamed ones.
+    """
+    required = [
+        var.variable.name.value
+        for var in definition.variable_definitions
+        if isinstance(var.type, graphql.NonNullTypeNode) and var.default_value is None
+    ]
+    missing = [name for name in required if name not in variables]
+    if missing:
+        names = ', '.join(repr(name) for name in missing)
+        raise TypeError(f"{definition.name.value}() missing required variables: {names}")
+
+
+class _Renamer(graphql.Visitor):
+    """
+    Prefixes the variables and fragment names of a definition.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def _name(self, node):
+        return graphql.NameNode(value=self.prefix + node.value)
+
+    def enter_variable(self, node, *_):
+        return graphql.VariableNode(name=self._name(node.name))
+
+    def enter_fragment_spread(self, node, *_):
+        return graphql.FragmentSpreadNode(name=self._name(node.name), directives=node.directives)
+
+    def leave_fragment_definition(self, node, *_):
+        node = copy.copy(node)
+        node.name = self._name(node.name)
+        return node
+
+
+def _alias_root(selection_set, prefix):
+    """
+    Prefixes the response keys of root fields, looking through fragments.
+    """
+    selections = []
+    for sel in selection_set.selections:
+        sel = copy.copy(sel)
+        if isinstance(sel, graphql.FieldNode):
+            sel.alias = graphql.NameNode(value=prefix + (sel.alias or sel.name).value)
+        else:
+            if isinstance(sel, graphql.FragmentSpreadNode):
+                frag = get_definition(sel)
+                sel = graphql.InlineFragmentNode(
+                    type_condition=frag.type_condition, directives=sel.directives,
+                    selection_set=frag.selection_set,
+                )
+            sel.selection_set = _alias_root(sel.selection_set, prefix)
+        selections.append(sel)
+    return graphql.SelectionSetNode(selections=selections)
+
+
+def _prefix(index):
+    return f"op{index}_"
+
+
+def build_merged(operations):
+    """
+    Builds the merged document for a sequence of operations.
+    """
+    kinds = {op.definition.operation for op in operations}
+    if len(kinds) > 1:
+        raise ValueError("Can't merge queries with mutations")
+
+    variables, selections, fragments = [], [], {}
+    for index, op in enumerate(operations):
+        prefix = _prefix(index)
+        renamer = _Renamer(prefix)
+        # Alias first, since root fragment spreads are inlined
+        definition = copy.copy(op.definition)
+        definition.selection_set = _alias_root(op.definition.selection_set, prefix)
+        definition = graphql.visit(definition, renamer)
+        variables += definition.variable_definitions
+        selections += definition.selection_set.selections
+        for frag in collect_fragments(op.definition).values():
+            frag = graphql.visit(frag, renamer)
+            fragments[frag.name.value] = frag
+
+    merged = graphql.OperationDefinitionNode(
+        operation=kinds.pop(),
+        name=graphql.NameNode(value='_'.join(op.definition.name.value for op in operations)),
+        variable_definitions=variables,
+        directives=[],
+        selection_set=graphql.SelectionSetNode(selections=selections),
+    )
+    return graphql.DocumentNode(definitions=[merged, *used_fragments([merged], fragments).values()])
+
+
+class MergedOperation:
+    """
+    A merged document, ready to send.
+    """
+    def __init__(self, operations):
+        self.operations = operations
+        self.provider = operations[0].provider
+        if any(op.provider != self.provider for op in operations):
+            raise ValueError("Only operations of the same provider can be merged")
+        pretty = graphql.print_ast(build_merged(operations))
+        # Parsed again to get a clean document, without the annotations
+        self.document = graphql.parse(pretty)
+        errors = graphql.validate(query_for_schema(self.provider), self.document)
+        if errors:
+            raise from_graphql_validate(errors)
+        self.source = strip_ignored_characters(pretty) if settings.minify_queries else pretty
+
+    def variables(self, calls):
+        """
+        Builds the variables of the merged operation from those of each call
+        (checked and encoded by :py:func:`call`).
+        """
+        rv = {}
+        for index, (_, variables) in enumerate(calls):
+            prefix = _prefix(index)
+            rv.update((prefix + name, value) for name, value in variables.items())
+        return rv
+
+    def split(self, result, return_exceptions=False):
+        """
+        Splits the result of the merged operation into one per call, as the
+        generated functions would return them.
+        """
+        data, errors = _result_parts(result)
+        rv = []
+        for index, op in enumerate(self.operations):
+            prefix = _prefix(index)
+            opdata = None if data is None else {
+                key[len(prefix):]: value for key, value in data.items() if key.startswith(prefix)
+            }
+            operrors = [_unprefix_error(err, prefix) for err in errors if _error_belongs(err, prefix)]
+            try:
+                opdata = _process_result(graphql.ExecutionResult(data=opdata, errors=operrors or None))
+                rv.append(opdata if op.codec is None else op.codec.decode(opdata))
+            except (graphql.GraphQLError, MultiErrors) as exc:
+                if not return_exceptions:
+                    raise
+                rv.append(exc)
+        return rv
+
+
+def _result_parts(result):
+    if isinstance(result, dict):
+        data, errors = result.get('data'), result.get('errors')
+    else:
+        data, errors = result.data, result.errors
+    return data, [_as_error(err) for err in errors or ()]
+
+
+def _as_error(err):
+    # Some providers pass on the errors from the response as dicts
+    if isinstance(err, dict):
+        return graphql.GraphQLError(err.get('message'), path=err.get('path'), extensions=err.get('extensions'))
+    return err
+
+
+def _error_belongs(err, prefix):
+    # Errors without a path concern the whole request
+    return not err.path or str(err.path[0]).startswith(prefix)
+
+
+def _unprefix_error(err, prefix):
+    if not err.path:
+        return err
+    path = [err.path[0][len(prefix):], *err.path[1:]]
+    return graphql.GraphQLError(err.message, path=path, original_error=err.original_error, extensions=err.extensions)
+
+
+# tuple of operations -> MergedOperation
+_merged = collections.OrderedDict()
+_merged_lock = threading.Lock()
+
+
+def merge(operations):
+    """
+    Gets the (cached) merged document for a sequence of operations.
+    """
+    # Operations hold the definitions, so the ids stay valid while cached
+    key = tuple(id(op.definition) for op in operations)
+    with _merged_lock:
+        try:
+            merged = _merged[key]
+        except KeyError:
+            pass
+        else:
+            _merged.move_to_end(key)
+            return merged
+    merged = MergedOperation(tuple(operations))
+    with _merged_lock:
+        _merged[key] = merged
+        while len(_merged) > CACHE_SIZE:
+            _merged.popitem(last=False)
+    return merged
+
+
+def run_sync(*calls, return_exceptions=False):
+    """
+    Sends several calls (from :py:func:`call`) as one request, and returns
+    their results in order.
+
+    If return_exceptions is true, a call's errors are returned in its place
+    instead of raised.
+    """
+    merged = merge([c.operation for c in calls])
+    prov = get_provider(merged.provider)
+    result = _call_sync(merged.provider, prov.query_sync, merged.source, merged.variables(calls))
+    return merged.split(result, return_exceptions)
+
+
+async def run_async(*calls, return_exceptions=False):
+    """
+    Sends several calls (from :py:func:`call`) as one request, and returns
+    their results in order.
+
+    If return_exceptions is true, a call's errors are returned in its place
+    instead of raised.
+    """
+    merged = merge([c.operation for c in calls])
+    prov = get_provider(merged.provider)
+    result = await _call_async(merged.provider, prov.query_async, merged.source, merged.variables(calls))
+    return merged.split(result, return_exceptions)
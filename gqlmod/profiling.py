@@ -0,0 +1,186 @@
+"""
+Timing how long ``.gql`` modules take to import.
+
+While a profile is running, every import records how long each phase took
+(``read``, ``read_code``, ``parse``, ``schema``, ``validate``, ``prune``,
+``annotate``, ``codegen``, ``compile``, and ``exec``), and how big the document
+was::
+
+    with profiling.profile() as prof:
+        import my.queries
+    print(prof.table())
+
+Set ``GQLMOD_PROFILE_IMPORTS`` to profile a whole process: to ``-`` to print
+the table to stderr at exit, or to a file name to write it there (as a Chrome
+trace if it ends in ``.json``).
+
+Phases of a document shared by the variants of a module are only recorded
+once, for the variant that loaded it.
+"""
+import atexit
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+__all__ = 'ImportProfile', 'profile', 'span', 'module', 'record_sizes', 'PHASES'
+
+#: The phases of an import, in order
+PHASES = (
+    'read', 'read_code', 'parse', 'schema', 'validate', 'prune', 'annotate', 'codegen', 'compile', 'exec',
+)
+
+_active = None
+# The module (or file) being profiled
+_current = contextvars.ContextVar('profiled_module', default=None)
+_null = contextlib.nullcontext()
+
+
+class ImportProfile:
+    """
+    The phase timings and document sizes of imports.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        #: (module, phase, start, duration, thread id), in seconds from the start
+        self.spans = []
+        #: module -> size name -> size
+        self.sizes = collections.defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def record(self, key, phase, start, duration):
+        with self._lock:
+            self.spans.append((key, phase, start - self.origin, duration, threading.get_ident()))
+
+    def totals(self):
+        """
+        Gets the seconds spent in each phase, by module.
+        """
+        rv = collections.defaultdict(lambda: dict.fromkeys(PHASES, 0.0))
+        for key, phase, _, duration, _ in self.spans:
+            rv[key][phase] = rv[key].get(phase, 0.0) + duration
+        return dict(rv)
+
+    def summary(self):
+        """
+        Gets the timings and sizes by module, slowest first.
+        """
+        rows = [
+            {'module': key, 'total': sum(phases.values()), 'phases': phases, 'sizes': self.sizes.get(key, {})}
+            for key, phases in self.totals().items()
+        ]
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def table(self):
+        """
+        Formats the summary as a text table, in milliseconds.
+        """
+        rows = self.summary()
+        width = max([len('module'), *(len(row['module']) for row in rows)])
+        header = ' '.join(f"{phase:>9}" for phase in PHASES)
+        lines = [f"{'module':<{width}} {'total':>8} {header} {'chars':>8}"]
+        for row in rows:
+            phases = ' '.join(f"{row['phases'][phase] * 1000:9.2f}" for phase in PHASES)
+            chars = row['sizes'].get('chars', '')
+            lines.append(f"{row['module']:<{width}} {row['total'] * 1000:8.2f} {phases} {chars:>8}")
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """
+        Gets the spans in the Chrome trace event format (for
+        ``chrome://tracing`` or Perfetto).
+        """
+        pid = os.getpid()
+        return {'traceEvents': [
+            {
+                'name': phase, 'cat': 'gqlmod', 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': start * 1e6, 'dur': duration * 1e6, 'args': {'module': key, **self.sizes.get(key, {})},
+            }
+            for key, phase, start, duration, tid in self.spans
+        ]}
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Profiles the imports in the context, giving the :py:class:`ImportProfile`.
+    """
+    global _active
+    previous, _active = _active, ImportProfile()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+@contextlib.contextmanager
+def module(key):
+    """
+    Attributes the spans in the context to a module (or file).
+    """
+    token = _current.set(key)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def span(phase, default=None):
+    """
+    Times a phase of the current import (or of default, outside of imports),
+    if profiling.
+    """
+    if _active is None:
+        return _null
+    return _span(_active, _current.get() or default or '?', phase)
+
+
+@contextlib.contextmanager
+def _span(prof, key, phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.record(key, phase, start, time.perf_counter() - start)
+
+
+def record_sizes(default=None, **sizes):
+    """
+    Notes the sizes of the document of the current import (or of default,
+    outside of imports), if profiling.
+    """
+    if _active is not None:
+        _active.sizes[_current.get() or default or '?'].update(sizes)
+
+
+def write_report(prof, dest):
+    """
+    Writes a profile to a file name, or stderr for ``-``. Files ending in
+    ``.json`` get a Chrome trace, and others a table.
+    """
+    if dest == '-':
+        print(prof.table(), file=sys.stderr)
+    elif dest.endswith('.json'):
+        with open(dest, 'wt', encoding='utf-8') as fobj:
+            json.dump(prof.chrome_trace(), fobj)
+    else:
+        with open(dest, 'wt', encoding='utf-8') as fobj:
+            print(prof.table(), file=fobj)
+
+
+def profile_from_env():
+    """
+    Starts profiling for the rest of the process if ``GQLMOD_PROFILE_IMPORTS``
+    is set, reporting at exit.
+    """
+    global _active
+    dest = os.environ.get('GQLMOD_PROFILE_IMPORTS')
+    if not dest or _active is not None:
+        return
+    _active = prof = ImportProfile()
+    atexit.register(write_report, prof, dest)
@@ -1,10 +1,13 @@
 """
 Provider machinery
 """
+import concurrent.futures
 import contextlib
 import contextvars
 import collections
-import functools
+import hashlib
+import json
+import weakref
 
 try:
     import importlib.metadata as ilmd
@@ -12,12 +15,14 @@ except ImportError:
     import importlib_metadata as ilmd
 import graphql
 
+from . import deadlines, settings
 from .errors import MultiErrors
+from .limits import get_guard
 
 
 __all__ = (
     'with_provider', 'exec_query_sync', 'exec_query_async', 'query_for_schema',
-    'get_additional_kwargs',
+    'get_additional_kwargs', 'prefetch_schemas',
 )
 
 provider_map = contextvars.ContextVar('provider_map')
@@ -116,6 +121,50 @@ def _process_result(res):
         return data
 
 
+def _call_sync(provider, func, query, variables):
+    """
+    Calls func(query, variables) under the provider's limits, returning the
+    raw result.
+
+    Fails without calling if the deadline has already passed; otherwise, the
+    provider is trusted to honor it.
+    """
+    deadlines.check()
+    guard = get_guard(provider)
+    if guard is None:
+        return func(query, variables)
+    else:
+        return guard.call_sync(func, query, variables)
+
+
+async def _call_async(provider, func, query, variables):
+    """
+    Awaits func(query, variables) under the provider's limits, returning the
+    raw result. It is cancelled if the deadline passes.
+    """
+    guard = get_guard(provider)
+    if guard is None:
+        return await deadlines.wait_for(func(query, variables))
+    else:
+        return await deadlines.wait_for(guard.call_async(func, query, variables))
+
+
+def _run_sync(provider, func, query, variables):
+    """
+    Calls func(query, variables) like :py:func:`_call_sync`, and processes the
+    result.
+    """
+    return _process_result(_call_sync(provider, func, query, variables))
+
+
+async def _run_async(provider, func, query, variables):
+    """
+    Awaits func(query, variables) like :py:func:`_call_async`, and processes
+    the result.
+    """
+    return _process_result(await _call_async(provider, func, query, variables))
+
+
 def exec_query_sync(provider, query, **variables):
     """
     Executes a query with the given variables. (Synchronous version)
@@ -123,9 +172,7 @@ def exec_query_sync(provider, query, **variables):
     NOTE: Some providers may expect additional variables. As this is an internal
     API, this is likely undocumented.
     """
-    prov = get_provider(provider)
-    result = prov.query_sync(query, variables)
-    return _process_result(result)
+    return _run_sync(provider, get_provider(provider).query_sync, query, variables)
 
 
 async def exec_query_async(provider, query, **variables):
@@ -135,29 +182,112 @@ async def exec_query_async(provider, query, **variables):
     NOTE: Some providers may expect additional variables. As this is an internal
     API, this is likely undocumented.
     """
-    prov = get_provider(provider)
-    result = await prov.query_async(query, variables)
-    return _process_result(result)
+    return await _run_async(provider, get_provider(provider).query_async, query, variables)
+
+
+# provider -> Future of its schema, for schemas fetched in the background
+_prefetching = {}
+
+
+def prefetch_schemas(providers):
+    """
+    Starts asking some providers for their schemas, all at once in the
+    background. Anything needing one of those schemas waits for it.
+    """
+    providers = [provider for provider in providers if provider not in _prefetching]
+    if not providers:
+        return
+    # Set up the provider map here, so the fetches share its instances
+    _get_pmap()
+    pool = concurrent.futures.ThreadPoolExecutor(len(providers), thread_name_prefix='gqlmod-schema')
+    for provider in providers:
+        _prefetching[provider] = pool.submit(contextvars.copy_context().run, _fetch_schema, provider)
+    pool.shutdown(wait=False)
 
 
-@functools.lru_cache()
 def query_for_schema(provider):
     """
     Asks the given provider for its schema
     """
+    future = _prefetching.get(provider)
+    if future is not None:
+        # If the prefetch failed, this asks again so the error is raised here
+        concurrent.futures.wait([future])
+    return _fetch_schema(provider)
+
+
+def _fetch_schema(provider):
+    try:
+        return _schemas[provider]
+    except KeyError:
+        pass
     prov = get_provider(provider)
     if hasattr(prov, 'get_schema_str'):
         data = prov.get_schema_str()
-        schema = graphql.build_schema(data)
     else:
-        query = graphql.get_introspection_query(descriptions=True)
-
+        query = LEAN_INTROSPECTION_QUERY if settings.lean_schemas else graphql.get_introspection_query(descriptions=True)
         data = exec_query_sync(provider, query)
+    _schemas[provider] = schema = _share_schema(data)
+    return schema
+
+
+# provider -> schema
+_schemas = {}
+# digest of the schema data -> schema, so providers serving the same schema
+# share it
+_shared = weakref.WeakValueDictionary()
+
+#: Introspection without descriptions or deprecation reasons (deprecated fields
+#: are still included, so operations using them validate)
+LEAN_INTROSPECTION_QUERY = '\n'.join(
+    line
+    for line in graphql.get_introspection_query(descriptions=False).splitlines()
+    if line.strip() not in ('', 'isDeprecated', 'deprecationReason')
+)
+
+
+class _DescriptionStripper(graphql.Visitor):
+    def enter(self, node, *_):
+        if getattr(node, 'description', None) is not None:
+            node.description = None
+
+
+def _build_schema(data, lean):
+    if isinstance(data, str):
+        document = graphql.parse(data, no_location=lean)
+        if lean:
+            graphql.visit(document, _DescriptionStripper())
+        schema = graphql.build_ast_schema(document)
+    else:
         schema = graphql.build_client_schema(data)
-    schema = insert_builtins(schema)
+    return insert_builtins(schema)
+
+
+def _share_schema(data):
+    lean = settings.lean_schemas
+    text = data if isinstance(data, str) else json.dumps(data, sort_keys=True)
+    key = hashlib.sha256(f"{lean}:{text}".encode('utf-8')).hexdigest()
+    schema = _shared.get(key)
+    if schema is None:
+        _shared[key] = schema = _build_schema(data, lean)
     return schema
 
 
+def cached_schemas():
+    """
+    Gets the cached schemas, by provider.
+    """
+    return dict(_schemas)
+
+
+def forget_schemas():
+    """
+    Drops the cached schemas, so they are asked for again when needed.
+    """
+    _schemas.clear()
+    _prefetching.clear()
+
+
 BUILTIN_SCALARS = (
     'Int',
     'Float',
@@ -0,0 +1,264 @@
+"""
+Cutting schemas down to what imported operations use.
+
+Large public schemas are mostly types an application never queries. With the
+``prune_schemas`` setting, each ``.gql`` module is validated against the full
+schema of its provider, and then keeps a pruned copy: the types, fields, and
+arguments its operations use, the input types those arguments take, and the
+possible types of any abstract type it selects.
+
+The full schemas stay cached for the modules imported after them. Once the
+application is done importing, :py:func:`release_schemas` lets them go, and
+:py:func:`memory_report` shows how much memory the schemas hold.
+"""
+import collections
+import gc
+import sys
+import types
+import weakref
+
+import graphql
+from graphql.utilities.print_schema import print_directive, print_enum, print_input_object, print_input_value
+
+from . import importer, providers
+from .helpers.types import annotate
+
+__all__ = 'used_fields', 'prune_schema', 'prune_document', 'schema_size', 'release_schemas', 'memory_report'
+
+# provider -> pruned schemas of imported modules
+_pruned = collections.defaultdict(weakref.WeakSet)
+
+# Objects shared by every schema, which pruning can't free
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+_SHARED_IDS = {
+    id(gtype)
+    for gtype in [*graphql.specified_scalar_types, *graphql.introspection_types.values()]
+}
+
+
+class _FieldCollector(graphql.Visitor):
+    def __init__(self, type_info, fields):
+        super().__init__()
+        self.type_info = type_info
+        self.fields = fields
+
+    def enter_field(self, node, *_):
+        parent = self.type_info.get_parent_type()
+        if parent is not None and not node.name.value.startswith('__'):
+            self.fields[parent.name].add(node.name.value)
+
+    def enter_inline_fragment(self, node, *_):
+        if node.type_condition is not None:
+            self.fields[node.type_condition.name.value]
+
+    def enter_fragment_definition(self, node, *_):
+        self.fields[node.type_condition.name.value]
+
+    def enter_operation_definition(self, node, *_):
+        self.fields[self.type_info.get_type().name]
+
+
+def used_fields(schema, definitions):
+    """
+    Finds the fields that some (valid) definitions select, as a mapping of
+    composite type names to sets of field names.
+    """
+    fields = collections.defaultdict(set)
+    type_info = graphql.TypeInfo(schema)
+    document = graphql.DocumentNode(definitions=list(definitions))
+    graphql.visit(document, graphql.TypeInfoVisitor(type_info, _FieldCollector(type_info, fields)))
+    return fields
+
+
+class _Pruner:
+    """
+    Grows a set of used fields into a self-consistent subset of a schema.
+    """
+    def __init__(self, schema, fields):
+        self.schema = schema
+        self.fields = collections.defaultdict(set, fields)
+        # Schemas always have a query type
+        self.fields[schema.query_type.name]
+        # Names of the leaf and input types used
+        self.inputs = set()
+        # Whether any field keeps directives, which only the SDL holds
+        self.directives = False
+
+    def close(self):
+        size = None
+        while size != self._size():
+            size = self._size()
+            for name in list(self.fields):
+                self._expand(self.schema.get_type(name))
+        for directive in self.schema.directives:
+            for arg in directive.args.values():
+                self._add_input(arg.type)
+
+    def _size(self):
+        return sum(len(names) + 1 for names in self.fields.values()) + len(self.inputs)
+
+    def _expand(self, ctype):
+        if graphql.is_abstract_type(ctype):
+            for ptype in self.schema.get_possible_types(ctype):
+                self.fields[ptype.name]
+        if graphql.is_union_type(ctype):
+            return
+        # Implementations need the fields of their interfaces
+        for iface in ctype.interfaces:
+            self.fields[ctype.name].update(self.fields.get(iface.name, ()))
+        if not self.fields[ctype.name]:
+            # Types need at least one field
+            self.fields[ctype.name].add(next(iter(ctype.fields)))
+        for name in list(self.fields[ctype.name]):
+            self._add_field(ctype.fields[name])
+
+    def _add_field(self, field):
+        ftype = graphql.get_named_type(field.type)
+        if graphql.is_composite_type(ftype):
+            self.fields[ftype.name]
+        else:
+            self.inputs.add(ftype.name)
+        for arg in field.args.values():
+            self._add_input(arg.type)
+
+    def _add_input(self, gtype):
+        gtype = graphql.get_named_type(gtype)
+        if gtype.name in self.inputs:
+            return
+        self.inputs.add(gtype.name)
+        if graphql.is_input_object_type(gtype):
+            for field in gtype.fields.values():
+                self._add_input(field.type)
+
+    # Printing
+    def print_sdl(self):
+        blocks = [self._print_schema_definition()]
+        blocks += [
+            print_directive(directive)
+            for directive in self.schema.directives
+            if not graphql.is_specified_directive(directive)
+        ]
+        for name in sorted({*self.fields, *self.inputs}):
+            gtype = self.schema.get_type(name)
+            if graphql.is_specified_scalar_type(gtype):
+                continue
+            blocks.append(self._print_type(gtype))
+        return '\n\n'.join(blocks)
+
+    def _print_schema_definition(self):
+        roots = [
+            f"  {operation}: {rtype.name}"
+            for operation, rtype in [
+                ('query', self.schema.query_type),
+                ('mutation', self.schema.mutation_type),
+                ('subscription', self.schema.subscription_type),
+            ]
+            if rtype is not None and rtype.name in self.fields
+        ]
+        return 'schema {\n' + '\n'.join(roots) + '\n}'
+
+    def _print_type(self, gtype):
+        if graphql.is_scalar_type(gtype):
+            return f"scalar {gtype.name}"
+        elif graphql.is_enum_type(gtype):
+            return print_enum(gtype)
+        elif graphql.is_input_object_type(gtype):
+            return print_input_object(gtype)
+        elif graphql.is_union_type(gtype):
+            return f"union {gtype.name} = {' | '.join(ptype.name for ptype in gtype.types)}"
+        kind = 'interface' if graphql.is_interface_type(gtype) else 'type'
+        interfaces = [iface.name for iface in gtype.interfaces if iface.name in self.fields]
+        implements = f" implements {' & '.join(interfaces)}" if interfaces else ''
+        fields = '\n'.join(
+            f"  {self._print_field(name, gtype.fields[name])}"
+            for name in gtype.fields
+            if name in self.fields[gtype.name]
+        )
+        return f"{kind} {gtype.name}{implements} {{\n{fields}\n}}"
+
+    def _print_field(self, name, field):
+        args = ''
+        if field.args:
+            args = '(' + ', '.join(print_input_value(aname, arg) for aname, arg in field.args.items()) + ')'
+        # Keep the directives cost estimates read
+        node = field.ast_node
+        directives = ''.join(f" {graphql.print_ast(directive)}" for directive in (node.directives if node else ()))
+        self.directives = self.directives or bool(directives)
+        return f"{name}{args}: {field.type}{directives}"
+
+
+def prune_schema(schema, definitions):
+    """
+    Builds the subset of a schema that some (valid) definitions use.
+    """
+    pruner = _Pruner(schema, used_fields(schema, definitions))
+    pruner.close()
+    pruned = graphql.build_schema(pruner.print_sdl(), no_location=True)
+    if not pruner.directives:
+        # Without directives to keep, the SDL is dead weight
+        pruned = graphql.build_client_schema(graphql.introspection_from_schema(pruned, descriptions=False))
+    return providers.insert_builtins(pruned)
+
+
+def prune_document(provider, schema, gast, fragments):
+    """
+    Prunes the schema of a (validated) module, giving the pruned schema and
+    copies of the imported fragments it uses (so they can be annotated with
+    it).
+    """
+    used = list(importer.used_fragments(gast.definitions, fragments or {}).values())
+    pruned = prune_schema(schema, [*gast.definitions, *used])
+    _pruned[provider].add(pruned)
+    copies = {}
+    if used:
+        document = graphql.parse(graphql.print_ast(graphql.DocumentNode(definitions=used)), no_location=True)
+        annotate(document, pruned)
+        copies = {defin.name.value: defin for defin in document.definitions}
+    return pruned, copies
+
+
+def schema_size(schema):
+    """
+    Estimates the memory held by a schema, in bytes, by adding up the objects
+    it refers to (except those shared with every schema, like the built-in
+    types, classes, and functions).
+    """
+    seen = set(_SHARED_IDS)
+    pending = [schema]
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def release_schemas():
+    """
+    Drops the cached full schemas (and the fragment libraries checked against
+    them). Modules imported afterwards fetch their provider's schema again.
+    """
+    providers.forget_schemas()
+    with importer._fragment_lock:
+        importer._fragment_cache.clear()
+
+
+def memory_report():
+    """
+    Reports the estimated memory held by the schema of each provider: the
+    full schema (if still cached) and the pruned schemas of imported modules.
+    """
+    names = sorted({*providers.cached_schemas(), *_pruned})
+    cached = providers.cached_schemas()
+    return [
+        {
+            'provider': name,
+            'full': schema_size(cached[name]) if name in cached else None,
+            'pruned': sum(schema_size(schema) for schema in list(_pruned.get(name, ()))),
+            'modules': len(_pruned.get(name, ())),
+        }
+        for name in names
+    ]
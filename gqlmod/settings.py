@@ -0,0 +1,107 @@
+"""
+Process-wide settings.
+
+Settings may be given as environment variables, passed to
+:py:func:`gqlmod.enable_gql_import`, or assigned directly on this module. Most
+of them are read while a ``.gql`` module is being imported, so changing them
+only affects modules imported afterwards.
+"""
+import os
+
+__all__ = 'update',
+
+
+def _env_bool(name, default):
+    val = os.environ.get(name)
+    if val is None:
+        return default
+    return val.strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def _env_int(name, default):
+    val = os.environ.get(name)
+    if not val:
+        return default
+    return int(val)
+
+
+#: Check and coerce variables client-side before sending them to the provider.
+#: (``GQLMOD_VALIDATE_VARIABLES``)
+validate_variables = _env_bool('GQLMOD_VALIDATE_VARIABLES', True)
+
+
+#: Maximum selection depth of imported operations, or None for no limit.
+#: (``GQLMOD_MAX_DEPTH``)
+max_depth = _env_int('GQLMOD_MAX_DEPTH', None)
+
+#: Maximum estimated number of returned values of imported operations, or None
+#: for no limit. (``GQLMOD_MAX_NODES``)
+max_nodes = _env_int('GQLMOD_MAX_NODES', None)
+
+#: Maximum estimated cost of imported operations, or None for no limit.
+#: (``GQLMOD_MAX_COST``)
+max_cost = _env_int('GQLMOD_MAX_COST', None)
+
+#: Assumed length of lists, when nothing else says how long they are.
+#: (``GQLMOD_LIST_SIZE``)
+list_size = _env_int('GQLMOD_LIST_SIZE', 10)
+
+#: What to do when an imported operation exceeds a cost limit: ``'warn'`` or
+#: ``'error'``. (``GQLMOD_COST_LIMIT_ACTION``)
+cost_limit_action = os.environ.get('GQLMOD_COST_LIMIT_ACTION', 'warn')
+
+#: Send the compact form of queries, rather than the pretty-printed one.
+#: (``GQLMOD_MINIFY_QUERIES``)
+minify_queries = _env_bool('GQLMOD_MINIFY_QUERIES', True)
+
+#: Answer queries from a normalized cache of entities when possible (see
+#: :py:mod:`gqlmod.entities`). (``GQLMOD_ENTITY_CACHE``)
+entity_cache = _env_bool('GQLMOD_ENTITY_CACHE', False)
+
+#: Maximum number of entries in the entity cache of each provider.
+#: (``GQLMOD_ENTITY_CACHE_SIZE``)
+entity_cache_size = _env_int('GQLMOD_ENTITY_CACHE_SIZE', 10000)
+
+#: Compile operations into execution plans, for providers that execute
+#: in-process (see :py:mod:`gqlmod.compiler`). (``GQLMOD_COMPILE_PLANS``)
+compile_plans = _env_bool('GQLMOD_COMPILE_PLANS', False)
+
+#: Decode enum values into generated :py:class:`enum.Enum` classes, for enums
+#: without a registered class (see :py:mod:`gqlmod.codecs`).
+#: (``GQLMOD_DECODE_ENUMS``)
+decode_enums = _env_bool('GQLMOD_DECODE_ENUMS', False)
+
+#: Fetch schemas without descriptions or deprecation reasons.
+#: (``GQLMOD_LEAN_SCHEMAS``)
+lean_schemas = _env_bool('GQLMOD_LEAN_SCHEMAS', False)
+
+#: Keep only the parts of the schema each imported module uses (see
+#: :py:mod:`gqlmod.pruning`). (``GQLMOD_PRUNE_SCHEMAS``)
+prune_schemas = _env_bool('GQLMOD_PRUNE_SCHEMAS', False)
+
+
+SETTINGS = (
+    'validate_variables',
+    'max_depth',
+    'max_nodes',
+    'max_cost',
+    'list_size',
+    'cost_limit_action',
+    'minify_queries',
+    'entity_cache',
+    'entity_cache_size',
+    'compile_plans',
+    'decode_enums',
+    'lean_schemas',
+    'prune_schemas',
+)
+
+
+def update(**settings):
+    """
+    Changes several settings at once, rejecting unknown names.
+    """
+    for name in settings:
+        if name not in SETTINGS:
+            raise TypeError(f"Unknown setting {name!r}")
+    globals().update(settings)
@@ -0,0 +1,250 @@
+"""
+Client-side checking of query variables.
+
+The checks are built once per operation, when the module is imported, so each
+call only runs a set of precomputed type checks.
+"""
+import collections.abc
+import enum
+import math
+
+import graphql
+
+from .errors import from_graphql_validate
+
+__all__ = 'build_validator', 'VariableValidator'
+
+MAX_INT = 2 ** 31 - 1
+MIN_INT = -2 ** 31
+
+
+class InvalidValue(Exception):
+    """
+    A scalar value could not be coerced.
+    """
+
+
+def coerce_int(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise InvalidValue(f"Int cannot represent non-integer value: {value!r}")
+    if not MIN_INT <= value <= MAX_INT:
+        raise InvalidValue(f"Int cannot represent non 32-bit signed integer value: {value!r}")
+    return value
+
+
+def coerce_float(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise InvalidValue(f"Float cannot represent non numeric value: {value!r}")
+    if not math.isfinite(value):
+        raise InvalidValue(f"Float cannot represent non numeric value: {value!r}")
+    return float(value)
+
+
+def coerce_string(value):
+    if not isinstance(value, str):
+        raise InvalidValue(f"String cannot represent a non string value: {value!r}")
+    return value
+
+
+def coerce_boolean(value):
+    if not isinstance(value, bool):
+        raise InvalidValue(f"Boolean cannot represent a non boolean value: {value!r}")
+    return value
+
+
+def coerce_id(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    raise InvalidValue(f"ID cannot represent value: {value!r}")
+
+
+BUILTIN_COERCERS = {
+    'Int': coerce_int,
+    'Float': coerce_float,
+    'String': coerce_string,
+    'Boolean': coerce_boolean,
+    'ID': coerce_id,
+}
+
+
+def format_path(path):
+    """
+    Formats a value path (rooted in the variable name) for error messages.
+    """
+    varname, *rest = path
+    bits = [f"${varname}"]
+    for item in rest:
+        if isinstance(item, int):
+            bits.append(f"[{item}]")
+        else:
+            bits.append(f".{item}")
+    return ''.join(bits)
+
+
+def input_object_checker(gtype, fields, required):
+    """
+    Makes the checker for an input object, given the checkers of its fields and
+    the list of fields that must be given.
+    """
+    def check_input_object(value, path, errors):
+        if not isinstance(value, collections.abc.Mapping):
+            errors.append((path, f"Expected type '{gtype.name}' to be a mapping."))
+            return value
+        rv = {}
+        for name, fvalue in value.items():
+            try:
+                check = fields[name]
+            except KeyError:
+                errors.append((path, f"Field '{name}' is not defined by type '{gtype.name}'."))
+                continue
+            rv[name] = check(fvalue, (*path, name), errors)
+        errors.extend(
+            (path, f"Field '{name}' of required type '{ftype}' was not provided.")
+            for name, ftype in required
+            if name not in value
+        )
+        return rv
+
+    return check_input_object
+
+
+class CheckerBuilder:
+    """
+    Builds the checking function for a schema input type.
+
+    A checker has the signature ``check(value, path, errors) -> value``. It
+    returns the coerced value and appends ``(path, message)`` to ``errors`` for
+    every problem found.
+    """
+    def __init__(self):
+        # Input objects may be recursive, so they are built by name
+        self._input_objects = {}
+
+    def build(self, gtype):
+        if isinstance(gtype, graphql.GraphQLNonNull):
+            inner = self.build_nullable(gtype.of_type)
+
+            def check_non_null(value, path, errors):
+                if value is None:
+                    errors.append((path, f"Expected non-nullable type '{gtype}' not to be null."))
+                    return value
+                return inner(value, path, errors)
+
+            return check_non_null
+        else:
+            inner = self.build_nullable(gtype)
+
+            def check_nullable(value, path, errors):
+                if value is None:
+                    return value
+                return inner(value, path, errors)
+
+            return check_nullable
+
+    def build_nullable(self, gtype):
+        if isinstance(gtype, graphql.GraphQLList):
+            return self.build_list(gtype)
+        elif isinstance(gtype, graphql.GraphQLInputObjectType):
+            return self.build_input_object(gtype)
+        elif isinstance(gtype, graphql.GraphQLEnumType):
+            return self.build_enum(gtype)
+        elif isinstance(gtype, graphql.GraphQLScalarType):
+            return self.build_scalar(gtype)
+        else:
+            raise TypeError(f"{gtype!r} is not an input type")
+
+    def build_list(self, gtype):
+        item = self.build(gtype.of_type)
+
+        def check_list(value, path, errors):
+            if isinstance(value, (list, tuple)):
+                return [item(v, (*path, i), errors) for i, v in enumerate(value)]
+            else:
+                # Input coercion wraps single values
+                return [item(value, path, errors)]
+
+        return check_list
+
+    def build_input_object(self, gtype):
+        try:
+            return self._input_objects[gtype.name]
+        except KeyError:
+            pass
+
+        fields = {}
+        required = []
+        check = self._input_objects[gtype.name] = input_object_checker(gtype, fields, required)
+        # Filled in afterwards, so that recursive references find the checker
+        for name, field in gtype.fields.items():
+            fields[name] = self.build(field.type)
+            if graphql.is_non_null_type(field.type) and field.default_value is graphql.Undefined:
+                required.append((name, field.type))
+        return check
+
+    def build_enum(self, gtype):
+        names = frozenset(gtype.values)
+
+        def check_enum(value, path, errors):
+            if isinstance(value, enum.Enum):
+                value = value.name
+            if isinstance(value, str) and value in names:
+                return value
+            errors.append((path, f"Value {value!r} does not exist in '{gtype.name}' enum."))
+            return value
+
+        return check_enum
+
+    def build_scalar(self, gtype):
+        try:
+            coerce = BUILTIN_COERCERS[gtype.name]
+        except KeyError:
+            # Custom scalars are only understood by the server
+            return lambda value, path, errors: value
+
+        def check_scalar(value, path, errors):
+            try:
+                return coerce(value)
+            except InvalidValue as exc:
+                errors.append((path, str(exc)))
+                return value
+
+        return check_scalar
+
+
+class VariableValidator:
+    """
+    Checks and coerces the variables of a single operation.
+
+    Call it with a dict of variables to get the coerced dict back. All problems
+    are collected and raised together as GraphQL errors.
+    """
+    def __init__(self, checkers):
+        self.checkers = checkers
+
+    def __call__(self, variables):
+        errors = []
+        rv = {
+            name: self.checkers[name](value, (name,), errors)
+            for name, value in variables.items()
+        }
+        if errors:
+            raise from_graphql_validate([
+                graphql.GraphQLError(f"Variable '{format_path(path)}' got invalid value; {msg}")
+                for path, msg in errors
+            ])
+        return rv
+
+
+def build_validator(definition, schema):
+    """
+    Builds a :py:class:`VariableValidator` for the given operation definition.
+    """
+    builder = CheckerBuilder()
+    return VariableValidator({
+        var.variable.name.value: builder.build(graphql.type_from_ast(schema, var.type))
+        for var in definition.variable_definitions
+    })
@@ -0,0 +1,154 @@
+"""
+Watching .gql files, for ``gqlmod check --watch``.
+
+Files are compared by modification time and size. If :py:mod:`watchdog` is
+installed (the ``watch`` extra), file system events wake the watcher as soon as
+something is saved; otherwise, it falls back to polling.
+
+Schemas, fragment libraries, and the imports of each file are kept between
+rounds, so only changed files, and the files importing them, are checked again.
+"""
+import os
+import pathlib
+import threading
+import time
+
+from .importer import read_code
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+__all__ = 'DocumentSet', 'watch'
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_imports(path):
+    """
+    Gets the absolute paths of the fragment libraries a file imports.
+    """
+    try:
+        with open(path, 'rt', encoding='utf-8') as fobj:
+            _, imports, _, _ = read_code(fobj)
+    except OSError:
+        return ()
+    return tuple(os.path.abspath(os.path.join(os.path.dirname(path), name)) for name in imports)
+
+
+class DocumentSet:
+    """
+    The .gql files being watched: either a fixed list, or everything under a
+    directory (picking up new files).
+    """
+    def __init__(self, paths=(), root=None):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.root = root
+        self.stats = {}
+        self.imports = {}
+
+    def files(self):
+        if self.root is None:
+            return list(self.paths)
+        return [str(path.resolve()) for path in pathlib.Path(self.root).glob("**/*.gql")]
+
+    def poll(self):
+        """
+        Finds the files that were added, changed, or removed since the last
+        poll (every file, the first time).
+
+        Imported libraries are watched too, even when they aren't checked.
+        """
+        changed = set()
+        current = {}
+        pending = set(self.files())
+        for imports in self.imports.values():
+            pending.update(imports)
+        while pending:
+            path = pending.pop()
+            stat = _stat(path)
+            if stat is None:
+                continue
+            current[path] = stat
+            if self.stats.get(path) != stat:
+                changed.add(path)
+                self.imports[path] = read_imports(path)
+            pending.update(set(self.imports.get(path, ())) - current.keys())
+        for path in self.stats.keys() - current.keys():
+            changed.add(path)
+            self.imports.pop(path, None)
+        self.stats = current
+        return changed
+
+    def affected(self, changed):
+        """
+        Finds the checked files affected by the given changes: the files
+        themselves, and the ones importing them (directly or indirectly).
+        """
+        found = set(changed)
+        pending = list(changed)
+        while pending:
+            path = pending.pop()
+            for other, imports in self.imports.items():
+                if path in imports and other not in found:
+                    found.add(other)
+                    pending.append(other)
+        files = set(self.files())
+        return sorted(path for path in found if path in self.stats and path in files)
+
+
+def _start_observer(docs, wakeup):
+    """
+    Starts a watchdog observer to set wakeup on changes, or returns None.
+    """
+    if Observer is None:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wakeup.set()
+
+    dirs = {os.path.dirname(path) for path in docs.files()}
+    if docs.root is not None:
+        dirs = {os.path.abspath(docs.root)}
+    observer = Observer()
+    for dirname in dirs:
+        observer.schedule(Handler(), dirname, recursive=docs.root is not None)
+    observer.start()
+    return observer
+
+
+def watch(docs, callback, interval=0.5, stop=None):
+    """
+    Calls callback(paths) with the affected files, first all of them and then
+    whenever some change, until stop (a threading.Event) is set.
+
+    Without watchdog, files are polled every interval seconds.
+    """
+    stop = stop or threading.Event()
+    wakeup = threading.Event()
+    observer = _start_observer(docs, wakeup)
+    try:
+        callback(docs.affected(docs.poll()))
+        while not stop.is_set():
+            wakeup.wait(interval)
+            wakeup.clear()
+            # Let the editor finish writing
+            time.sleep(0.005)
+            changed = docs.poll()
+            if changed:
+                paths = docs.affected(changed)
+                if paths:
+                    callback(paths)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
@@ -1,16 +1,47 @@
 """
 The demo Star Wars graphql data set.
 
-Purely local.
+Purely local. By default it serves the handful of canon characters, but it can
+also serve a large synthetic data set, to be a benchmark target::
+
+    with gqlmod.with_provider('starwars', size=100_000, degree=8, batch=True):
+        ...
+
+With ``batch``, friends are loaded a level at a time instead of one by one
+(avoiding the N+1 problem), and ``latency`` simulates the time of each fetch
+from the data.
 """
 from graphql import graphql_sync, graphql as graphql_async
+from .data import canon
+from .loaders import Context
 from .schema import star_wars_schema
+from .synthetic import generate
 
 
 class StarWarsProvider:
+    dataset = canon
+    batch = False
+
+    def __init__(self, *, dataset=None, size=None, degree=5, seed=0, batch=False, latency=0):
+        if dataset is None and size is not None:
+            dataset = generate(size, degree, seed, latency=latency)
+        if dataset is not None:
+            self.dataset = dataset
+        self.batch = batch
+
+    def get_executable_schema(self):
+        return star_wars_schema
+
+    def get_context_value(self):
+        return Context(self.dataset, self.batch)
+
     def query_sync(self, query, variables):
-        return graphql_sync(star_wars_schema, query, variable_values=variables)
+        return graphql_sync(
+            star_wars_schema, query, variable_values=variables, context_value=self.get_context_value(),
+        )
 
     async def query_async(self, query, variables):
         # Because this is all in-memory data, there isn't really benefit of async
-        return await graphql_async(star_wars_schema, query, variable_values=variables)
+        return await graphql_async(
+            star_wars_schema, query, variable_values=variables, context_value=self.get_context_value(),
+        )
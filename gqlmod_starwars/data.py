@@ -6,9 +6,18 @@ data from a backend service rather than from hardcoded JSON objects in a more co
 demo.
 """
 
-from typing import Sequence, Iterator
-
-__all__ = ["get_droid", "get_friends", "get_hero", "get_human", "get_secret_backstory"]
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+__all__ = [
+    "Dataset",
+    "canon",
+    "get_droid",
+    "get_friends",
+    "get_hero",
+    "get_human",
+    "get_secret_backstory",
+]
 
 # These are classes which correspond to the schema.
 # They represent the shape of the data visited during field resolution.
@@ -102,36 +111,87 @@ artoo = Droid(
 droid_data = {"2000": threepio, "2001": artoo}
 
 
+class Dataset:
+    """A set of characters, indexed by id.
+
+    Every :py:meth:`fetch` stands in for a round trip to a backend: it is
+    counted in ``fetches``, and takes ``latency`` seconds.
+    """
+
+    def __init__(
+        self,
+        characters: Iterable[Character],
+        heroes: Dict[Optional[int], str],
+        latency: float = 0,
+    ):
+        self.characters = {character.id: character for character in characters}
+        # Episode (or None for the whole saga) -> character id
+        self.heroes = heroes
+        self.latency = latency
+        self.fetches = 0
+
+    def __len__(self):
+        return len(self.characters)
+
+    def fetch(self, ids: Iterable[str]) -> List[Character]:
+        """Gets several characters at once."""
+        self.fetches += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.characters.get(id) for id in ids]
+
+    # noinspection PyShadowingBuiltins
+    def get_character(self, id: str) -> Character:
+        return self.fetch([id])[0]
+
+    def get_friends(self, character: Character) -> Iterator[Character]:
+        """Gets friends one at a time (N+1 style)."""
+        return map(self.get_character, character.friends)
+
+    def get_hero(self, episode: Optional[int]) -> Character:
+        return self.get_character(self.heroes.get(episode, self.heroes[None]))
+
+    # noinspection PyShadowingBuiltins
+    def get_human(self, id: str) -> Human:
+        character = self.get_character(id)
+        return character if isinstance(character, Human) else None  # type: ignore
+
+    # noinspection PyShadowingBuiltins
+    def get_droid(self, id: str) -> Droid:
+        character = self.get_character(id)
+        return character if isinstance(character, Droid) else None  # type: ignore
+
+
+# Luke is the hero of Episode V. Artoo is the hero otherwise.
+canon = Dataset([*human_data.values(), *droid_data.values()], heroes={5: "1000", None: "2001"})
+
+
 # noinspection PyShadowingBuiltins
 def get_character(id: str) -> Character:
     """Helper function to get a character by ID."""
-    return human_data.get(id) or droid_data.get(id)  # type: ignore
+    return canon.get_character(id)
 
 
 def get_friends(character: Character) -> Iterator[Character]:
     """Allows us to query for a character's friends."""
-    return map(get_character, character.friends)
+    return canon.get_friends(character)
 
 
 def get_hero(episode: int) -> Character:
     """Allows us to fetch the undisputed hero of the trilogy, R2-D2."""
-    if episode == 5:
-        # Luke is the hero of Episode V.
-        return luke
-    # Artoo is the hero otherwise.
-    return artoo
+    return canon.get_hero(episode)
 
 
 # noinspection PyShadowingBuiltins
 def get_human(id: str) -> Human:
     """Allows us to query for the human with the given id."""
-    return human_data.get(id)  # type: ignore
+    return canon.get_human(id)
 
 
 # noinspection PyShadowingBuiltins
 def get_droid(id: str) -> Droid:
     """Allows us to query for the droid with the given id."""
-    return droid_data.get(id)  # type: ignore
+    return canon.get_droid(id)
 
 
 # noinspection PyUnusedLocal
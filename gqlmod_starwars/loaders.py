@@ -0,0 +1,64 @@
+"""Per-request data loading, with optional batching of friend lookups.
+
+Resolvers find the data set and loader in the request context. Without one
+(like when the schema is executed directly), they use the canon data, one
+character at a time.
+"""
+from typing import Dict, List, Optional
+
+from .data import Character, Dataset, canon
+
+__all__ = ["Context", "FriendLoader", "get_dataset", "resolve_friends"]
+
+
+class FriendLoader:
+    """Loads friends a whole level of the query at a time.
+
+    Execution resolves ``friends`` for each character in a list separately,
+    which would take a fetch per friend. Instead, the first time the friends of
+    a character are asked for, the friends of every character fetched
+    alongside it (its siblings in the previous batch) are fetched too, in a
+    single call. The results are kept for the rest of the request.
+    """
+
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        # Character id -> the batch it was fetched in
+        self._batches: Dict[str, List[Character]] = {}
+        # Character id -> its friends
+        self._friends: Dict[str, List[Character]] = {}
+
+    def load_friends(self, character: Character) -> List[Character]:
+        if character.id not in self._friends:
+            self._load_batch(self._batches.get(character.id, [character]))
+        return self._friends[character.id]
+
+    def _load_batch(self, batch: List[Character]):
+        pending = [c for c in batch if c.id not in self._friends]
+        wanted = list(dict.fromkeys(fid for c in pending for fid in c.friends))
+        fetched = [c for c in self.dataset.fetch(wanted) if c is not None]
+        for friend in fetched:
+            self._batches.setdefault(friend.id, fetched)
+        by_id = {c.id: c for c in fetched}
+        for character in pending:
+            self._friends[character.id] = [by_id.get(fid) for fid in character.friends]
+
+
+class Context:
+    """The request context of the Star Wars schema."""
+
+    def __init__(self, dataset: Dataset, batch: bool = False):
+        self.dataset = dataset
+        self.loader: Optional[FriendLoader] = FriendLoader(dataset) if batch else None
+
+
+def get_dataset(info) -> Dataset:
+    dataset = getattr(info.context, "dataset", None)
+    return canon if dataset is None else dataset
+
+
+def resolve_friends(character: Character, info):
+    loader = getattr(info.context, "loader", None)
+    if loader is None:
+        return get_dataset(info).get_friends(character)
+    return loader.load_friends(character)
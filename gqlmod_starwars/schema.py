@@ -55,13 +55,8 @@ from graphql.type import (
     GraphQLSchema,
     GraphQLString,
 )
-from .data import (
-    get_droid,
-    get_friends,
-    get_hero,
-    get_human,
-    get_secret_backstory,
-)
+from .data import get_secret_backstory
+from .loaders import get_dataset, resolve_friends
 
 __all__ = ["star_wars_schema"]
 
@@ -143,7 +138,7 @@ human_type = GraphQLObjectType(
             GraphQLList(character_interface),
             description="The friends of the human,"
             " or an empty list if they have none.",
-            resolve=lambda human, _info: get_friends(human),
+            resolve=resolve_friends,
         ),
         "appearsIn": GraphQLField(
             GraphQLList(episode_enum), description="Which movies they appear in."
@@ -185,7 +180,7 @@ droid_type = GraphQLObjectType(
             GraphQLList(character_interface),
             description="The friends of the droid,"
             " or an empty list if they have none.",
-            resolve=lambda droid, _info: get_friends(droid),
+            resolve=resolve_friends,
         ),
         "appearsIn": GraphQLField(
             GraphQLList(episode_enum), description="Which movies they appear in."
@@ -230,7 +225,7 @@ query_type = GraphQLObjectType(
                     ),
                 )
             },
-            resolve=lambda root, _info, episode=None: get_hero(episode),
+            resolve=lambda root, info, episode=None: get_dataset(info).get_hero(episode),
         ),
         "human": GraphQLField(
             human_type,
@@ -239,7 +234,7 @@ query_type = GraphQLObjectType(
                     GraphQLNonNull(GraphQLString), description="id of the human"
                 )
             },
-            resolve=lambda root, _info, id: get_human(id),
+            resolve=lambda root, info, id: get_dataset(info).get_human(id),
         ),
         "droid": GraphQLField(
             droid_type,
@@ -248,7 +243,7 @@ query_type = GraphQLObjectType(
                     GraphQLNonNull(GraphQLString), description="id of the droid"
                 )
             },
-            resolve=lambda root, _info, id: get_droid(id),
+            resolve=lambda root, info, id: get_dataset(info).get_droid(id),
         ),
     },
 )
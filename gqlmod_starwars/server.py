@@ -0,0 +1,218 @@
+"""
+A small local GraphQL-over-HTTP server, as a stand-in for a real service when
+testing and benchmarking HTTP providers.
+
+It serves the Star Wars schema by default::
+
+    with StandInServer() as server:
+        ...  # Send requests to server.url
+"""
+import collections
+import gzip
+import hashlib
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+import zlib
+
+from graphql import graphql_sync
+
+from .schema import star_wars_schema
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = 'StandInServer',
+
+
+DECODERS = {
+    'identity': lambda data: data,
+    'gzip': gzip.decompress,
+    'deflate': zlib.decompress,
+}
+ENCODERS = {
+    'gzip': gzip.compress,
+}
+if brotli is not None:
+    DECODERS['br'] = brotli.decompress
+    ENCODERS['br'] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    # Compressor objects aren't thread-safe
+    DECODERS['zstd'] = lambda data: zstandard.ZstdDecompressor().decompress(data)
+    ENCODERS['zstd'] = lambda data: zstandard.ZstdCompressor().compress(data)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def apply_fault(self):
+        """
+        Applies the next injected fault, if any. Returns True if the request
+        has been dealt with.
+        """
+        server = self.server.standin
+        with server.lock:
+            fault = server.faults.popleft() if server.faults else None
+        if fault is None:
+            return False
+        delay, status, drop = fault
+        time.sleep(delay)
+        if drop:
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return True
+        elif status is not None:
+            self.send_body(status, b'Injected failure')
+            return True
+        else:
+            return False
+
+    def do_POST(self):
+        server = self.server.standin
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        encoding = self.headers.get('Content-Encoding', 'identity')
+        try:
+            body = DECODERS[encoding](body)
+        except KeyError:
+            self.send_body(415, b'Unsupported Content-Encoding')
+            return
+        with server.lock:
+            server.requests.append(self.headers)
+            server.bytes_received += int(self.headers.get('Content-Length', 0))
+        if self.apply_fault():
+            return
+
+        request = json.loads(body)
+        self.respond(request.get('query'), request.get('variables'))
+
+    def do_GET(self):
+        server = self.server.standin
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        with server.lock:
+            server.requests.append(self.headers)
+        if self.apply_fault():
+            return
+        query, = params.get('query', [None])
+        variables, = params.get('variables', ['null'])
+        self.respond(query, json.loads(variables), cacheable=True)
+
+    def respond(self, query, variables, cacheable=False):
+        server = self.server.standin
+        result = graphql_sync(server.schema, query, variable_values=variables)
+        response = {'data': result.data}
+        if result.errors:
+            response['errors'] = [err.formatted for err in result.errors]
+        body = json.dumps(response).encode('utf-8')
+
+        headers = []
+        if cacheable:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers = [('ETag', etag), ('Cache-Control', server.cache_control)]
+            if self.headers.get('If-None-Match') == etag:
+                with server.lock:
+                    server.not_modified += 1
+                self.send_response(304)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        self.send_body(200, body, 'application/json', headers)
+
+    def choose_encoding(self):
+        accepted = [
+            item.split(';')[0].strip()
+            for item in self.headers.get('Accept-Encoding', '').split(',')
+        ]
+        for encoding in accepted:
+            if encoding in ENCODERS:
+                return encoding
+
+    def send_body(self, status, body, content_type='text/plain', headers=()):
+        server = self.server.standin
+        encoding = self.choose_encoding()
+        self.send_response(status)
+        if encoding is not None and len(body) >= server.compression_threshold:
+            body = ENCODERS[encoding](body)
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.bytes_sent += len(body)
+
+
+class StandInServer:
+    """
+    Runs a GraphQL server for a schema in a background thread.
+
+    Use it as a context manager; :py:attr:`url` is the endpoint to send
+    requests to. Counters of requests and bytes on the wire are kept for
+    inspection.
+    """
+    handler = StandInHandler
+
+    #: Compress responses at least this long, if the client accepts it
+    compression_threshold = 1024
+
+    #: The Cache-Control header for GET responses, which also get ETags
+    cache_control = 'no-cache'
+
+    def __init__(self, schema=star_wars_schema, host='127.0.0.1', port=0):
+        self.schema = schema
+        self.lock = threading.Lock()
+        self.faults = collections.deque()
+        self.reset_stats()
+        self.httpd = http.server.ThreadingHTTPServer((host, port), self.handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+    def inject(self, *, delay=0, status=None, drop=False, count=1):
+        """
+        Makes the next count requests misbehave: wait delay seconds, and then
+        either answer with the given HTTP status, drop the connection without
+        answering, or (with neither) answer normally.
+        """
+        with self.lock:
+            self.faults.extend([(delay, status, drop)] * count)
+
+    def reset_stats(self):
+        #: The headers of each request received
+        self.requests = []
+        #: Bytes of request bodies received (as sent on the wire)
+        self.bytes_received = 0
+        #: Bytes of response bodies sent (as sent on the wire)
+        self.bytes_sent = 0
+        #: Number of 304 Not Modified responses sent
+        self.not_modified = 0
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
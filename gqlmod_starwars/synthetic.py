@@ -0,0 +1,59 @@
+"""Generates large, random Star Wars data sets.
+
+The characters are like the canon ones, but there are as many as you like,
+each with ``degree`` friends, reproducibly from a seed::
+
+    dataset = generate(100_000, degree=8, seed=42)
+"""
+import random
+from typing import Optional
+
+from .data import Dataset, Droid, Human
+
+__all__ = ["generate"]
+
+SYLLABLES = ["ka", "lo", "ren", "ob", "wan", "tu", "sha", "ar", "vek", "mi", "dor", "ya", "zin", "el", "qui"]
+PLANETS = ["Tatooine", "Alderaan", "Naboo", "Hoth", "Dagobah", "Endor", "Kashyyyk", "Corellia", None]
+FUNCTIONS = ["Protocol", "Astromech", "Medical", "Battle", "Power", "Labor"]
+EPISODES = [4, 5, 6]
+
+
+def _name(rng: random.Random) -> str:
+    first = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+    last = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+    return f"{first.title()} {last.title()}"
+
+
+def generate(
+    size: int = 1000,
+    degree: int = 5,
+    seed: Optional[int] = 0,
+    droid_ratio: float = 0.2,
+    latency: float = 0,
+) -> Dataset:
+    """Generates a data set of ``size`` characters (humans and droids, by
+    ``droid_ratio``), each with ``degree`` distinct friends (or everyone else,
+    if there aren't that many).
+
+    ``latency`` is the simulated time of each fetch from the data set.
+    """
+    rng = random.Random(seed)
+    ids = [str(1000 + i) for i in range(size)]
+    degree = min(degree, size - 1)
+    characters = []
+    for id in ids:
+        friends = []
+        while len(friends) < degree:
+            friend = ids[rng.randrange(size)]
+            if friend != id and friend not in friends:
+                friends.append(friend)
+        appears_in = sorted(rng.sample(EPISODES, rng.randint(1, len(EPISODES))))
+        if rng.random() < droid_ratio:
+            characters.append(Droid(id, _name(rng), friends, appears_in, rng.choice(FUNCTIONS)))
+        else:
+            characters.append(Human(id, _name(rng), friends, appears_in, rng.choice(PLANETS)))
+
+    heroes = {None: ids[0]}
+    for episode in EPISODES:
+        heroes[episode] = rng.choice(ids)
+    return Dataset(characters, heroes, latency)
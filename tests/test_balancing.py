@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from gqlmod.helpers.balancing import LoadBalancer
+
+
+def test_round_robin():
+    lb = LoadBalancer(['a', 'b', 'c'])
+    picked = []
+    for _ in range(6):
+        ep = lb.pick()
+        picked.append(ep.url)
+        lb.finish(ep, True, 0.01)
+    assert sorted(picked) == ['a', 'a', 'b', 'b', 'c', 'c']
+
+
+def test_least_outstanding():
+    lb = LoadBalancer(['a', 'b'], 'least_outstanding')
+    busy = lb.pick()
+    assert lb.pick() is not busy
+    for _ in range(4):
+        lb.pick()
+    assert [ep.outstanding for ep in lb.endpoints] == [3, 3]
+    lb.finish(busy, True, 0.01)
+    assert lb.pick() is busy
+
+
+def test_ewma():
+    lb = LoadBalancer(['slow', 'fast'], 'ewma')
+    slow, fast = lb.endpoints
+    for ep, elapsed in [(slow, 0.5), (fast, 0.01), (fast, 0.03)]:
+        lb.finish(lb.pick(), None, None)
+        ep.outstanding += 1
+        lb.finish(ep, True, elapsed)
+    assert slow.latency == 0.5
+    assert fast.latency == pytest.approx(0.016)
+    assert [lb.pick().url for _ in range(3)] == ['fast'] * 3
+    # Until enough requests pile up on it
+    for _ in range(30):
+        lb.pick()
+    assert slow.outstanding > 0
+
+
+def test_eject_and_readmit():
+    lb = LoadBalancer(['a', 'b'], failure_threshold=2, eject_time=0.1)
+    a, b = lb.endpoints
+    for _ in range(2):
+        lb.pick()
+        lb.finish(a, False, 0.01)
+    assert [ep['ejected'] for ep in lb.stats()] == [True, False]
+    assert {lb.pick().url for _ in range(4)} == {'b'}
+
+    time.sleep(0.15)
+    assert 'a' in {lb.pick().url for _ in range(2)}
+    # A failure while readmitted ejects it again, for longer
+    lb.finish(a, False, 0.01)
+    assert a.ejected_until - time.monotonic() > 0.15
+
+    time.sleep(0.25)
+    lb.finish(a, True, 0.01)
+    assert a.ejected_until is None and a.ejections == 0
+
+
+def test_all_ejected():
+    lb = LoadBalancer(['a', 'b'], failure_threshold=1)
+    for ep in lb.endpoints:
+        lb.finish(ep, False, 0.01)
+    # Something is better than nothing
+    assert lb.pick().url == 'a'
+
+
+def test_abandoned():
+    lb = LoadBalancer(['a'], failure_threshold=1)
+    ep = lb.pick()
+    lb.finish(ep, None, None)
+    assert ep.outstanding == 0
+    assert not lb.stats()[0]['ejected']
+
+
+def test_bad_policy():
+    with pytest.raises(ValueError):
+        LoadBalancer(['a'], 'random')
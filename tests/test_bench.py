@@ -0,0 +1,58 @@
+import json
+
+import click.testing
+
+from gqlmod.bench import BenchResult, percentile
+from gqlmod.cli import cli
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
+
+
+def test_summary():
+    result = BenchResult()
+    for latency in (0.001, 0.002, 0.003):
+        result.record(latency)
+    result.record(None, ValueError())
+    result.elapsed = 2.0
+    summary = result.summary()
+    assert summary['requests'] == 4
+    assert summary['throughput'] == 2.0
+    assert summary['error_types'] == {'ValueError': 1}
+    assert summary['latency_ms']['p50'] == 2.0
+    assert summary['latency_ms']['max'] == 3.0
+
+
+def test_cli_sync():
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, [
+        'bench', 'testmod.queries', 'HeroForEpisode', '--variables', '{"ep": "EMPIRE"}',
+        '-n', '20', '-c', '2', '--json',
+    ])
+    assert result.exit_code == 0, result.output
+    summary = json.loads(result.output)
+    assert summary['requests'] == 20
+    assert summary['errors'] == 0
+
+
+def test_cli_async():
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, [
+        'bench', 'testmod.queries', 'HeroForEpisode', '--variables', '{"ep": "EMPIRE"}',
+        '-n', '10', '-c', '2', '--async', '--rate', '500',
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('HeroForEpisode: 10 requests')
+    assert 'p99' in result.output
+
+
+def test_cli_unknown_operation():
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, ['bench', 'testmod.queries', 'Nope', '-n', '1'])
+    assert result.exit_code != 0
+    assert "no operation 'Nope'" in result.output
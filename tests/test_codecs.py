@@ -0,0 +1,162 @@
+import datetime
+import decimal
+import enum
+
+import graphql
+import pytest
+
+from gqlmod import codecs, settings
+from gqlmod.providers import _mock_provider
+
+SDL = """
+scalar DateTime
+scalar Decimal
+
+enum Status { OPEN CLOSED }
+
+input Filter {
+  since: DateTime
+  status: Status
+  and: [Filter!]
+}
+
+type Order {
+  id: ID!
+  placed: DateTime!
+  total: Decimal
+  status: Status!
+  note: String
+}
+
+type Query {
+  orders(filter: Filter): [Order!]!
+  latest: Order
+}
+"""
+
+QUERIES = """#~codecs-test~
+query Orders($filter: Filter) {
+  orders(filter: $filter) {
+    id
+    placed
+    ...money
+  }
+}
+
+query Notes {
+  latest { id note }
+}
+
+fragment money on Order {
+  total
+  status
+}
+"""
+
+ORDERS = {'orders': [
+    {'id': '1', 'placed': '2020-01-02T03:04:05Z', 'total': '9.99', 'status': 'OPEN'},
+    {'id': '2', 'placed': '2020-02-03T04:05:06+00:00', 'total': None, 'status': 'CLOSED'},
+]}
+
+
+class Status(enum.Enum):
+    OPEN = 'open'
+    CLOSED = 'closed'
+
+
+class CannedProvider:
+    def __init__(self):
+        self.variables = []
+
+    def get_schema_str(self):
+        return SDL
+
+    def query_sync(self, query, variables):
+        self.variables.append(variables)
+        data = ORDERS if 'orders' in query else {'latest': {'id': '3', 'note': 'hi'}}
+        return graphql.ExecutionResult(data=data, errors=None)
+
+
+@pytest.fixture
+def queries(tmp_path, monkeypatch):
+    (tmp_path / 'codec_queries.gql').write_text(QUERIES)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(codecs, '_scalars', {'codecs-test': {
+        'DateTime': codecs.DATETIME,
+        'Decimal': codecs.DECIMAL,
+    }})
+    monkeypatch.setattr(codecs, '_enums', {'codecs-test': {'Status': Status}})
+    import gqlmod.enable  # noqa
+    prov = CannedProvider()
+    with _mock_provider('codecs-test', prov):
+        import codec_queries_sync
+        yield codec_queries_sync, prov
+
+
+def test_decode(queries):
+    q, _ = queries
+    first, second = q.Orders()['orders']
+    assert first == {
+        'id': '1',
+        'placed': datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        'total': decimal.Decimal('9.99'),
+        'status': Status.OPEN,
+    }
+    assert second['total'] is None
+    assert second['status'] is Status.CLOSED
+    # The provider's data is left alone
+    assert ORDERS['orders'][0]['placed'] == '2020-01-02T03:04:05Z'
+
+
+def test_encode(queries):
+    q, prov = queries
+    since = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    q.Orders(filter={'since': since, 'status': Status.CLOSED, 'and': [{'since': since}]})
+    assert prov.variables[-1] == {'filter': {
+        'since': '2020-01-01T00:00:00+00:00',
+        'status': 'CLOSED',
+        'and': [{'since': '2020-01-01T00:00:00+00:00'}],
+    }}
+
+
+class ExecutingProvider(CannedProvider):
+    # Honors aliases, for merged operations
+    schema = graphql.build_schema(SDL)
+
+    def query_sync(self, query, variables):
+        self.variables.append(variables)
+        root = {**ORDERS, 'latest': {'id': '3', 'note': 'hi'}}
+        return graphql.graphql_sync(self.schema, query, root_value=root, variable_values=variables)
+
+
+def test_merged(queries):
+    from gqlmod.merging import call, run_sync
+    q, _ = queries
+    prov = ExecutingProvider()
+    since = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    with _mock_provider('codecs-test', prov):
+        direct = q.Orders(filter={'since': since, 'status': Status.CLOSED})
+        orders, notes = run_sync(call(q.Orders, filter={'since': since, 'status': Status.CLOSED}), call(q.Notes))
+        assert orders == direct
+        assert orders['orders'][0]['status'] is Status.OPEN
+        assert notes == q.Notes()
+    direct_variables, merged_variables, _ = prov.variables
+    assert merged_variables == {'op0_filter': direct_variables['filter']}
+    assert direct_variables['filter']['status'] == 'CLOSED'
+
+
+def test_untouched(queries):
+    q, _ = queries
+    # Nothing to convert, so no codec
+    assert not hasattr(q, '__run_Notes__')
+    assert q.Notes() == {'latest': {'id': '3', 'note': 'hi'}}
+
+
+def test_generated_enums(monkeypatch):
+    schema = graphql.build_schema(SDL)
+    monkeypatch.setattr(settings, 'decode_enums', False)
+    assert codecs.get_enum('codecs-generated', schema.get_type('Status')) is None
+    monkeypatch.setattr(settings, 'decode_enums', True)
+    cls = codecs.get_enum('codecs-generated', schema.get_type('Status'))
+    assert [member.name for member in cls] == ['OPEN', 'CLOSED']
+    assert codecs.get_enum('codecs-generated', schema.get_type('Status')) is cls
@@ -0,0 +1,129 @@
+import graphql
+import pytest
+
+from gqlmod import settings
+from gqlmod.compiler import compile_operation, verify
+from gqlmod.helpers.types import annotate
+from gqlmod.providers import _mock_provider
+from gqlmod_starwars import StarWarsProvider, star_wars_schema
+from gqlmod_starwars.loaders import Context
+from gqlmod_starwars.synthetic import generate
+
+STARWARS_QUERIES = [
+    ("{ hero { name friends { name } } }", None),
+    ("query($ep: Episode) { hero(episode: $ep) { __typename id ...on Human { homePlanet } } }", {'ep': 'EMPIRE'}),
+    ("{ luke: human(id: \"1000\") { ...names } r2: droid(id: \"2001\") { ...names primaryFunction } }"
+     " fragment names on Character { name friends { name appearsIn } }", None),
+    # Resolver errors, with a nullable field
+    ("{ hero { name secretBackstory friends { secretBackstory } } }", None),
+    ("{ hero { name @skip(if: true) id @include(if: false) appearsIn } }", None),
+    ("query($id: String!) { human(id: $id) { name } }", {'id': 'nope'}),
+    # Bad variables
+    ("query($ep: Episode) { hero(episode: $ep) { name } }", {'ep': 'PHANTOM'}),
+]
+
+
+def _plan(text, schema):
+    doc = graphql.parse(text)
+    assert not graphql.validate(schema, doc)
+    annotate(doc, schema)
+    return compile_operation(doc.definitions[0], schema)
+
+
+@pytest.mark.parametrize('text,variables', STARWARS_QUERIES)
+def test_starwars_equivalence(text, variables):
+    verify(_plan(text, star_wars_schema), variables)
+
+
+def test_batched_context():
+    dataset = generate(300, degree=4, seed=3)
+    plan = _plan("{ hero { name friends { name friends { id } } } }", star_wars_schema)
+    result = verify(plan, context=Context(dataset, batch=True))
+    assert len(result.data['hero']['friends']) == 4
+
+
+SCHEMA = graphql.build_schema("""
+type Item { id: ID! name: String! tags: [String!] }
+type Query {
+  items: [Item!]!
+  broken: Item
+  maybe: [Item]
+}
+type Mutation { add(name: String!): Item! }
+""")
+
+
+def _broken_name(item, info):
+    if item['id'] == '2':
+        raise ValueError("name is broken")
+    return item['name']
+
+
+SCHEMA.query_type.fields['items'].resolve = lambda root, info: [
+    {'id': '1', 'name': 'one', 'tags': ['a']}, {'id': '2', 'name': 'two', 'tags': None},
+]
+SCHEMA.query_type.fields['broken'].resolve = lambda root, info: {'id': '1', 'name': None}
+SCHEMA.query_type.fields['maybe'].resolve = lambda root, info: [{'id': '1', 'name': 'x'}, ValueError("item"), None]
+SCHEMA.mutation_type.fields['add'].resolve = lambda root, info, name: {'id': '9', 'name': name}
+
+
+@pytest.mark.parametrize('text', [
+    "{ items { id name tags } }",
+    # Non-null errors propagate to the nearest nullable field
+    "{ broken { id name } }",
+    "{ maybe { id name } }",
+    "mutation { first: add(name: \"a\") { id name } second: add(name: \"b\") { name } }",
+])
+def test_error_equivalence(text):
+    verify(_plan(text, SCHEMA))
+
+
+def test_non_null_to_root():
+    SCHEMA.get_type('Item').fields['name'].resolve = _broken_name
+    try:
+        result = verify(_plan("{ items { name } }", SCHEMA))
+    finally:
+        SCHEMA.get_type('Item').fields['name'].resolve = None
+    assert result.data is None
+    assert result.errors[0].path == ['items', 1, 'name']
+
+
+def test_unsupported():
+    introspection = graphql.parse("{ __schema { queryType { name } } }").definitions[0]
+    assert compile_operation(introspection, star_wars_schema) is None
+    assert _plan("query($x: Boolean!) { hero { name @include(if: $x) } }", star_wars_schema) is None
+
+
+class CountingProvider(StarWarsProvider):
+    calls = 0
+
+    def query_sync(self, query, variables):
+        self.calls += 1
+        return super().query_sync(query, variables)
+
+
+def test_generated(tmp_path, monkeypatch):
+    (tmp_path / 'compiled_queries.gql').write_text("""#~starwars~
+query HeroFriends($episode: Episode) {
+  hero(episode: $episode) { name friends { name } }
+}
+""")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(settings, 'compile_plans', True)
+    import gqlmod.enable  # noqa
+    import compiled_queries_sync as q
+
+    prov = CountingProvider()
+    with _mock_provider('starwars', prov):
+        data = q.HeroFriends(episode='EMPIRE')
+    assert data['hero']['name'] == 'Luke Skywalker'
+    assert prov.calls == 0
+
+    # Providers that aren't in-process get the query as usual
+    class Wrapper:
+        def query_sync(self, query, variables):
+            return prov.query_sync(query, variables)
+
+    with _mock_provider('starwars', Wrapper()):
+        assert q.HeroFriends(episode='EMPIRE') == data
+    assert prov.calls == 1
@@ -0,0 +1,83 @@
+import click.testing
+import graphql
+import pytest
+
+import gqlmod.enable  # noqa
+from gqlmod import settings
+from gqlmod.cli import cli
+from gqlmod.cost import estimate_cost, enforce_cost_limits
+from gqlmod.errors import QueryCostError, QueryCostWarning
+from gqlmod.helpers.types import annotate
+from gqlmod.importer import load_and_validate
+
+SCHEMA = graphql.build_schema("""
+directive @cost(weight: Int!) on FIELD_DEFINITION
+directive @listSize(assumedSize: Int, slicingArguments: [String!]) on FIELD_DEFINITION
+
+type User {
+  name: String
+  repos(first: Int, last: Int): [Repo]
+  followers(count: Int): [User] @listSize(slicingArguments: ["count"])
+}
+
+type Repo {
+  name: String
+  stars: Int @cost(weight: 3)
+}
+
+type Query {
+  users: [User] @listSize(assumedSize: 5)
+  me: User
+}
+""")
+
+
+def _estimate(query, **kwargs):
+    gast = graphql.parse(query)
+    annotate(gast, SCHEMA)
+    return estimate_cost(gast.definitions[0], SCHEMA, **kwargs)
+
+
+def test_estimate():
+    cost = _estimate("""
+        query Q($n: Int = 4) {
+          users {
+            repos(first: $n) { name stars }
+            followers(count: 2) { name }
+          }
+          me { ...userName }
+        }
+        fragment userName on User { name }
+    """, list_size=10)
+    assert cost.depth == 3
+    # users(5) + 5 * (repos(4) + 4 * 2 fields) + 5 * (followers(2) + 2) + me + name
+    assert cost.nodes == 5 + 5 * (4 + 8) + 5 * (2 + 2) + 1 + 1
+    # users + 5 * (repos + 4 * 3) + 5 * followers + me
+    assert cost.cost == 1 + 5 * (1 + 12) + 5 + 1
+
+
+def test_list_size_overrides():
+    cost = _estimate("query Q { me { repos { name } } }", list_size=10, list_sizes={'User.repos': 2})
+    assert cost.nodes == 1 + 2 + 2
+
+
+def test_import_limits(monkeypatch):
+    _, gast, schema, _ = load_and_validate('testmod/queries.gql')
+    monkeypatch.setattr(settings, 'max_depth', 2)
+    with pytest.warns(QueryCostWarning):
+        enforce_cost_limits(gast, schema)
+
+    monkeypatch.setattr(settings, 'cost_limit_action', 'error')
+    with pytest.raises((QueryCostError, gqlmod.errors.MultiErrors)):
+        enforce_cost_limits(gast, schema)
+
+
+def test_cli():
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, ['check', '--cost', 'testmod/queries.gql'])
+    assert result.exit_code == 0
+    assert 'HeroNameAndFriends: depth=3 nodes=22 cost=2' in result.output
+
+    result = runner.invoke(cli, ['check', '--max-depth', '2', 'testmod/queries.gql'])
+    assert result.exit_code == 1
+    assert 'exceeds the maximum depth' in result.output
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import graphql
+import pytest
+
+import gqlmod
+from gqlmod import deadlines
+from gqlmod.errors import DeadlineExceeded
+from gqlmod.helpers.httpx import HttpxProvider
+from gqlmod.providers import _mock_provider, exec_query_async, exec_query_sync
+from gqlmod_starwars.server import StandInServer
+
+QUERY = 'query($id:String!){human(id:$id){name}}'
+
+
+class SlowProvider:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = False
+
+    def query_sync(self, query, variables):
+        self.calls += 1
+        time.sleep(self.delay)
+        return graphql.ExecutionResult(data={'ok': True}, errors=None)
+
+    async def query_async(self, query, variables):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return graphql.ExecutionResult(data={'ok': True}, errors=None)
+
+
+class StarWarsHttp(HttpxProvider):
+    def __init__(self, endpoint, **attrs):
+        self.endpoint = endpoint
+        vars(self).update(attrs)
+
+
+def test_nesting():
+    assert deadlines.remaining() is None
+    with gqlmod.deadline(10):
+        assert 9 < deadlines.remaining() <= 10
+        with gqlmod.deadline(1):
+            assert deadlines.remaining() <= 1
+            # Inner deadlines can't extend outer ones
+            with gqlmod.deadline(5):
+                assert deadlines.remaining() <= 1
+        assert deadlines.remaining() > 9
+        assert deadlines.bound(None) <= 10
+        assert deadlines.bound(0.5) == 0.5
+    assert deadlines.remaining() is None
+    assert deadlines.bound(None) is None
+
+
+def test_expired_sync():
+    prov = SlowProvider(0)
+    with _mock_provider('slow', prov):
+        with gqlmod.deadline(0):
+            with pytest.raises(DeadlineExceeded):
+                exec_query_sync('slow', '{ok}')
+        assert exec_query_sync('slow', '{ok}') == {'ok': True}
+    assert prov.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_async():
+    prov = SlowProvider(5)
+    with _mock_provider('slow', prov):
+        start = time.monotonic()
+        with gqlmod.deadline(0.05):
+            with pytest.raises(DeadlineExceeded):
+                await exec_query_async('slow', '{ok}')
+        assert time.monotonic() - start < 1
+    assert prov.cancelled
+
+
+@pytest.mark.asyncio
+async def test_fast_enough_async():
+    prov = SlowProvider(0)
+    with _mock_provider('slow', prov):
+        with gqlmod.deadline(1):
+            assert await exec_query_async('slow', '{ok}') == {'ok': True}
+
+
+def test_httpx_timeout_shortened():
+    prov = StarWarsHttp('http://localhost/')
+    req = prov.build_request(QUERY, {'id': '1000'})
+    with gqlmod.deadline(0.5):
+        prov.apply_timeout(req, prov.session_sync)
+    assert all(0 < value <= 0.5 for value in req.extensions['timeout'].values())
+
+
+def test_httpx_deadline():
+    with StandInServer() as server:
+        server.inject(delay=0.5)
+        prov = StarWarsHttp(server.url)
+        start = time.monotonic()
+        with gqlmod.deadline(0.1):
+            with pytest.raises(DeadlineExceeded):
+                prov.query_sync(QUERY, {'id': '1000'})
+        assert time.monotonic() - start < 0.4
+        # Other timeouts are left alone
+        assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
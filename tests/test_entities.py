@@ -0,0 +1,166 @@
+import graphql
+import pytest
+
+from gqlmod import entities, settings
+from gqlmod.entities import EntityStore, add_identity_fields, get_identity_fields
+from gqlmod.helpers.types import annotate
+from gqlmod.providers import _mock_provider
+from gqlmod_starwars import StarWarsProvider
+
+SCHEMA = graphql.build_schema("""
+directive @key(fields: String!) on OBJECT
+
+type User {
+  id: ID!
+  login: String!
+  name: String
+  repos(first: Int): [Repo!]!
+}
+
+type Repo @key(fields: "owner name") {
+  owner: String!
+  name: String!
+  stars: Int!
+}
+
+type Query {
+  user(login: String!): User
+  viewer: User!
+}
+
+type Mutation {
+  rename(id: ID!, name: String!): User!
+}
+""")
+
+
+def _op(text):
+    doc = graphql.parse(text)
+    assert not graphql.validate(SCHEMA, doc)
+    annotate(doc, SCHEMA)
+    for defin in doc.definitions:
+        add_identity_fields(defin, SCHEMA)
+    return doc.definitions[0]
+
+
+def test_identity_fields():
+    assert get_identity_fields(SCHEMA.get_type('User')) == ('id',)
+    assert get_identity_fields(SCHEMA.get_type('Repo')) == ('owner', 'name')
+    assert get_identity_fields(SCHEMA.query_type) is None
+
+
+def test_injection():
+    op = _op("query { viewer { name repos { stars } } }")
+    assert graphql.print_ast(op) == (
+        "{\n  viewer {\n    name\n    repos {\n      stars\n      __typename\n      owner\n"
+        "      name\n    }\n    __typename\n    id\n  }\n}"
+    )
+
+
+def test_injection_idempotent():
+    schema = graphql.build_schema("""
+    type A { id: ID! }
+    type B { id: ID! }
+    union U = A | B
+    type Query { u: U }
+    """)
+    doc = graphql.parse("query { u { ... on A { id } } }")
+    annotate(doc, schema)
+    for _ in range(3):
+        add_identity_fields(doc.definitions[0], schema)
+    assert graphql.print_ast(doc.definitions[0]) == (
+        "{\n  u {\n    ... on A {\n      id\n    }\n    __typename\n    ... on B {\n      id\n    }\n  }\n}"
+    )
+
+
+def test_overlapping_queries():
+    store = EntityStore(SCHEMA)
+    viewer = _op("query { viewer { login name } }")
+    store.write(viewer, {}, {'viewer': {'login': 'astro', 'name': 'Astro', '__typename': 'User', 'id': 'U1'}})
+    assert store.read(viewer, {})['viewer']['name'] == 'Astro'
+
+    # Same entity, different path
+    user = _op("query($login: String!) { user(login: $login) { name } }")
+    assert store.read(user, {'login': 'astro'}) is None
+    store.write(user, {'login': 'astro'}, {'user': {'name': 'Astro', '__typename': 'User', 'id': 'U1'}})
+    assert store.read(user, {'login': 'astro'}) == {'user': {'name': 'Astro', '__typename': 'User', 'id': 'U1'}}
+
+    # Missing field
+    assert store.read(_op("query { viewer { repos { stars } } }"), {}) is None
+
+
+def test_mutation_updates():
+    store = EntityStore(SCHEMA)
+    viewer = _op("query { viewer { name } }")
+    store.write(viewer, {}, {'viewer': {'name': 'Astro', '__typename': 'User', 'id': 'U1'}})
+    rename = _op("mutation($id: ID!, $name: String!) { rename(id: $id, name: $name) { name } }")
+    variables = {'id': 'U1', 'name': 'Star'}
+    assert store.read(rename, variables) is None
+    store.write(rename, variables, {'rename': {'name': 'Star', '__typename': 'User', 'id': 'U1'}})
+    assert store.read(viewer, {})['viewer']['name'] == 'Star'
+
+
+def test_eviction():
+    store = EntityStore(SCHEMA, maxsize=4)
+    op = _op("query($login: String!) { user(login: $login) { name } }")
+    for i in range(5):
+        store.write(op, {'login': str(i)}, {'user': {'name': str(i), '__typename': 'User', 'id': str(i)}})
+    assert len(store) == 4
+    assert store.read(op, {'login': '0'}) is None
+    assert store.read(op, {'login': '4'})['user']['name'] == '4'
+
+
+class CountingProvider(StarWarsProvider):
+    def __init__(self):
+        self.count = 0
+
+    def query_sync(self, query, variables):
+        self.count += 1
+        return super().query_sync(query, variables)
+
+
+def test_generated(tmp_path, monkeypatch):
+    (tmp_path / 'cached_queries.gql').write_text("""#~starwars~
+query Hero($episode: Episode) {
+  hero(episode: $episode) {
+    name
+    friends { name }
+  }
+}
+
+query Luke {
+  human(id: "1000") {
+    name
+    ...planet
+  }
+}
+
+fragment planet on Human {
+  homePlanet
+}
+""")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(settings, 'entity_cache', True)
+    import gqlmod.enable  # noqa
+    import cached_queries_sync as q
+
+    prov = CountingProvider()
+    with _mock_provider('starwars', prov):
+        first = q.Hero(episode='EMPIRE')
+        assert first['hero']['name'] == 'Luke Skywalker'
+        assert first['hero']['__typename'] == 'Human'
+        assert q.Hero(episode='EMPIRE') == first
+        assert prov.count == 1
+
+        luke = q.Luke()
+        assert luke['human']['homePlanet'] == 'Tatooine'
+        assert prov.count == 2
+        assert q.Luke() == luke
+        assert prov.count == 2
+    entities.clear()
+
+
+@pytest.fixture(autouse=True)
+def _clear():
+    yield
+    entities.clear()
@@ -0,0 +1,32 @@
+import click.testing
+
+import gqlmod.enable  # noqa
+from gqlmod.cli import cli
+from gqlmod.importer import load_fragment_library, query_for_schema
+
+
+def test_shared_fragments():
+    import testmod.queries_shared_sync as q
+    data = q.SharedHero(episode='EMPIRE')
+    assert data['hero']['name'] == 'Luke Skywalker'
+    assert data['hero']['appearsIn'] == ['NEWHOPE', 'EMPIRE', 'JEDI']
+    assert {'name': 'Han Solo'} in data['hero']['friends']
+    assert 'fragment characterName on Character' in q.SharedHero.__doc__
+
+
+def test_library_cached():
+    import testmod.queries_shared  # noqa
+    import testmod.queries_shared_async  # noqa
+    schema = query_for_schema('starwars')
+    path = testmod.queries_shared.__file__.replace('queries_shared.gql', 'shared/characters.gql')
+    first, errors = load_fragment_library(path, 'starwars', schema)
+    assert not errors
+    assert set(first) == {'characterFields', 'characterName'}
+    again, _ = load_fragment_library(path, 'starwars', schema)
+    assert again is first
+
+
+def test_check_library():
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, ['check', 'testmod/shared/characters.gql', 'testmod/queries_shared.gql'])
+    assert result.exit_code == 0, result.output
@@ -1,3 +1,4 @@
+import io
 import graphql
 import pytest
 
@@ -58,3 +59,60 @@ def test_no_provider():
 
 def test_empty():
     import testmod.queries_empty # noqa
+
+
+def test_variants_share_document(tmp_path, monkeypatch):
+    from gqlmod import importer
+    path = tmp_path / 'shared_doc.gql'
+    path.write_text("#~starwars~\nquery Hero { hero { name } }\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    loads = []
+    real = importer.load_and_validate
+    monkeypatch.setattr(importer, 'load_and_validate', lambda path: loads.append(path) or real(path))
+
+    import shared_doc
+    import shared_doc_sync
+    import shared_doc_async
+    assert len(loads) == 1
+    assert shared_doc_sync.Hero() == {'hero': {'name': 'R2-D2'}}
+    assert callable(shared_doc.Hero) and callable(shared_doc_async.Hero)
+
+    # Reloaded when the file changes
+    path.write_text("#~starwars~\nquery Hero { hero { id } }\n")
+    importer.load_document(str(path))
+    assert len(loads) == 2
+
+
+def test_document_follows_libraries(tmp_path, monkeypatch):
+    from gqlmod import importer, settings
+    lib = tmp_path / 'lib.gql'
+    lib.write_text("#~starwars~\nfragment heroName on Character { name }\n")
+    main = tmp_path / 'main.gql'
+    main.write_text("#~starwars~\n#~import lib.gql~\nquery Hero { hero { ...heroName } }\n")
+    assert importer.load_document(str(main))[3] == []
+    first = importer.load_document(str(main))
+
+    # A broken library breaks the document
+    lib.write_text("#~starwars~\nfragment heroName on Character { spams }\n")
+    assert importer.load_document(str(main))[3] != []
+
+    # As do changes to the settings it depends on
+    lib.write_text("#~starwars~\nfragment heroName on Character { name }\n")
+    fixed = importer.load_document(str(main))
+    assert fixed[3] == [] and fixed is not first
+    monkeypatch.setattr(settings, 'lean_schemas', not settings.lean_schemas)
+    assert importer.load_document(str(main)) is not fixed
+
+
+def test_read_code_single_pass():
+    from gqlmod.importer import read_code
+
+    class Stream(io.StringIO):
+        def seek(self, *args):
+            raise AssertionError("seek() called")
+
+    provider, imports, code, has_code = read_code(Stream("#~starwars~\n#~import lib.gql~\n\nquery Q { hero { name } }\n"))
+    assert (provider, imports, has_code) == ('starwars', ['lib.gql'], True)
+    assert code.endswith("query Q { hero { name } }\n")
+    assert read_code(Stream("#~starwars~\n"))[3] is False
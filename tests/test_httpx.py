@@ -0,0 +1,289 @@
+import asyncio
+import email.utils
+import gzip
+import json
+import time
+
+import httpx
+import pytest
+
+from gqlmod import deadline
+from gqlmod.errors import DeadlineExceeded
+from gqlmod.helpers.httpx import ENCODERS, HttpxProvider, rate_limit_feedback
+from gqlmod.helpers.retry import RetryPolicy
+from gqlmod_starwars.server import StandInServer
+
+QUERY = 'query($id:String!){human(id:$id){name friends{name}}}'
+
+
+class StarWarsHttp(HttpxProvider):
+    def __init__(self, endpoint, **attrs):
+        self.endpoint = endpoint
+        vars(self).update(attrs)
+
+
+@pytest.fixture
+def server():
+    with StandInServer() as server:
+        server.compression_threshold = 0
+        yield server
+
+
+def test_small_bodies_uncompressed():
+    prov = StarWarsHttp('http://localhost/', request_encoding='gzip')
+    req = prov.build_request(QUERY, {'id': '1000'})
+    assert 'Content-Encoding' not in req.headers
+    assert 'gzip' in req.headers['Accept-Encoding']
+
+
+def test_accept_only_decodable(monkeypatch):
+    from gqlmod.helpers import httpx as helper
+    # httpx before 0.27.1 can't decode zstd
+    assert helper._version('0.27.0') < (0, 27, 1) <= helper._version('0.28.1')
+    monkeypatch.setattr(helper, '_httpx_zstd', False)
+    assert 'zstd' not in helper._accept_encoding()
+    assert helper._accept_encoding().endswith('gzip, deflate')
+
+
+def test_large_bodies_compressed():
+    prov = StarWarsHttp('http://localhost/', request_encoding='gzip', compression_threshold=100)
+    variables = {'id': '1000', 'padding': 'x' * 1000}
+    req = prov.build_request(QUERY, variables)
+    assert req.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(req.read())) == {'query': QUERY, 'variables': variables}
+
+
+def test_unknown_encoding():
+    prov = StarWarsHttp('http://localhost/', request_encoding='lzma', compression_threshold=0)
+    with pytest.raises(ValueError):
+        prov.build_request(QUERY, {})
+
+
+@pytest.mark.parametrize('encoding', sorted(ENCODERS))
+def test_round_trip(server, encoding):
+    prov = StarWarsHttp(server.url, request_encoding=encoding, compression_threshold=0)
+    result = prov.query_sync(QUERY, {'id': '1000'})
+    assert result.data['human']['name'] == 'Luke Skywalker'
+    assert server.requests[-1]['Content-Encoding'] == encoding
+
+
+@pytest.mark.asyncio
+async def test_round_trip_async(server):
+    prov = StarWarsHttp(server.url, request_encoding='gzip', compression_threshold=0)
+    result = await prov.query_async(QUERY, {'id': '1001'})
+    assert result.data['human']['name'] == 'Darth Vader'
+
+
+def test_get_only_for_queries():
+    prov = StarWarsHttp('http://localhost/graphql', use_get=True)
+    assert prov.build_request(QUERY, {'id': '1000'}).method == 'GET'
+    assert prov.build_request('mutation{spam}', {}).method == 'POST'
+    assert prov.build_request(QUERY, {'id': 'x' * 3000}).method == 'POST'
+
+
+def test_http_cache_fresh(server):
+    server.cache_control = 'max-age=60'
+    prov = StarWarsHttp(server.url, use_get=True)
+    first = prov.query_sync(QUERY, {'id': '1000'})
+    second = prov.query_sync(QUERY, {'id': '1000'})
+    assert second.data == first.data
+    assert len(server.requests) == 1
+    # Callers get their own copies
+    first.data['human']['name'] = second.data['human']['friends'][0]['name'] = 'MUTATED'
+    third = prov.query_sync(QUERY, {'id': '1000'})
+    assert third.data['human']['name'] == 'Luke Skywalker'
+    assert third.data['human']['friends'][0]['name'] != 'MUTATED'
+    prov.query_sync(QUERY, {'id': '1001'})
+    assert len(server.requests) == 2
+
+
+def test_http_cache_revalidate(server):
+    prov = StarWarsHttp(server.url, use_get=True)
+    first = prov.query_sync(QUERY, {'id': '1000'})
+    first.data['human']['name'] = 'MUTATED'
+    second = prov.query_sync(QUERY, {'id': '1000'})
+    assert second.data['human']['name'] == 'Luke Skywalker'
+    assert server.requests[-1]['If-None-Match']
+    assert server.not_modified == 1
+
+
+def test_http_cache_no_store(server):
+    server.cache_control = 'no-store'
+    prov = StarWarsHttp(server.url, use_get=True)
+    prov.query_sync(QUERY, {'id': '1000'})
+    prov.query_sync(QUERY, {'id': '1000'})
+    assert server.not_modified == 0
+    assert len(prov.http_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_http_cache_async(server):
+    prov = StarWarsHttp(server.url, use_get=True)
+    first = await prov.query_async(QUERY, {'id': '1000'})
+    second = await prov.query_async(QUERY, {'id': '1000'})
+    assert second.data == first.data and second.data is not first.data
+    assert server.not_modified == 1
+
+
+def test_retry_server_errors(server):
+    server.inject(status=503, count=2)
+    prov = StarWarsHttp(server.url, retry_policy=RetryPolicy(3, backoff=0.01))
+    assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
+    assert len(server.requests) == 3
+
+
+def test_no_retry_mutations(server):
+    server.inject(status=503)
+    prov = StarWarsHttp(server.url, retry_policy=RetryPolicy(3, backoff=0.01))
+    with pytest.raises(ValueError):
+        # The error page isn't JSON
+        prov.query_sync('mutation{spam}', {})
+    assert len(server.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_dropped_async(server):
+    server.inject(drop=True)
+    prov = StarWarsHttp(server.url, retry_policy=RetryPolicy(2, backoff=0.01))
+    assert (await prov.query_async(QUERY, {'id': '1000'})).data['human']['name'] == 'Luke Skywalker'
+    assert len(server.requests) == 2
+
+
+def test_hedging(server):
+    server.inject(delay=2)
+    prov = StarWarsHttp(server.url, hedge_after=0.05)
+    start = time.monotonic()
+    assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
+    assert time.monotonic() - start < 1
+    assert len(server.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_hedging_async(server):
+    server.inject(delay=2)
+    prov = StarWarsHttp(server.url, hedge_after=0.05)
+    start = time.monotonic()
+    assert (await prov.query_async(QUERY, {'id': '1000'})).data['human']['name'] == 'Luke Skywalker'
+    assert time.monotonic() - start < 1
+    assert len(server.requests) == 2
+
+
+@pytest.fixture
+def servers():
+    with StandInServer() as one, StandInServer() as two, StandInServer() as three:
+        yield [one, two, three]
+
+
+def test_balancing(servers):
+    prov = StarWarsHttp([server.url for server in servers])
+    for _ in range(6):
+        assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
+    assert [len(server.requests) for server in servers] == [2, 2, 2]
+    # One connection pool per endpoint
+    assert len(prov._endpoint_sessions_sync) == 3
+
+
+def test_balancing_ejects(servers):
+    bad = servers[1]
+    bad.inject(status=503, count=100)
+    prov = StarWarsHttp(
+        [server.url for server in servers], eject_after=2, eject_time=0.5,
+        retry_policy=RetryPolicy(3, backoff=0.01),
+    )
+    for _ in range(12):
+        assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
+    assert len(bad.requests) == 2
+    assert [ep['ejected'] for ep in prov.balancer.stats()] == [False, True, False]
+
+    # Readmitted after a while, and kept once it answers
+    with bad.lock:
+        bad.faults.clear()
+    time.sleep(0.55)
+    for _ in range(6):
+        prov.query_sync(QUERY, {'id': '1000'})
+    assert len(bad.requests) > 2
+    assert not any(ep['ejected'] for ep in prov.balancer.stats())
+
+
+def _bad_and_slow(servers):
+    bad, slow = servers[:2]
+    bad.inject(delay=0.15, status=503, count=10)
+    slow.inject(delay=0.3, count=10)
+    # Retrying the 503 would wait long enough to show
+    return StarWarsHttp(
+        [bad.url, slow.url], hedge_after=0.05, max_hedges=1, retry_policy=RetryPolicy(3, backoff=5, jitter=False),
+    )
+
+
+def test_hedge_skips_server_errors(servers):
+    prov = _bad_and_slow(servers)
+    start = time.monotonic()
+    assert prov.query_sync(QUERY, {'id': '1000'}).data['human']['name'] == 'Luke Skywalker'
+    assert time.monotonic() - start < 1
+    assert [len(server.requests) for server in servers[:2]] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_hedge_skips_server_errors_async(servers):
+    prov = _bad_and_slow(servers)
+    start = time.monotonic()
+    assert (await prov.query_async(QUERY, {'id': '1000'})).data['human']['name'] == 'Luke Skywalker'
+    assert time.monotonic() - start < 1
+
+
+def test_hedges_all_failed(servers):
+    for server in servers[:2]:
+        server.inject(status=503, count=10)
+    prov = StarWarsHttp(
+        [server.url for server in servers[:2]], hedge_after=0.05, max_hedges=1, retry_policy=RetryPolicy(1),
+    )
+    resp = prov.send_hedged_sync(prov.build_request(QUERY, {'id': '1000'}))
+    assert resp.status_code == 503
+    assert [len(server.requests) for server in servers[:2]] == [1, 1]
+
+
+def test_hedged_deadline_not_failure(servers):
+    for server in servers[:2]:
+        server.inject(delay=1, count=10)
+    prov = StarWarsHttp([server.url for server in servers[:2]], hedge_after=0.05, max_hedges=1, eject_after=1)
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0.2):
+            prov.query_sync(QUERY, {'id': '1000'})
+    # Let the losing hedge time out too
+    time.sleep(0.2)
+    assert [(ep['failures'], ep['ejected']) for ep in prov.balancer.stats()] == [(0, False), (0, False)]
+
+
+@pytest.mark.asyncio
+async def test_balancing_least_outstanding_async(servers):
+    slow = servers[0]
+    slow.inject(delay=0.5, count=100)
+    prov = StarWarsHttp([server.url for server in servers], balancing='least_outstanding')
+    first = asyncio.ensure_future(prov.query_async(QUERY, {'id': '1000'}))
+    await asyncio.sleep(0.1)
+    results = [await prov.query_async(QUERY, {'id': '1001'}) for _ in range(4)]
+    assert all(result.data['human']['name'] == 'Darth Vader' for result in results)
+    # The slow endpoint still had its first request in flight
+    assert len(slow.requests) == 1
+    await first
+
+
+def test_rate_limit_headers():
+    assert rate_limit_feedback(httpx.Headers({
+        'X-RateLimit-Remaining': '10', 'X-RateLimit-Limit': '60', 'X-RateLimit-Reset': '30',
+    })) == {'remaining': 10, 'limit': 60, 'reset': 30}
+    feedback = rate_limit_feedback(httpx.Headers({
+        'RateLimit-Remaining': '0', 'RateLimit-Reset': str(int(time.time()) + 60),
+        'Retry-After': email.utils.formatdate(time.time() + 120, usegmt=True),
+    }))
+    assert feedback['remaining'] == 0
+    assert 55 <= feedback['reset'] <= 60
+    assert 115 <= feedback['retry_after'] <= 120
+    assert rate_limit_feedback(httpx.Headers({'Retry-After': 'soon'})) == {}
+
+
+def test_retry_after():
+    prov = StarWarsHttp('http://localhost/', retry_policy=RetryPolicy(3, backoff=0.01, jitter=False))
+    resp = httpx.Response(429, headers={'Retry-After': '2'})
+    assert prov.retry_delay(0, resp) == 2
+    assert prov.retry_delay(0, httpx.Response(503)) < 1
@@ -0,0 +1,119 @@
+import click.testing
+import graphql
+
+from gqlmod.cli import cli
+from gqlmod.impact import ImpactIndex, operation_coordinates, schema_changes
+from gqlmod.providers import query_for_schema
+
+
+LIBRARY = """#~starwars~
+fragment heroName on Character { name }
+"""
+
+QUERIES = """#~starwars~
+#~import lib.gql~
+
+query HeroName($ep: Episode) {
+  hero(episode: $ep) { ...heroName }
+}
+
+query EmpireBackstory {
+  hero(episode: EMPIRE) { secretBackstory }
+}
+
+query Droid {
+  droid(id: "2001") { primaryFunction }
+}
+"""
+
+
+def old_sdl():
+    return graphql.print_schema(query_for_schema('starwars'))
+
+
+def make_tree(tmp_path, new_sdl):
+    (tmp_path / 'lib.gql').write_text(LIBRARY)
+    (tmp_path / 'queries.gql').write_text(QUERIES)
+    (tmp_path / 'old.graphql').write_text(old_sdl())
+    (tmp_path / 'new.graphql').write_text(new_sdl)
+
+
+def test_coordinates():
+    schema = query_for_schema('starwars')
+    gast = graphql.parse(QUERIES + LIBRARY.replace('#~starwars~', ''))
+    fragments = {'heroName': gast.definitions[-1]}
+    coords = operation_coordinates(schema, gast.definitions[0], fragments)
+    assert coords == {
+        'Episode', 'Query.hero', 'Query.hero(episode:)', 'Character', 'Character.name', 'String',
+    }
+    coords = operation_coordinates(schema, gast.definitions[1], fragments)
+    assert 'Episode.EMPIRE' in coords
+    assert 'Character.secretBackstory' in coords
+
+
+def test_schema_changes():
+    old = query_for_schema('starwars')
+    assert schema_changes(old, old) == set()
+
+    new = graphql.build_schema(
+        old_sdl()
+        .replace('secretBackstory', 'backstory')
+        .replace('  JEDI\n', '  JEDI\n  ROGUEONE\n')
+        .replace('droid(', 'droid(\n    version: Int!\n', 1)
+    )
+    changes = schema_changes(old, new)
+    assert 'Human.secretBackstory' in changes
+    assert 'Episode.ROGUEONE' in changes
+    assert 'Query.droid(version:)' in changes
+    # The new argument is required
+    assert 'Query.droid' in changes
+    assert 'Character.name' not in changes
+
+
+def test_index_incremental(tmp_path):
+    make_tree(tmp_path, old_sdl())
+    schema = query_for_schema('starwars')
+    path = str(tmp_path / 'queries.gql')
+    index = ImpactIndex(str(tmp_path / 'index.json'))
+    assert index.update([path], schema) == (1, [])
+    index.save()
+
+    index = ImpactIndex(str(tmp_path / 'index.json'))
+    assert index.update([path], schema) == (0, [])
+    names = [op['name'] for _, op, _ in index.affected({'Character.name'})]
+    assert names == ['HeroName']
+
+    # Changing an imported library makes the importer stale
+    (tmp_path / 'lib.gql').write_text(LIBRARY.replace('name', 'id'))
+    assert index.update([path], schema) == (1, [])
+    assert [op['name'] for _, op, _ in index.affected({'Character.id'})] == ['HeroName']
+    # The library's old fields are no longer indexed for it
+    assert [op['name'] for _, op, _ in index.affected({'Character.name'})] == []
+    assert set(index.coordinates['Query.hero']) == {path}
+
+    # Files that are gone are forgotten
+    index.update([], schema)
+    assert index.files == {} and index.coordinates == {}
+
+
+def test_cli_schema_diff(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_tree(tmp_path, old_sdl().replace('secretBackstory', 'backstory'))
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, [
+        'check', 'queries.gql', 'lib.gql', '--schema-diff', 'old.graphql', 'new.graphql',
+    ])
+    assert result.exit_code == 1, result.output
+    lines = result.stdout.splitlines()
+    assert lines[0] == 'queries.gql:8:1:EmpireBackstory: uses Character.secretBackstory'
+    assert 'Cannot query field \'secretBackstory\'' in lines[1]
+    assert 'HeroName' not in result.stdout
+    assert '1 affected operation(s), 2 file(s) indexed' in result.stderr
+
+    # No changes, nothing to check
+    result = runner.invoke(cli, [
+        'check', 'queries.gql', 'lib.gql', '--schema-diff', 'old.graphql', 'old.graphql',
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.stdout == ''
+    assert '0 affected operation(s), 0 file(s) indexed' in result.stderr
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import graphql
+import pytest
+
+from gqlmod import limits
+from gqlmod.errors import CircuitOpenError, ConcurrencyLimitError, RateLimitError
+from gqlmod.limits import AdaptiveLimiter, CircuitBreaker, RateLimiter
+from gqlmod.providers import _mock_provider, exec_query_async, exec_query_sync
+
+
+class SlowProvider:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = self.peak = 0
+        self.fail = False
+        self.lock = threading.Lock()
+
+    def _enter(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self.lock:
+            self.active -= 1
+        if self.fail:
+            raise ConnectionError("upstream is down")
+        return graphql.ExecutionResult(data={'ok': True}, errors=None)
+
+    def query_sync(self, query, variables):
+        self._enter()
+        time.sleep(self.delay)
+        return self._exit()
+
+    async def query_async(self, query, variables):
+        self._enter()
+        await asyncio.sleep(self.delay)
+        return self._exit()
+
+
+@pytest.fixture
+def slow():
+    prov = SlowProvider()
+    with _mock_provider('slow', prov):
+        yield prov
+    limits.limit_provider('slow')
+
+
+def test_limit_sync(slow):
+    limits.limit_provider('slow', limiter=AdaptiveLimiter(3, max_limit=3))
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(exec_query_sync, 'slow', '{ok}'))
+        for _ in range(10)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert slow.peak == 3
+    assert limits.stats()['slow']['inflight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_async(slow):
+    limits.limit_provider('slow', limiter=AdaptiveLimiter(2, max_limit=2))
+    await asyncio.gather(*(exec_query_async('slow', '{ok}') for _ in range(8)))
+    assert slow.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout(slow):
+    slow.delay = 0.2
+    limits.limit_provider('slow', limiter=AdaptiveLimiter(1, max_limit=1, queue_timeout=0.05))
+    results = await asyncio.gather(
+        exec_query_async('slow', '{ok}'), exec_query_async('slow', '{ok}'),
+        return_exceptions=True,
+    )
+    assert isinstance(results[1], ConcurrencyLimitError)
+    assert limits.stats()['slow']['rejected'] == 1
+
+
+def test_adapts_to_latency():
+    limiter = AdaptiveLimiter(10)
+    for _ in range(20):
+        limiter.acquire_sync()
+        limiter.release(0.01, True)
+    # Not enough concurrency to grow
+    assert limiter.limit == 10
+    limiter.acquire_sync()
+    limiter.release(0.5, True)
+    assert limiter.limit == 9
+    limiter.acquire_sync()
+    limiter.release(0.01, False)
+    assert limiter.limit == pytest.approx(8.1)
+
+
+def test_circuit_breaker(slow):
+    slow.delay = 0
+    slow.fail = True
+    limits.limit_provider('slow', breaker=CircuitBreaker(window=4, min_calls=4, reset_timeout=0.1))
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            exec_query_sync('slow', '{ok}')
+    with pytest.raises(CircuitOpenError):
+        exec_query_sync('slow', '{ok}')
+    assert limits.stats()['slow']['state'] == 'open'
+
+    time.sleep(0.1)
+    slow.fail = False
+    assert exec_query_sync('slow', '{ok}') == {'ok': True}
+    assert limits.stats()['slow']['state'] == 'closed'
+
+
+class CostProvider:
+    def __init__(self):
+        self.sent = []
+        self.extensions = None
+        self.headers = None
+
+    def query_sync(self, query, variables):
+        self.sent.append(time.monotonic())
+        if self.headers:
+            limits.report_rate_limit(**self.headers)
+        return graphql.ExecutionResult(data={'ok': True}, errors=None, extensions=self.extensions)
+
+    async def query_async(self, query, variables):
+        return self.query_sync(query, variables)
+
+
+@pytest.fixture
+def costly():
+    prov = CostProvider()
+    with _mock_provider('costly', prov):
+        yield prov
+    limits.limit_provider('costly')
+
+
+def test_rate_sync(costly):
+    limits.limit_provider('costly', rate_limiter=RateLimiter(20, burst=2))
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(exec_query_sync, 'costly', '{ok}'))
+        for _ in range(6)
+    ]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Two from the burst, then one every 50ms
+    assert time.monotonic() - start >= 0.19
+    gaps = [later - earlier for earlier, later in zip(costly.sent[1:], costly.sent[2:])]
+    assert min(gaps) >= 0.04
+    stats = limits.stats()['costly']
+    assert stats['rate_waited'] == 4
+    assert stats['rate_queued'] == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_async(costly):
+    limits.limit_provider('costly', rate_limiter=RateLimiter(20, burst=1, cost=lambda query, variables: 1))
+    start = time.monotonic()
+    await asyncio.gather(*(exec_query_async('costly', '{ok}') for _ in range(4)))
+    assert time.monotonic() - start >= 0.14
+
+
+@pytest.mark.asyncio
+async def test_rate_timeout(costly):
+    limits.limit_provider('costly', rate_limiter=RateLimiter(1, burst=1, queue_timeout=0.05))
+    results = await asyncio.gather(
+        exec_query_async('costly', '{ok}'), exec_query_async('costly', '{ok}'),
+        return_exceptions=True,
+    )
+    assert results[0] == {'ok': True}
+    assert isinstance(results[1], RateLimitError)
+    assert limits.stats()['costly']['rate_limited'] == 1
+
+
+def test_rate_cost_feedback(costly):
+    limiter = RateLimiter(10, burst=100, cost=10)
+    limits.limit_provider('costly', rate_limiter=limiter)
+    costly.extensions = {'cost': {'requestedQueryCost': 30, 'actualQueryCost': 4}}
+    exec_query_sync('costly', '{ok}')
+    # Charged the actual cost, not the estimate
+    assert limiter.stats()['tokens'] == pytest.approx(96, abs=0.1)
+    # And the requested cost the next time
+    assert limiter.cost_of('{ok}', {}) == 30
+    assert limiter.cost_of('{other}', {}) == 10
+
+    costly.extensions = {'cost': {'throttleStatus': {
+        'maximumAvailable': 50, 'currentlyAvailable': 20, 'restoreRate': 5,
+    }}}
+    exec_query_sync('costly', '{ok}')
+    stats = limiter.stats()
+    assert (stats['burst'], stats['rate']) == (50, 5)
+    assert stats['tokens'] == pytest.approx(20, abs=0.1)
+
+
+def test_rate_headers(costly):
+    limiter = RateLimiter(100, burst=100)
+    limits.limit_provider('costly', rate_limiter=limiter)
+    costly.headers = {'remaining': 0, 'limit': 60, 'reset': 0.1}
+    exec_query_sync('costly', '{ok}')
+    assert limiter.stats()['burst'] == 60
+    costly.headers = None
+    exec_query_sync('costly', '{ok}')
+    # Waited for the reset
+    assert costly.sent[1] - costly.sent[0] >= 0.09
+
+    limiter.report(retry_after=0.1)
+    start = time.monotonic()
+    limiter.cancel(limiter.acquire_sync('{ok}', {}))
+    assert time.monotonic() - start >= 0.09
+    # Outside of queries, reports go nowhere
+    limits.report_rate_limit(retry_after=10)
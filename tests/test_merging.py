@@ -0,0 +1,120 @@
+import graphql
+import pytest
+
+import gqlmod.enable  # noqa
+from gqlmod import merging
+from gqlmod.merging import call, merge, run_async, run_sync
+from gqlmod.providers import _mock_provider, query_for_schema
+
+
+class CountingProvider:
+    def __init__(self, inner):
+        self.inner = inner
+        self.queries = []
+
+    def query_sync(self, query, variables):
+        self.queries.append((query, variables))
+        return self.inner.query_sync(query, variables)
+
+    async def query_async(self, query, variables):
+        self.queries.append((query, variables))
+        return await self.inner.query_async(query, variables)
+
+
+@pytest.fixture
+def counting():
+    from gqlmod_starwars import StarWarsProvider
+    # Don't count the introspection query
+    query_for_schema('starwars')
+    prov = CountingProvider(StarWarsProvider())
+    with _mock_provider('starwars', prov):
+        yield prov
+
+
+def test_merge_sync(counting):
+    import testmod.queries_sync as q
+    import testmod.queries_fragments_sync as qf
+    results = run_sync(
+        call(q.HeroForEpisode, ep='EMPIRE'),
+        call(qf.HeroWithFriends, episode='JEDI'),
+        call(q.HeroNameAndFriends, episode='NEWHOPE'),
+        call(qf.HeroComparison),
+    )
+    assert len(counting.queries) == 1
+    assert results == [
+        q.HeroForEpisode(ep='EMPIRE'),
+        qf.HeroWithFriends(episode='JEDI'),
+        q.HeroNameAndFriends(episode='NEWHOPE'),
+        qf.HeroComparison(),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_merge_async(counting):
+    import testmod.queries_async as q
+    first, second = await run_async(
+        call(q.HeroForEpisode, ep='EMPIRE'),
+        call(q.HeroForEpisode, ep='JEDI'),
+    )
+    assert len(counting.queries) == 1
+    assert first == await q.HeroForEpisode(ep='EMPIRE')
+    assert second == await q.HeroForEpisode(ep='JEDI')
+
+
+def test_renamed(counting):
+    import testmod.queries_fragments_sync as qf
+    run_sync(call(qf.HeroWithFriends, episode='JEDI'), call(qf.HeroWithFriends, episode='EMPIRE'))
+    query, variables = counting.queries[0]
+    assert variables == {'op0_episode': 'JEDI', 'op1_episode': 'EMPIRE'}
+    doc = graphql.parse(query)
+    assert [defin.name.value for defin in doc.definitions] == ['HeroWithFriends_HeroWithFriends', 'op0_nameOnly', 'op1_nameOnly']
+    aliases = [sel.alias.value for sel in doc.definitions[0].selection_set.selections]
+    assert aliases == ['op0_hero', 'op1_hero']
+
+
+def test_cached(counting):
+    import testmod.queries_sync as q
+    import testmod.queries_async as qa
+    first = merge([q.HeroForEpisode.__graphql__, q.HeroNameAndFriends.__graphql__])
+    # The variants share definitions
+    again = merge([qa.HeroForEpisode.__graphql__, qa.HeroNameAndFriends.__graphql__])
+    assert again is first
+    assert merge([q.HeroNameAndFriends.__graphql__, q.HeroForEpisode.__graphql__]) is not first
+
+
+def test_split_errors():
+    import testmod.queries_sync as q
+    merged = merge([q.HeroForEpisode.__graphql__, q.HeroNameAndFriends.__graphql__])
+    result = graphql.ExecutionResult(
+        data={'op0_hero': None, 'op1_hero': {'name': 'R2-D2', 'friends': []}},
+        errors=[{'message': 'Boom', 'path': ['op0_hero']}],
+    )
+    with pytest.raises(graphql.GraphQLError):
+        merged.split(result)
+    error, data = merged.split(result, return_exceptions=True)
+    assert error.path == ['hero']
+    assert data == {'hero': {'name': 'R2-D2', 'friends': []}}
+
+
+def test_missing_variables(counting):
+    import testmod.queries_sync as q
+    with pytest.raises(TypeError, match="HeroForEpisode\\(\\) missing required variables: 'ep'"):
+        call(q.HeroForEpisode)
+    # Variables with defaults, and nullable ones, can be left out
+    call(q.HeroNameAndFriends)
+    with pytest.raises(TypeError, match="'withFriends'"):
+        call(q.Hero, episode='JEDI')
+    assert counting.queries == []
+
+
+def test_not_generated():
+    with pytest.raises(TypeError):
+        call(print)
+
+
+def test_cache_size(monkeypatch):
+    import testmod.queries_sync as q
+    monkeypatch.setattr(merging, 'CACHE_SIZE', 1)
+    merge([q.HeroForEpisode.__graphql__])
+    merge([q.HeroNameAndFriends.__graphql__])
+    assert len(merging._merged) == 1
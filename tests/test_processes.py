@@ -0,0 +1,87 @@
+import asyncio
+import multiprocessing
+
+import graphql
+import pytest
+
+from gqlmod import deadline
+from gqlmod.errors import DeadlineExceeded
+from gqlmod.helpers.processes import ProcessPoolProvider, pack_result, unpack_result
+from gqlmod_starwars import StarWarsProvider
+
+CHEAP = 'query Hero { hero { name } }'
+COSTLY = 'query Friends($id: String!) { human(id: $id) { name friends { name friends { name } } } }'
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with ProcessPoolProvider(StarWarsProvider, workers=2, threshold=100,
+                             mp_context=multiprocessing.get_context('spawn')) as prov:
+        yield prov
+
+
+def test_pack_result():
+    result = graphql.ExecutionResult(
+        data={'hero': {'name': 'R2-D2', 'height': 0.96}},
+        errors=[graphql.GraphQLError('spam', path=['hero'])],
+        extensions={'cost': {'actualQueryCost': 2}},
+    )
+    blob = pack_result(result)
+    assert blob[:1] == b'M'
+    rv = unpack_result(blob)
+    assert rv.data == result.data
+    assert rv.errors[0].message == 'spam'
+    assert rv.errors[0].path == ['hero']
+    assert rv.extensions == result.extensions
+    # Not everything can be marshalled
+    assert unpack_result(pack_result({'data': {'when': range(3)}})).data == {'when': range(3)}
+
+
+def test_threshold(pool):
+    assert pool.is_cheap(CHEAP)
+    assert not pool.is_cheap(COSTLY)
+    # Introspection can't be estimated
+    assert pool.is_cheap(graphql.get_introspection_query())
+    assert pool.is_cheap('{ hero { name } }')
+
+
+class Opaque:
+    def query_sync(self, query, variables):
+        return StarWarsProvider().query_sync(query, variables)
+
+
+class SdlStarWars(Opaque):
+    def get_schema_str(self):
+        return graphql.print_schema(StarWarsProvider().get_executable_schema())
+
+
+def test_estimate_schema():
+    with ProcessPoolProvider(SdlStarWars, threshold=100) as prov:
+        assert prov.is_cheap(CHEAP)
+        assert not prov.is_cheap(COSTLY)
+    # Nothing to estimate with
+    with ProcessPoolProvider(Opaque) as prov:
+        assert not prov.is_cheap(CHEAP)
+
+
+def test_query_sync(pool):
+    local = StarWarsProvider()
+    before = pool.local_calls, pool.pooled_calls
+    assert pool.query_sync(CHEAP, {}).data == local.query_sync(CHEAP, {}).data
+    assert pool.query_sync(COSTLY, {'id': '1000'}).data == local.query_sync(COSTLY, {'id': '1000'}).data
+    assert (pool.local_calls, pool.pooled_calls) == (before[0] + 1, before[1] + 1)
+    # Passed through to the local provider
+    assert pool.get_executable_schema() is local.get_executable_schema()
+
+
+@pytest.mark.asyncio
+async def test_query_async(pool):
+    results = await asyncio.gather(*(pool.query_async(COSTLY, {'id': id}) for id in ['1000', '1001', '1002']))
+    assert [rv.data['human']['name'] for rv in results] == ['Luke Skywalker', 'Darth Vader', 'Han Solo']
+
+
+def test_deadline(pool):
+    pool.query_sync(COSTLY, {'id': '1000'})
+    with pytest.raises(DeadlineExceeded):
+        with deadline(0):
+            pool.query_sync(COSTLY, {'id': '1000'})
@@ -0,0 +1,60 @@
+import json
+
+import click.testing
+
+from gqlmod import profiling
+from gqlmod.cli import cli
+
+QUERIES = """#~starwars~
+query Hero { hero { name } }
+"""
+
+
+def test_profile(tmp_path, monkeypatch):
+    (tmp_path / 'profiled_queries.gql').write_text(QUERIES)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import gqlmod.enable  # noqa
+
+    with profiling.profile() as prof:
+        import profiled_queries  # noqa
+        import profiled_queries_async  # noqa
+    assert profiling._active is None
+
+    totals = prof.totals()
+    assert set(totals) == {'profiled_queries', 'profiled_queries_async'}
+    # The variants share the loaded document
+    assert totals['profiled_queries']['parse'] > 0
+    assert totals['profiled_queries_async']['parse'] == 0
+    assert totals['profiled_queries_async']['codegen'] > 0
+    assert prof.sizes['profiled_queries'] == {'chars': len(QUERIES), 'definitions': 1}
+
+    lines = prof.table().splitlines()
+    assert lines[0].split() == ['module', 'total', *profiling.PHASES, 'chars']
+    assert len(lines) == 3
+
+    events = prof.chrome_trace()['traceEvents']
+    assert {event['name'] for event in events} <= set(profiling.PHASES)
+    assert all(event['ph'] == 'X' for event in events)
+
+    path = tmp_path / 'trace.json'
+    profiling.write_report(prof, str(path))
+    assert json.loads(path.read_text()) == json.loads(json.dumps(prof.chrome_trace()))
+
+
+def test_not_profiling():
+    assert profiling.span('parse') is profiling.span('exec')
+
+
+def test_cli(tmp_path, monkeypatch):
+    (tmp_path / 'cli_profiled.gql').write_text(QUERIES)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    runner = click.testing.CliRunner()
+    result = runner.invoke(cli, ['profile-imports', '--format', 'json', 'cli_profiled_sync'])
+    assert result.exit_code == 0, result.output
+    [row] = json.loads(result.output)
+    assert row['module'] == 'cli_profiled_sync'
+    assert set(row['phases']) == set(profiling.PHASES)
+
+    result = runner.invoke(cli, ['profile-imports', 'no_such_module'])
+    assert result.exit_code == 2
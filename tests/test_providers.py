@@ -1,4 +1,10 @@
-from gqlmod.providers import get_provider, with_provider
+import contextlib
+import time
+
+import pytest
+
+from gqlmod.importer import find_providers
+from gqlmod.providers import _mock_provider, get_provider, prefetch_schemas, query_for_schema, with_provider
 
 
 def test_provider_change():
@@ -9,3 +15,44 @@ def test_provider_change():
 
     old = get_provider('starwars')
     assert old is orig
+
+
+class SlowProvider:
+    def __init__(self, fail=False):
+        self.fetches = 0
+        self.fail = fail
+
+    def get_schema_str(self):
+        self.fetches += 1
+        time.sleep(0.2)
+        if self.fail and self.fetches == 1:
+            raise ConnectionError
+        return "type Query { hello: String }"
+
+
+def test_prefetch():
+    provs = {f'prefetch-{n}': SlowProvider() for n in range(4)}
+    with contextlib.ExitStack() as stack:
+        for name, prov in provs.items():
+            stack.enter_context(_mock_provider(name, prov))
+        start = time.perf_counter()
+        prefetch_schemas(provs)
+        prefetch_schemas(provs)
+        schemas = [query_for_schema(name) for name in provs]
+        assert time.perf_counter() - start < 0.6
+    assert all(schema.get_type('Query') for schema in schemas)
+    assert [prov.fetches for prov in provs.values()] == [1, 1, 1, 1]
+
+
+def test_prefetch_failed():
+    prov = SlowProvider(fail=True)
+    with _mock_provider('prefetch-failed', prov):
+        prefetch_schemas(['prefetch-failed'])
+        assert query_for_schema('prefetch-failed').get_type('Query')
+    assert prov.fetches == 2
+
+
+def test_find_providers():
+    assert find_providers(['testmod']) == {'starwars'}
+    with pytest.raises(ModuleNotFoundError):
+        find_providers(['no_such_package'])
@@ -0,0 +1,133 @@
+import graphql
+import pytest
+
+from gqlmod import pruning, settings
+from gqlmod.cost import estimate_cost
+from gqlmod.importer import load_and_validate
+from gqlmod.providers import LEAN_INTROSPECTION_QUERY, _mock_provider, insert_builtins, query_for_schema
+
+SDL = """
+directive @listSize(assumedSize: Int) on FIELD_DEFINITION
+
+"The root"
+type Query {
+  node(id: ID!): Node
+  search(filter: Filter): [Result!]! @listSize(assumedSize: 5)
+  unused: Unused
+}
+
+input Filter { text: String, and: [Filter!], kind: Kind }
+
+enum Kind { USER REPO }
+
+interface Node { id: ID! }
+
+type User implements Node { id: ID! name: String repos: [Repo!]! }
+
+type Repo implements Node { id: ID! stars: Int owner: User }
+
+union Result = User | Repo
+
+type Unused { field: String }
+"""
+
+QUERIES = """#~pruning-test~
+query Search($filter: Filter) {
+  search(filter: $filter) {
+    __typename
+    ... on User { name }
+  }
+}
+
+query Node($id: ID!) {
+  node(id: $id) { id }
+}
+"""
+
+
+class SdlProvider:
+    def __init__(self, sdl=SDL):
+        self.sdl = sdl
+
+    def get_schema_str(self):
+        return self.sdl
+
+    def query_sync(self, query, variables):
+        return graphql.ExecutionResult(data={'search': [{'__typename': 'User', 'name': 'Astro'}]}, errors=None)
+
+
+def test_prune():
+    schema = insert_builtins(graphql.build_schema(SDL))
+    doc = graphql.parse(QUERIES)
+    pruned = pruning.prune_schema(schema, doc.definitions)
+    assert graphql.validate_schema(pruned) == []
+    assert graphql.validate(pruned, doc) == []
+    assert pruned.get_type('Unused') is None
+    # Possible types of selected abstract types are kept
+    assert {ptype.name for ptype in pruned.get_possible_types(pruned.get_type('Node'))} == {'User', 'Repo'}
+    assert set(pruned.get_type('Repo').fields) == {'id'}
+    # As are the input types of arguments
+    assert pruned.get_type('Kind').values.keys() == {'USER', 'REPO'}
+    # And the directives cost estimates use
+    search = doc.definitions[0]
+    assert estimate_cost(search, pruned) == estimate_cost(search, schema)
+    assert pruning.schema_size(pruned) < pruning.schema_size(schema)
+
+
+def test_prune_starwars():
+    schema = query_for_schema('starwars')
+    _, gast, _, errors = load_and_validate('testmod/queries_fragments.gql')
+    assert not errors
+    pruned = pruning.prune_schema(schema, gast.definitions)
+    assert graphql.validate_schema(pruned) == []
+    assert graphql.validate(pruned, graphql.parse(graphql.print_ast(gast))) == []
+
+
+def test_import(tmp_path, monkeypatch):
+    (tmp_path / 'pruned_queries.gql').write_text(QUERIES)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(settings, 'prune_schemas', True)
+    import gqlmod.enable  # noqa
+    with _mock_provider('pruning-test', SdlProvider()):
+        import pruned_queries
+        assert pruned_queries.Search(filter={'kind': 'USER'}) == {'search': [{'__typename': 'User', 'name': 'Astro'}]}
+        schema = pruned_queries.Search.__graphql__.schema
+        assert schema is not query_for_schema('pruning-test')
+        assert schema.get_type('Unused') is None
+
+        [row] = [row for row in pruning.memory_report() if row['provider'] == 'pruning-test']
+        assert row['modules'] == 1
+        assert row['pruned'] < row['full']
+
+
+def test_shared_lean(monkeypatch):
+    monkeypatch.setattr(settings, 'lean_schemas', True)
+    with _mock_provider('lean-a', SdlProvider()), _mock_provider('lean-b', SdlProvider()):
+        schema = query_for_schema('lean-a')
+        assert query_for_schema('lean-b') is schema
+    assert schema.query_type.description is None
+    assert schema.query_type.ast_node.loc is None
+
+
+def test_lean_query():
+    assert 'deprecationReason' not in LEAN_INTROSPECTION_QUERY
+    assert 'description' not in LEAN_INTROSPECTION_QUERY
+    schema = query_for_schema('starwars')
+    data = graphql.graphql_sync(schema, LEAN_INTROSPECTION_QUERY).data
+    lean = graphql.build_client_schema(data)
+    assert set(lean.type_map) == set(schema.type_map)
+
+
+@pytest.fixture
+def restore_schemas():
+    from gqlmod import importer, providers
+    schemas, fragments = dict(providers._schemas), dict(importer._fragment_cache)
+    yield
+    providers._schemas.update(schemas)
+    importer._fragment_cache.update(fragments)
+
+
+def test_release(restore_schemas):
+    query_for_schema('starwars')
+    pruning.release_schemas()
+    assert all(row['full'] is None for row in pruning.memory_report())
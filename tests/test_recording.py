@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+import gqlmod.enable  # noqa
+from gqlmod.helpers.recording import CassetteMiss, RecordingProvider, ReplayProvider
+from gqlmod.providers import _mock_provider
+from gqlmod_starwars import StarWarsProvider
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    path = tmp_path / 'starwars.cassette'
+    with RecordingProvider(StarWarsProvider(), path) as prov:
+        with _mock_provider('starwars', prov):
+            import testmod.queries_sync as q
+            q.HeroForEpisode(ep='EMPIRE')
+            q.HeroForEpisode(ep='NEWHOPE')
+    return path
+
+
+def test_replay(cassette):
+    import testmod.queries_sync as q
+    prov = ReplayProvider(cassette, latency=None)
+    with _mock_provider('starwars', prov):
+        assert q.HeroForEpisode(ep='EMPIRE')['hero']['name'] == 'Luke Skywalker'
+        assert q.HeroForEpisode(ep='NEWHOPE')['hero']['name'] == 'R2-D2'
+        with pytest.raises(CassetteMiss):
+            q.HeroForEpisode(ep='JEDI')
+
+
+def test_replay_async(cassette):
+    import testmod.queries_async as q
+    with _mock_provider('starwars', ReplayProvider(cassette, latency=None)):
+        assert asyncio.run(q.HeroForEpisode(ep='EMPIRE'))['hero']['name'] == 'Luke Skywalker'
+
+
+def test_latency_models(cassette):
+    import testmod.queries_sync as q
+    with _mock_provider('starwars', ReplayProvider(cassette, latency=0.05)):
+        start = time.perf_counter()
+        q.HeroForEpisode(ep='EMPIRE')
+        assert time.perf_counter() - start >= 0.05
+
+    prov = ReplayProvider(cassette, latency='percentile', seed=1)
+    key = next(iter(prov._index))
+    assert all(prov.latency_for(key) in prov._all_latencies for _ in range(20))
+
+    prov = ReplayProvider(cassette, latency='recorded')
+    assert prov.latency_for(key) in prov._latencies[key]
+
+
+def test_append_and_truncate(cassette):
+    count = len(ReplayProvider(cassette))
+    with RecordingProvider(StarWarsProvider(), cassette) as prov:
+        prov.query_sync('{ hero { id } }', {})
+    with open(cassette, 'ab') as fobj:
+        # An interrupted write
+        fobj.write(b'\x00' * 10)
+    assert len(ReplayProvider(cassette)) == count + 1
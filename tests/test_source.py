@@ -0,0 +1,35 @@
+import gqlmod.enable  # noqa
+from gqlmod.providers import _mock_provider
+from gqlmod_starwars import StarWarsProvider
+
+
+class RecordingProvider(StarWarsProvider):
+    def __init__(self):
+        self.queries = []
+
+    def query_sync(self, query, variables):
+        self.queries.append(query)
+        return super().query_sync(query, variables)
+
+
+def test_fragments():
+    import testmod.queries_fragments_sync as q
+    data = q.HeroComparison()
+    assert data['leftComparison']['name'] == 'Luke Skywalker'
+    assert {'name': 'Han Solo'} in data['rightComparison']['friends']
+
+
+def test_wire_form():
+    import testmod.queries_fragments_sync as q
+    prov = RecordingProvider()
+    with _mock_provider('starwars', prov):
+        q.HeroWithFriends()
+    query, = prov.queries
+    assert query == 'query HeroWithFriends($episode:Episode){hero(episode:$episode){...nameOnly friends{...nameOnly}}}fragment nameOnly on Character{name}'
+
+
+def test_pretty_source():
+    import testmod.queries_fragments_sync as q
+    assert q.HeroComparison.__doc__.startswith('query HeroComparison {\n')
+    assert 'fragment comparisonFields on Character {' in q.HeroComparison.__doc__
+    assert 'comparisonFields' not in q.HeroWithFriends.__doc__
@@ -0,0 +1,53 @@
+import graphql
+
+import gqlmod
+from gqlmod.providers import get_provider
+from gqlmod_starwars import StarWarsProvider, star_wars_schema
+from gqlmod_starwars.synthetic import generate
+
+FRIENDS = """
+query($id: String!) {
+  human(id: $id) { name friends { name friends { id name } } }
+}
+"""
+
+
+def test_generate():
+    dataset = generate(500, degree=4, seed=7)
+    assert len(dataset) == 500
+    assert all(len(set(c.friends)) == 4 and c.id not in c.friends for c in dataset.characters.values())
+    assert {c.name for c in generate(500, degree=4, seed=7).characters.values()} == \
+        {c.name for c in dataset.characters.values()}
+
+
+def _run(batch):
+    dataset = generate(200, degree=5, seed=1)
+    human = next(c for c in dataset.characters.values() if c.type == 'Human')
+    prov = StarWarsProvider(dataset=dataset, batch=batch)
+    result = prov.query_sync(FRIENDS, {'id': human.id})
+    assert result.errors is None
+    return result.data, dataset.fetches
+
+
+def test_batched_friends():
+    unbatched, unbatched_fetches = _run(False)
+    batched, batched_fetches = _run(True)
+    assert batched == unbatched
+    # human + 5 friends + 25 friends of friends
+    assert unbatched_fetches == 1 + 5 + 25
+    # human, then a fetch per level
+    assert batched_fetches == 3
+
+
+def test_without_context():
+    # Like the stand-in server does
+    result = graphql.graphql_sync(star_wars_schema, '{ hero(episode: EMPIRE) { name friends { name } } }')
+    assert result.data['hero']['name'] == 'Luke Skywalker'
+    assert len(result.data['hero']['friends']) == 4
+
+
+def test_provider_options():
+    with gqlmod.with_provider('starwars', size=50, degree=3, batch=True):
+        prov = get_provider('starwars')
+        assert len(prov.dataset) == 50
+        assert prov.batch
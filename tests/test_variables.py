@@ -0,0 +1,54 @@
+import graphql
+import pytest
+
+import gqlmod.enable  # noqa
+from gqlmod.errors import MultiErrors
+from gqlmod.variables import build_validator
+
+SCHEMA = graphql.build_schema("""
+enum Color { RED GREEN }
+
+input Filter {
+  color: Color!
+  limit: Int = 10
+  ids: [ID!]
+  nested: Filter
+}
+
+type Query {
+  things(filter: Filter, color: Color, ratio: Float): [String]
+}
+""")
+
+
+def _validator(query):
+    gast = graphql.parse(query)
+    return build_validator(gast.definitions[0], SCHEMA)
+
+
+def test_coercion():
+    v = _validator("query Q($f: Filter!, $r: Float) { things(filter: $f, ratio: $r) }")
+    assert v({'f': {'color': 'RED', 'ids': [1, '2'], 'nested': {'color': 'GREEN'}}, 'r': 3}) == {
+        'f': {'color': 'RED', 'ids': ['1', '2'], 'nested': {'color': 'GREEN'}},
+        'r': 3.0,
+    }
+
+
+def test_nested_errors():
+    v = _validator("query Q($f: Filter!) { things(filter: $f) }")
+    with pytest.raises(MultiErrors) as exc:
+        v({'f': {'color': 'BLUE', 'nested': {'limit': 'x'}}})
+    assert len(exc.value) == 3
+
+
+def test_non_null():
+    v = _validator("query Q($f: Filter!) { things(filter: $f) }")
+    with pytest.raises(graphql.GraphQLError, match=r"\$f"):
+        v({'f': None})
+
+
+def test_generated_function():
+    import testmod.queries_sync
+    assert testmod.queries_sync.HeroForEpisode(ep='JEDI')['hero']['name'] == 'R2-D2'
+    with pytest.raises(graphql.GraphQLError, match="Episode"):
+        testmod.queries_sync.HeroForEpisode(ep='PHANTOM')
@@ -0,0 +1,94 @@
+import os
+import threading
+
+from gqlmod.watch import DocumentSet, watch
+
+
+LIBRARY = """#~starwars~
+fragment heroName on Character { name }
+"""
+
+QUERY = """#~starwars~
+#~import lib.gql~
+query Hero { hero { ...heroName } }
+"""
+
+OTHER = """#~starwars~
+query Other { hero { id } }
+"""
+
+
+def write(path, text):
+    path.write_text(text)
+    # Make sure the change shows, whatever the file system's time resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def make_tree(tmp_path):
+    write(tmp_path / 'lib.gql', LIBRARY)
+    write(tmp_path / 'query.gql', QUERY)
+    write(tmp_path / 'other.gql', OTHER)
+    return {name: str(tmp_path / f'{name}.gql') for name in ('lib', 'query', 'other')}
+
+
+def test_poll(tmp_path):
+    paths = make_tree(tmp_path)
+    docs = DocumentSet(root=tmp_path)
+    assert docs.poll() == set(paths.values())
+    assert docs.poll() == set()
+
+    write(tmp_path / 'other.gql', OTHER + "\n")
+    assert docs.poll() == {paths['other']}
+
+    os.unlink(paths['other'])
+    assert docs.poll() == {paths['other']}
+    assert docs.affected({paths['other']}) == []
+
+
+def test_affected_importers(tmp_path):
+    paths = make_tree(tmp_path)
+    docs = DocumentSet(root=tmp_path)
+    docs.poll()
+
+    write(tmp_path / 'lib.gql', LIBRARY + "\n")
+    changed = docs.poll()
+    assert changed == {paths['lib']}
+    assert docs.affected(changed) == sorted([paths['lib'], paths['query']])
+
+
+def test_imports_watched(tmp_path):
+    # Libraries are watched even when only their importers are checked
+    paths = make_tree(tmp_path)
+    docs = DocumentSet([paths['query']])
+    assert docs.poll() == {paths['query'], paths['lib']}
+
+    write(tmp_path / 'lib.gql', LIBRARY + "\n")
+    assert docs.affected(docs.poll()) == [paths['query']]
+
+
+def test_watch(tmp_path):
+    paths = make_tree(tmp_path)
+    docs = DocumentSet(root=tmp_path)
+    stop = threading.Event()
+    rounds = []
+
+    def callback(changed):
+        rounds.append(changed)
+        if len(rounds) == 1:
+            write(tmp_path / 'other.gql', OTHER + "\n")
+        else:
+            stop.set()
+
+    thread = threading.Thread(target=watch, args=(docs, callback), kwargs={'interval': 0.01, 'stop': stop})
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert rounds == [sorted(paths.values()), [paths['other']]]
+
+
+def test_check_watched_syntax_error(tmp_path, capsys):
+    from gqlmod.cli import check_watched
+    write(tmp_path / 'broken.gql', "#~starwars~\nquery {\n")
+    assert check_watched(str(tmp_path / 'broken.gql'), False, {}, {})
+    assert 'broken.gql:2:8:Syntax Error' in capsys.readouterr().out